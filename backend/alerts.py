@@ -0,0 +1,134 @@
+"""Alert lifetimes and the in-memory index of active alerts.
+
+Every alert gets an expires_at when it is created (a per-type default
+unless the reporter asks for less). MongoDB's TTL index deletes expired
+documents eventually, but reads never go to Mongo: each server process
+keeps the active alerts in a spatial grid, with a min-heap of expiry times
+driving a single timer task. Each process loads the index at startup and
+learns about new alerts from the broker. Since expires_at travels with the
+alert, every process expires it at the same moment without further
+coordination.
+"""
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from geo import GridIndex
+
+logger = logging.getLogger(__name__)
+
+ALERT_LIFETIMES = {
+    "hazard": timedelta(hours=6),
+    "elevator_out": timedelta(days=2),
+    "pothole": timedelta(days=7),
+    "construction": timedelta(days=14),
+}
+DEFAULT_ALERT_LIFETIME = timedelta(days=1)
+MAX_ALERT_LIFETIME = timedelta(days=30)
+ALERT_CELL_SIZE = 0.01  # degrees, ~1.1 km
+
+def alert_lifetime(alert_type: str) -> timedelta:
+    return ALERT_LIFETIMES.get(alert_type, DEFAULT_ALERT_LIFETIME)
+
+def default_expiry(alert_type: str, created_at: datetime, expires_in: Optional[float] = None) -> datetime:
+    """expires_at for a new alert; `expires_in` seconds overrides the type default up to MAX_ALERT_LIFETIME"""
+    lifetime = alert_lifetime(alert_type) if expires_in is None else timedelta(seconds=max(0.0, expires_in))
+    return created_at + min(lifetime, MAX_ALERT_LIFETIME)
+
+def epoch(moment: datetime) -> float:
+    """Seconds since the epoch for the naive UTC datetimes the models use"""
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+class AlertIndex:
+    """Active alerts by position, expired by a heap-driven timer"""
+
+    def __init__(self, cell_size: float = ALERT_CELL_SIZE):
+        self.grid = GridIndex(cell_size=cell_size)
+        # (expiry epoch, alert id); entries for replaced or removed alerts are skipped when popped
+        self.deadlines: List[Tuple[float, str]] = []
+        self.expiry: Dict[str, float] = {}
+        self.changed = asyncio.Event()
+        self.timer: Optional[asyncio.Task] = None
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self.expiry)
+
+    def add(self, alert: dict) -> bool:
+        """Index (or replace) an alert; False if it has already expired"""
+        deadline = epoch(alert["expires_at"])
+        if deadline <= time.time():
+            self.remove(alert["id"])
+            return False
+        self.grid.insert(alert["id"], alert["latitude"], alert["longitude"], alert)
+        self.expiry[alert["id"]] = deadline
+        heapq.heappush(self.deadlines, (deadline, alert["id"]))
+        if self.deadlines[0][1] == alert["id"]:
+            # New earliest deadline: wake the timer so it sleeps less
+            self.changed.set()
+        return True
+
+    def remove(self, alert_id: str) -> Optional[dict]:
+        entry = self.grid.get(alert_id)
+        self.grid.remove(alert_id)
+        self.expiry.pop(alert_id, None)
+        return entry[2] if entry is not None else None
+
+    def clear(self):
+        self.grid = GridIndex(cell_size=self.grid.cell_size)
+        self.deadlines.clear()
+        self.expiry.clear()
+
+    def nearby(self, latitude: float, longitude: float, radius: float) -> List[Tuple[float, str, dict]]:
+        """(distance, id, alert) for unexpired alerts within radius, nearest first, ties by id"""
+        now = time.time()
+        found = [
+            (distance, alert_id, alert)
+            for distance, alert_id, alert in self.grid.within_radius(latitude, longitude, radius)
+            if self.expiry.get(alert_id, 0.0) > now
+        ]
+        found.sort(key=lambda item: (item[0], item[1]))
+        return found
+
+    def expire_due(self, now: float) -> List[dict]:
+        """Remove and return every alert whose deadline has passed"""
+        expired = []
+        while self.deadlines and self.deadlines[0][0] <= now:
+            deadline, alert_id = heapq.heappop(self.deadlines)
+            if self.expiry.get(alert_id) != deadline:
+                continue
+            alert = self.remove(alert_id)
+            if alert is not None:
+                expired.append(alert)
+        self.expired += len(expired)
+        return expired
+
+    def next_delay(self) -> Optional[float]:
+        if not self.deadlines:
+            return None
+        return max(0.0, self.deadlines[0][0] - time.time())
+
+    async def run(self, on_expired: Callable[[dict], None]):
+        """Sleep until the earliest deadline (or an earlier alert arrives) and expire what is due"""
+        while True:
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), self.next_delay())
+            except asyncio.TimeoutError:
+                pass
+            for alert in self.expire_due(time.time()):
+                try:
+                    on_expired(alert)
+                except Exception:
+                    logger.exception("Alert expiry handler failed for %s", alert["id"])
+
+    def start(self, on_expired: Callable[[dict], None]):
+        if self.timer is None or self.timer.done():
+            self.timer = asyncio.get_running_loop().create_task(self.run(on_expired))
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.cancel()
@@ -0,0 +1,61 @@
+"""Password hashing off the event loop.
+
+bcrypt is deliberately slow (tens of milliseconds per check), so hashing and
+verification run in a small dedicated thread pool. The pool size bounds how
+much CPU logins can take, and the event loop keeps serving other requests
+while a hash is computed.
+
+Accounts created before hashing store the plain password. verify_password
+still accepts those, and reports that the stored value should be replaced
+with a hash.
+"""
+import asyncio
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+HASH_WORKERS = int(os.environ.get('AUTH_HASH_WORKERS', min(4, os.cpu_count() or 1)))
+
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 300  # seconds
+
+hash_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+
+# Checked against when the username does not exist, so both cases take as long;
+# made on first use so importing this module stays cheap
+_dummy_hash = None
+
+def is_hashed(stored: str) -> bool:
+    return stored.startswith(("$2a$", "$2b$", "$2y$"))
+
+def _rounds(stored: str) -> int:
+    return int(stored.split("$")[2])
+
+async def _run(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(hash_pool, func, *args)
+
+async def hash_password(password: str) -> str:
+    hashed = await _run(bcrypt.hashpw, password.encode(), bcrypt.gensalt(BCRYPT_ROUNDS))
+    return hashed.decode()
+
+async def verify_password(password: str, stored: str) -> Tuple[bool, bool]:
+    """(matches, stored value should be re-hashed)"""
+    if not is_hashed(stored):
+        matches = hmac.compare_digest(password.encode(), stored.encode())
+        return matches, matches
+    matches = await _run(bcrypt.checkpw, password.encode(), stored.encode())
+    return matches, matches and _rounds(stored) != BCRYPT_ROUNDS
+
+async def burn_verification(password: str):
+    """Spend the time of a real check for a username that does not exist"""
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = (await hash_password("sanchara")).encode()
+    await _run(bcrypt.checkpw, password.encode(), _dummy_hash)
+
+def shutdown():
+    hash_pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,306 @@
+"""Merging of repeated barrier reports and throttled barrier broadcasts.
+
+Several users reporting the same pothole should leave one barrier behind,
+not one per report. A new report is folded into the nearest stored barrier
+of the same type within MERGE_RADIUS meters, which gains a report_count and
+takes the severity of the latest report. Only when there is none is the
+report stored as a new barrier.
+
+Reports are snapped to a spatial hash whose cells are small enough that
+any two points in one cell are within the merge radius. Each new barrier
+stores its cell, and a unique (barrier_type, cell) index stops two workers
+from storing the same cell twice: the loser merges into the winner. Within
+a process, reports of one type are serialized by locks on the coarser
+cells (twice the radius wide) their merge circle touches, so two reports
+in reach of each other always share a lock. Reports reaching different
+workers at the same moment and landing in neighbouring cells can still
+both be stored. Running `python -m barriers` folds such
+leftovers, and barriers from bulk imports, into the oldest of each
+cluster.
+
+BroadcastThrottle sends the first broadcast for a barrier at once and
+collapses the ones that follow within BROADCAST_WINDOW seconds into a single
+trailing broadcast of the latest state.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo import DeleteMany, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from geo import METERS_PER_DEGREE_LAT, GridIndex, radius_to_degrees
+
+logger = logging.getLogger(__name__)
+
+MERGE_RADIUS = float(os.environ.get("BARRIER_MERGE_RADIUS", "8"))  # meters
+BROADCAST_WINDOW = 30.0  # seconds between broadcasts for the same barrier
+COMPACT_BATCH_SIZE = 500
+COMPACT_CELL_SIZE = 0.01  # degrees, ~1.1 km
+
+def _cell(latitude: float, longitude: float, side: float) -> Tuple[int, int]:
+    """Row and column of the square cell of `side` meters holding a point.
+
+    The column width is scaled by the latitude of the row's centre, so every
+    point in a row uses the same width.
+    """
+    height = side / METERS_PER_DEGREE_LAT
+    row = math.floor(latitude / height)
+    center = (row + 0.5) * height
+    width = height / max(0.01, math.cos(math.radians(center)))
+    return row, math.floor(longitude / width)
+
+def cell_key(latitude: float, longitude: float, radius: float = MERGE_RADIUS) -> str:
+    """Spatial hash cell of a point, "row:column"; two points in one cell are at most `radius` / 2 meters apart"""
+    row, column = _cell(latitude, longitude, radius / (2 * math.sqrt(2)))
+    return f"{row}:{column}"
+
+def lock_keys(barrier_type: str, latitude: float, longitude: float, radius: float = MERGE_RADIUS) -> List[str]:
+    """Keys of the (at most four) cells of side 2 * `radius` that the merge circle around a point touches"""
+    dlat, dlng = radius_to_degrees(latitude, radius)
+    cells = {
+        _cell(latitude + north, longitude + east, 2 * radius)
+        for north in (-dlat, dlat) for east in (-dlng, dlng)
+    }
+    return sorted(f"{barrier_type}:{row}:{column}" for row, column in cells)
+
+class CellLocks:
+    """asyncio locks by key, kept only while someone holds or waits for them"""
+
+    def __init__(self):
+        self.locks: Dict[str, asyncio.Lock] = {}
+        self.users: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.locks)
+
+    @asynccontextmanager
+    async def hold(self, keys: List[str]):
+        """Hold the locks for every key; callers pass keys in sorted order so none can deadlock"""
+        acquired = []
+        for key in keys:
+            self.users[key] = self.users.get(key, 0) + 1
+        try:
+            for key in keys:
+                lock = self.locks.get(key)
+                if lock is None:
+                    lock = self.locks[key] = asyncio.Lock()
+                await lock.acquire()
+                acquired.append(lock)
+            yield
+        finally:
+            for lock in acquired:
+                lock.release()
+            for key in keys:
+                self.users[key] -= 1
+                if not self.users[key]:
+                    del self.users[key]
+                    del self.locks[key]
+
+async def nearest_same_type(collection, report: dict, radius: float = MERGE_RADIUS) -> Optional[dict]:
+    """id and photo_url of the nearest stored barrier of the report's type within `radius` meters"""
+    pipeline = [
+        {"$geoNear": {
+            "near": report["location"], "distanceField": "distance", "maxDistance": radius,
+            "query": {"barrier_type": report["barrier_type"]}, "spherical": True,
+        }},
+        {"$limit": 1},
+        {"$project": {"_id": 0, "id": 1, "photo_url": 1}},
+    ]
+    found = await collection.aggregate(pipeline).to_list(1)
+    return found[0] if found else None
+
+def fold_update(report: dict, existing: dict) -> dict:
+    """Update that counts `report` against the barrier `existing`; its photo is kept only if the barrier had none"""
+    fields = {"severity": report["severity"], "last_reported_at": report["created_at"]}
+    if report.get("photo_url") and not existing.get("photo_url"):
+        for name in ("photo_url", "thumbnail_url", "ai_classification"):
+            fields[name] = report.get(name)
+    return {"$inc": {"report_count": 1}, "$set": fields}
+
+async def merge_report(collection, report: dict, locks: CellLocks,
+                       radius: float = MERGE_RADIUS) -> Tuple[dict, bool]:
+    """Store a report (a Barrier dict with its GeoJSON `location`) or fold it into a nearby barrier.
+
+    Returns the stored barrier without _id, and whether the report was merged.
+    """
+    latitude, longitude = report["latitude"], report["longitude"]
+    cell = cell_key(latitude, longitude, radius)
+    async with locks.hold(lock_keys(report["barrier_type"], latitude, longitude, radius)):
+        existing = await nearest_same_type(collection, report, radius)
+        if existing is not None:
+            merged = await collection.find_one_and_update(
+                {"id": existing["id"]}, fold_update(report, existing),
+                projection={"_id": 0}, return_document=ReturnDocument.AFTER
+            )
+            if merged is not None:
+                return merged, True
+            # Removed in the meantime (by a compaction run): store the report instead
+        document = dict(report, cell=cell, report_count=1, last_reported_at=report["created_at"])
+        try:
+            await collection.insert_one(document)
+        except DuplicateKeyError:
+            # Another worker has just stored a barrier of this type in this cell
+            existing = await collection.find_one(
+                {"barrier_type": report["barrier_type"], "cell": cell}, {"_id": 0, "id": 1, "photo_url": 1}
+            )
+            if existing is None:
+                raise
+            merged = await collection.find_one_and_update(
+                {"id": existing["id"]}, fold_update(report, existing),
+                projection={"_id": 0}, return_document=ReturnDocument.AFTER
+            )
+            return merged, True
+        document.pop("_id", None)
+        return document, False
+
+class BroadcastThrottle:
+    """At most one broadcast per key and window; later ones collapse into one trailing broadcast of the latest"""
+
+    def __init__(self, send: Callable[[str, dict], Awaitable[None]], window: float = BROADCAST_WINDOW):
+        self.send = send
+        self.window = window
+        # Monotonic time of the last broadcast per key
+        self.last_sent: Dict[str, float] = {}
+        self.pending: Dict[str, dict] = {}
+        self.timers: Dict[str, asyncio.Task] = {}
+        self.suppressed = 0
+
+    def __len__(self) -> int:
+        return len(self.timers)
+
+    async def submit(self, key: str, payload: dict):
+        """Broadcast now if `key` has been quiet for a window, otherwise when the window ends"""
+        now = time.monotonic()
+        if key in self.pending:
+            self.pending[key] = payload
+            self.suppressed += 1
+            return
+        last = self.last_sent.get(key)
+        if last is not None and now - last < self.window:
+            self.pending[key] = payload
+            self.timers[key] = asyncio.get_running_loop().create_task(self.send_later(key, last + self.window - now))
+            return
+        self.last_sent[key] = now
+        if len(self.last_sent) > 4 * len(self.timers) + 1024:
+            self.prune(now)
+        await self.send(key, payload)
+
+    def cancel(self, key: str):
+        """Drop a trailing broadcast that is no longer wanted"""
+        if self.pending.pop(key, None) is not None:
+            self.suppressed += 1
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+
+    async def send_later(self, key: str, delay: float):
+        try:
+            await asyncio.sleep(delay)
+            self.timers.pop(key, None)
+            payload = self.pending.pop(key, None)
+            if payload is not None:
+                self.last_sent[key] = time.monotonic()
+                await self.send(key, payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Trailing broadcast for %s failed", key)
+
+    def prune(self, now: float):
+        for key, sent in list(self.last_sent.items()):
+            if now - sent >= self.window and key not in self.pending:
+                del self.last_sent[key]
+
+    def close(self):
+        for timer in self.timers.values():
+            timer.cancel()
+        self.timers.clear()
+        self.pending.clear()
+
+# ============ Compaction ============
+
+COMPACT_PROJECTION = {
+    "_id": 0, "id": 1, "latitude": 1, "longitude": 1, "barrier_type": 1, "severity": 1,
+    "report_count": 1, "created_at": 1, "last_reported_at": 1, "cell": 1,
+}
+
+class Cluster:
+    """The oldest barrier of a group of duplicates, and what the others add to it"""
+
+    def __init__(self, barrier: dict):
+        self.barrier = barrier
+        self.report_count = barrier.get("report_count") or 1
+        self.severity = barrier["severity"]
+        self.last_reported_at = barrier.get("last_reported_at") or barrier["created_at"]
+        self.absorbed: List[str] = []
+
+    def absorb(self, barrier: dict):
+        self.report_count += barrier.get("report_count") or 1
+        reported_at = barrier.get("last_reported_at") or barrier["created_at"]
+        if reported_at >= self.last_reported_at:
+            self.last_reported_at = reported_at
+            self.severity = barrier["severity"]
+        self.absorbed.append(barrier["id"])
+
+async def merge_existing(collection, radius: float = MERGE_RADIUS,
+                         batch_size: int = COMPACT_BATCH_SIZE) -> Dict[str, int]:
+    """Fold stored barriers of the same type within `radius` meters into the oldest of them.
+
+    Barriers are visited oldest first; each joins the nearest earlier
+    survivor in reach or becomes one. Survivors get their cell, so the
+    unique index covers them from then on.
+    """
+    survivors: Dict[str, GridIndex] = {}
+    clusters: List[Cluster] = []
+    scanned = 0
+    cursor = collection.find({}, COMPACT_PROJECTION).sort("created_at", 1)
+    async for barrier in cursor.batch_size(5000):
+        scanned += 1
+        grid = survivors.setdefault(barrier["barrier_type"], GridIndex(cell_size=COMPACT_CELL_SIZE))
+        nearby = grid.within_radius(barrier["latitude"], barrier["longitude"], radius)
+        if nearby:
+            nearby[0][2].absorb(barrier)
+            continue
+        cluster = Cluster(barrier)
+        grid.insert(barrier["id"], barrier["latitude"], barrier["longitude"], cluster)
+        clusters.append(cluster)
+
+    # Duplicates go first: one may hold the cell its survivor is about to take
+    deletes, updates = [], []
+    merged = 0
+    for cluster in clusters:
+        barrier = cluster.barrier
+        cell = cell_key(barrier["latitude"], barrier["longitude"], radius)
+        if not cluster.absorbed and barrier.get("cell") == cell and "report_count" in barrier:
+            continue
+        updates.append(UpdateOne({"id": barrier["id"]}, {"$set": {
+            "report_count": cluster.report_count, "severity": cluster.severity,
+            "last_reported_at": cluster.last_reported_at, "cell": cell,
+        }}))
+        if cluster.absorbed:
+            deletes.append(DeleteMany({"id": {"$in": cluster.absorbed}}))
+            merged += len(cluster.absorbed)
+    requests = deletes + updates
+    for start in range(0, len(requests), batch_size):
+        await collection.bulk_write(requests[start:start + batch_size], ordered=True)
+    return {"scanned": scanned, "kept": len(clusters), "merged": merged}
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge stored barriers of the same type that lie within the merge radius")
+    parser.add_argument("--radius", type=float, default=MERGE_RADIUS, help="meters")
+    args = parser.parse_args()
+
+    # The server module owns the database settings
+    import server
+
+    print(json.dumps(asyncio.run(merge_existing(server.db.barriers, args.radius))))
+
+if __name__ == "__main__":
+    main()
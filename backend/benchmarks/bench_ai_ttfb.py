@@ -0,0 +1,72 @@
+"""Time to first byte for /api/ai/search vs /api/ai/search/stream.
+
+Start the API with the local LLM stub so no network is needed, e.g.
+    LLM_BACKEND=fake uvicorn server:app --port 8001
+then run from backend/:
+    python -m benchmarks.bench_ai_ttfb --url http://localhost:8001 --requests 50
+
+Every request uses a distinct query so the response cache never answers.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))] if ordered else 0.0
+
+def summary(values):
+    return {f"p{q}": round(percentile(values, q) * 1000, 1) for q in (50, 95, 99)}
+
+async def measure(client: httpx.AsyncClient, path: str, body: dict):
+    """(seconds to first byte, seconds to first token, seconds to completion)"""
+    started = time.perf_counter()
+    first_byte = first_token = None
+    async with client.stream("POST", path, json=body) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            now = time.perf_counter()
+            if first_byte is None:
+                first_byte = now
+            if first_token is None and ('"token"' in line or line.startswith("event: token")):
+                first_token = now
+    done = time.perf_counter()
+    first_byte = first_byte or done
+    return first_byte - started, (first_token or done) - started, done - started
+
+async def run(url: str, requests: int, concurrency: int, latitude: float, longitude: float):
+    results = {}
+    async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+        for name, path in (("blocking", "/api/ai/search"), ("stream", "/api/ai/search/stream?format=ndjson")):
+            semaphore = asyncio.Semaphore(concurrency)
+            timings = []
+
+            async def one(i):
+                body = {"query": f"accessible cafe with a ramp #{name}-{i}-{time.time()}",
+                        "user_mode": "wheelchair", "latitude": latitude, "longitude": longitude}
+                async with semaphore:
+                    timings.append(await measure(client, path, body))
+
+            await asyncio.gather(*(one(i) for i in range(requests)))
+            results[name] = {
+                "ttfb_ms": summary([t[0] for t in timings]),
+                "first_token_ms": summary([t[1] for t in timings]),
+                "total_ms": summary([t[2] for t in timings]),
+            }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8001")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latitude", type=float, default=12.9716)
+    parser.add_argument("--longitude", type=float, default=77.5946)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.url, args.requests, args.concurrency, args.latitude, args.longitude)), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Cross-process delivery through the alert brokers.
+
+Starts N worker processes with the chosen broker. Every worker publishes M
+messages; each worker must receive all N * M (its own locally, the rest via
+the transport). Reports delivery completeness, throughput and latency. The
+redis backend runs against benchmarks/resp_standin.py unless --url is given.
+
+Run from backend/:  python -m benchmarks.bench_broker --broker unix --workers 4
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import tempfile
+import time
+
+from broker import create_broker
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))] if ordered else 0.0
+
+async def worker_main(index, kind, path, url, workers, messages, start_at, results):
+    latencies = []
+    expected = workers * messages
+    done = asyncio.Event()
+
+    def handle(message: bytes):
+        sent = float(message.split(b" ", 1)[0])
+        latencies.append(time.time() - sent)
+        if len(latencies) >= expected:
+            done.set()
+
+    broker = create_broker(kind, path=path, url=url)
+    await broker.start(handle)
+    # Wait until every worker is connected before publishing
+    await asyncio.sleep(max(0.0, start_at - time.time()))
+    for i in range(messages):
+        broker.publish(b"%f worker-%d message-%d" % (time.time(), index, i))
+        if i % 100 == 0:
+            await asyncio.sleep(0)
+    try:
+        await asyncio.wait_for(done.wait(), timeout=20)
+    except asyncio.TimeoutError:
+        pass
+    await broker.close()
+    results.put({"worker": index, "received": len(latencies), "batches_sent": broker.batches_sent,
+                 "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                 "p99_ms": round(percentile(latencies, 99) * 1000, 2)})
+
+def worker(*args):
+    asyncio.run(worker_main(*args))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--broker", choices=["unix", "redis"], default="unix")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--url", help="redis URL; defaults to a local RESP stand-in")
+    args = parser.parse_args()
+
+    standin = None
+    url = args.url
+    if args.broker == "redis" and url is None:
+        from benchmarks.resp_standin import main as standin_main
+        standin = multiprocessing.Process(target=lambda: asyncio.run(standin_main(6399)), daemon=True)
+        standin.start()
+        time.sleep(0.5)
+        url = "redis://127.0.0.1:6399"
+
+    directory = tempfile.mkdtemp(prefix="sanchara-broker-")
+    results = multiprocessing.Queue()
+    start_at = time.time() + 1.5
+    processes = [
+        multiprocessing.Process(target=worker, args=(i, args.broker, directory, url, args.workers,
+                                                     args.messages, start_at, results))
+        for i in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    reports = [results.get(timeout=60) for _ in processes]
+    for process in processes:
+        process.join()
+    if standin is not None:
+        standin.terminate()
+
+    elapsed = max(0.001, time.time() - start_at)
+    total = args.workers * args.messages
+    print(json.dumps({
+        "broker": args.broker,
+        "workers": args.workers,
+        "published": total,
+        "complete": all(r["received"] == total for r in reports),
+        "deliveries_per_s": round(sum(r["received"] for r in reports) / elapsed),
+        "workers_detail": sorted(reports, key=lambda r: r["worker"]),
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
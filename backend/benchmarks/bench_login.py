@@ -0,0 +1,86 @@
+"""Login throughput under concurrent load, and how responsive the API stays meanwhile.
+
+Registers --users accounts, then keeps --concurrency logins in flight for
+--seconds while a probe requests GET /api/ every 50 ms. If bcrypt ran on
+the event loop, probe latency would climb to the cost of a hash times the
+backlog; with the hashing pool it stays at the request overhead.
+
+Start the API first (BCRYPT_ROUNDS and AUTH_HASH_WORKERS apply), then
+run from backend/:
+    python -m benchmarks.bench_login --url http://localhost:8001 --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import httpx
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))] if ordered else 0.0
+
+def summary(values):
+    return {f"p{q}": round(percentile(values, q) * 1000, 1) for q in (50, 95, 99)}
+
+async def register(client: httpx.AsyncClient, prefix: str, count: int):
+    users = [(f"{prefix}-{i}", f"pw-{i}-{prefix}") for i in range(count)]
+    for username, password in users:
+        response = await client.post("/api/auth/register", json={
+            "username": username, "password": password, "email": f"{username}@example.com"
+        })
+        response.raise_for_status()
+    return users
+
+async def run(url: str, users: int, concurrency: int, seconds: float):
+    async with httpx.AsyncClient(base_url=url, timeout=60,
+                                 limits=httpx.Limits(max_connections=concurrency + 4)) as client:
+        accounts = await register(client, f"bench-{uuid.uuid4().hex[:8]}", users)
+        deadline = time.perf_counter() + seconds
+        logins, failures, probes = [], 0, []
+
+        async def login_worker(worker: int):
+            nonlocal failures
+            i = worker
+            while time.perf_counter() < deadline:
+                username, password = accounts[i % len(accounts)]
+                started = time.perf_counter()
+                response = await client.post("/api/auth/login", json={"username": username, "password": password})
+                if response.status_code == 200:
+                    logins.append(time.perf_counter() - started)
+                else:
+                    failures += 1
+                i += concurrency
+
+        async def probe():
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                await client.get("/api/")
+                probes.append(time.perf_counter() - started)
+                await asyncio.sleep(0.05)
+
+        started = time.perf_counter()
+        await asyncio.gather(probe(), *(login_worker(w) for w in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "logins": len(logins),
+        "failures": failures,
+        "logins_per_second": round(len(logins) / elapsed, 1),
+        "login_ms": summary(logins),
+        "probe_ms": summary(probes),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8001")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.url, args.users, args.concurrency, args.seconds)), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Route computation time on a synthetic street grid.
+
+Builds a square grid of walkable streets (--side nodes a side, --spacing
+meters apart) straight into CSR form, scatters barriers over it and times
+PedestrianGraph.route for random pairs of points a given straight-line
+distance apart. Run from backend/:
+    python -m benchmarks.bench_routing --side 400 --distances 1000 5000 20000
+"""
+import argparse
+import math
+import random
+import statistics
+import time
+from array import array
+
+from geo import METERS_PER_DEGREE_LAT
+from routing import SURFACE_SMOOTH, PedestrianGraph
+
+CENTER = (40.7580, -73.9855)
+
+def grid_graph(side: int, spacing: float, center=CENTER) -> PedestrianGraph:
+    """side x side nodes joined to their four neighbours by smooth, flat streets"""
+    graph = PedestrianGraph()
+    dlat = spacing / METERS_PER_DEGREE_LAT
+    dlng = dlat / math.cos(math.radians(center[0]))
+    south, west = center[0] - dlat * side / 2, center[1] - dlng * side / 2
+    for row in range(side):
+        for column in range(side):
+            graph.node_lat.append(south + row * dlat)
+            graph.node_lng.append(west + column * dlng)
+    sources, targets, segments = array("l"), array("l"), array("l")
+    for node in range(side * side):
+        row, column = divmod(node, side)
+        for neighbour in ((node + 1) if column + 1 < side else None, (node + side) if row + 1 < side else None):
+            if neighbour is not None:
+                sources.extend((node, neighbour))
+                targets.extend((neighbour, node))
+                segments.extend((0, 0))
+    graph._build_csr(sources, targets, segments, array("B", [SURFACE_SMOOTH]), array("f", [0.0]), array("B", [0]))
+    return graph
+
+def point_at(rng: random.Random, graph: PedestrianGraph, distance: float):
+    """A random node and a point `distance` meters from it in a random direction, both on the grid"""
+    min_lat, max_lat = min(graph.node_lat), max(graph.node_lat)
+    min_lng, max_lng = min(graph.node_lng), max(graph.node_lng)
+    while True:
+        node = rng.randrange(graph.node_count)
+        lat, lng = graph.node_lat[node], graph.node_lng[node]
+        bearing = rng.uniform(0, 2 * math.pi)
+        end_lat = lat + distance * math.cos(bearing) / METERS_PER_DEGREE_LAT
+        end_lng = lng + distance * math.sin(bearing) / (METERS_PER_DEGREE_LAT * math.cos(math.radians(lat)))
+        if min_lat <= end_lat <= max_lat and min_lng <= end_lng <= max_lng:
+            return lat, lng, end_lat, end_lng
+
+def run(args):
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    graph = grid_graph(args.side, args.spacing)
+    print(f"grid {args.side}x{args.side}: {graph.node_count} nodes, {graph.edge_count} edges, "
+          f"built in {time.perf_counter() - started:.1f}s")
+    barriers = [
+        {"latitude": graph.node_lat[node], "longitude": graph.node_lng[node], "severity": "high"}
+        for node in rng.sample(range(graph.node_count), args.barriers)
+    ]
+    for distance in args.distances:
+        times = []
+        for _ in range(args.routes):
+            start_lat, start_lng, end_lat, end_lng = point_at(rng, graph, distance)
+            # Barriers the server would pass for this route's padded box
+            nearby = [
+                barrier for barrier in barriers
+                if min(start_lat, end_lat) - 0.01 <= barrier["latitude"] <= max(start_lat, end_lat) + 0.01
+                and min(start_lng, end_lng) - 0.01 <= barrier["longitude"] <= max(start_lng, end_lng) + 0.01
+            ]
+            started = time.perf_counter()
+            found = graph.route(start_lat, start_lng, end_lat, end_lng, args.mode, nearby)
+            times.append(time.perf_counter() - started)
+            assert found is not None
+        times.sort()
+        print(f"{distance:>8.0f} m  p50 {statistics.median(times) * 1000:8.1f} ms  "
+              f"p95 {times[int(len(times) * 0.95) - 1] * 1000:8.1f} ms  max {times[-1] * 1000:8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--side", type=int, default=400, help="nodes per side of the grid")
+    parser.add_argument("--spacing", type=float, default=50.0, help="meters between neighbouring nodes")
+    parser.add_argument("--distances", type=float, nargs="+", default=[1000.0, 5000.0, 15000.0])
+    parser.add_argument("--routes", type=int, default=20, help="routes timed per distance")
+    parser.add_argument("--barriers", type=int, default=2000)
+    parser.add_argument("--mode", default="wheelchair")
+    parser.add_argument("--seed", type=int, default=3)
+    run(parser.parse_args())
+
+if __name__ == "__main__":
+    main()
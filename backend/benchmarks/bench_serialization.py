@@ -0,0 +1,90 @@
+"""Cost of encoding list responses: per-row Pydantic models vs RowEncoder.
+
+Both paths serve the same documents through a real FastAPI route, so the
+numbers include FastAPI's response handling. The Pydantic path gets the
+unprojected documents the endpoints used to fetch; the fast path gets the
+projected ones. Needs the server's environment (MONGO_URL, DB_NAME), but
+no database. Run from backend/:
+    python -m benchmarks.bench_serialization --rows 1000 10000
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from server import Location, location_rows, with_geo
+
+def stored_location(rng: random.Random) -> dict:
+    """A document as Mongo returns it for a location inserted by the API"""
+    doc = {
+        "_id": ObjectId(),
+        "id": str(uuid.uuid4()),
+        "name": f"Place {rng.randrange(10 ** 6)}",
+        "latitude": rng.uniform(12.8, 13.1),
+        "longitude": rng.uniform(77.4, 77.8),
+        "address": f"{rng.randrange(1, 500)} Main Road, Bengaluru",
+        "sanchara_score": float(rng.randrange(2, 20)) / 2,
+        "has_ramp": rng.random() < 0.5,
+        "has_elevator": rng.random() < 0.3,
+        "has_stairs": rng.random() < 0.6,
+        "surface_type": rng.choice(["smooth", "rough"]),
+        "incline_level": rng.choice(["low", "moderate", "high"]),
+        "description": rng.choice([None, "Step-free entrance on the side street"]),
+        # Mongo keeps milliseconds
+        "created_at": datetime(2025, 1, 1) + timedelta(milliseconds=rng.randrange(10 ** 10)),
+    }
+    return with_geo(doc)
+
+def projected(doc: dict) -> dict:
+    return {name: doc[name] for name in location_rows.projection if name != "_id" and name in doc}
+
+def build_app(documents: List[dict]) -> FastAPI:
+    app = FastAPI()
+    projected_documents = [projected(doc) for doc in documents]
+
+    @app.get("/pydantic", response_model=List[Location])
+    async def pydantic_path():
+        return [Location(**doc) for doc in (dict(d) for d in documents)]
+
+    @app.get("/fast", response_model=List[Location])
+    async def fast_path():
+        return location_rows.response([dict(d) for d in projected_documents])
+
+    return app
+
+def timed(client: TestClient, path: str, repeat: int):
+    samples = []
+    body = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(path)
+        samples.append(time.perf_counter() - started)
+        body = response.content
+    return statistics.median(samples), body
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=15)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        rng = random.Random(args.seed)
+        client = TestClient(build_app([stored_location(rng) for _ in range(rows)]))
+        slow, slow_body = timed(client, "/pydantic", args.repeat)
+        fast, fast_body = timed(client, "/fast", args.repeat)
+        assert json.loads(slow_body) == json.loads(fast_body), "fast path changed the response"
+        print(f"{rows:>7} rows  pydantic {slow * 1000:8.2f} ms  fast {fast * 1000:7.2f} ms  "
+              f"speedup {slow / fast:5.1f}x  ({len(fast_body) / 1024:.0f} KiB)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Lookup cost of the GridIndex used by simple_server as the store grows.
+
+Run from backend/:  python -m benchmarks.bench_spatial_index --sizes 10000 100000 1000000
+"""
+import argparse
+import random
+import time
+
+from geo import GridIndex, haversine_m
+
+# Points are spread over a country-sized region so density per cell stays
+# realistic while the total store grows.
+REGION = (8.0, 68.0, 35.0, 97.0)
+
+def random_point(rng: random.Random):
+    min_lat, min_lng, max_lat, max_lng = REGION
+    return rng.uniform(min_lat, max_lat), rng.uniform(min_lng, max_lng)
+
+def run(size: int, queries: int, radius: float, seed: int, linear: bool):
+    rng = random.Random(seed)
+    index = GridIndex(cell_size=0.01)
+    points = []
+    started = time.perf_counter()
+    for i in range(size):
+        lat, lng = random_point(rng)
+        index.insert(i, lat, lng)
+        if linear:
+            points.append((lat, lng))
+    build_s = time.perf_counter() - started
+
+    centers = [random_point(rng) for _ in range(queries)]
+    found = 0
+    started = time.perf_counter()
+    for lat, lng in centers:
+        found += len(index.within_radius(lat, lng, radius))
+    radius_us = (time.perf_counter() - started) / queries * 1e6
+
+    started = time.perf_counter()
+    for lat, lng in centers:
+        index.within_bbox(lat - 0.01, lng - 0.01, lat + 0.01, lng + 0.01)
+    bbox_us = (time.perf_counter() - started) / queries * 1e6
+
+    line = f"{size:>10} pts  build {build_s:7.2f}s  radius {radius_us:8.1f}us  bbox {bbox_us:8.1f}us  hits/query {found / queries:6.2f}"
+    if linear:
+        sample = centers[:max(1, queries // 100)]
+        started = time.perf_counter()
+        for lat, lng in sample:
+            [p for p in points if haversine_m(lat, lng, p[0], p[1]) <= radius]
+        line += f"  linear scan {(time.perf_counter() - started) / len(sample) * 1e6:10.1f}us"
+    print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--radius", type=float, default=1000.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--linear", action="store_true", help="also time a full scan for comparison")
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size, args.queries, args.radius, args.seed, args.linear)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Cold-start cost of an API worker: import time and time to first request.
+
+Imports `server` in fresh interpreters (--runs times, median reported) and
+lists which heavy optional modules the import pulled in; none of them should
+load until a request needs them. Then starts uvicorn and measures how long
+until GET /api/ first answers, which includes the startup hooks and so needs
+the MongoDB from MONGO_URL (skip it with --skip-server).
+
+With budgets it doubles as a regression check for CI: it exits 1 if a
+median exceeds its budget or a heavy module was imported. Run from backend/:
+    python -m benchmarks.bench_startup --import-budget-ms 1500 --first-request-budget-ms 5000
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Loaded on demand only: the LLM stack for AI search, NumPy for rescoring, Pillow for thumbnails
+HEAVY_MODULES = ("emergentintegrations", "litellm", "openai", "google.generativeai", "numpy", "PIL")
+
+IMPORT_PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+import server
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "heavy": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+def probe_env() -> dict:
+    env = dict(os.environ)
+    env.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    env.setdefault("DB_NAME", "sanchara_bench")
+    return env
+
+def measure_import(runs: int) -> dict:
+    times, heavy = [], set()
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE], cwd=BACKEND_DIR, env=probe_env(),
+            capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        times.append(result["seconds"])
+        heavy.update(result["heavy"])
+    return {
+        "runs": runs,
+        "median_ms": round(statistics.median(times) * 1000, 1),
+        "max_ms": round(max(times) * 1000, 1),
+        "heavy_modules_loaded": sorted(heavy),
+    }
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def measure_first_request(runs: int, timeout: float) -> dict:
+    times = []
+    for _ in range(runs):
+        port = free_port()
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port),
+             "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=probe_env()
+        )
+        try:
+            deadline = started + timeout
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with status {process.returncode}")
+                try:
+                    if httpx.get(f"http://127.0.0.1:{port}/api/", timeout=1.0).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.perf_counter() > deadline:
+                    raise RuntimeError(f"no response within {timeout} s")
+                time.sleep(0.01)
+            times.append(time.perf_counter() - started)
+        finally:
+            process.terminate()
+            process.wait()
+    return {
+        "runs": runs,
+        "median_ms": round(statistics.median(times) * 1000, 1),
+        "max_ms": round(max(times) * 1000, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--skip-server", action="store_true", help="only measure the import")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for the first response")
+    parser.add_argument("--import-budget-ms", type=float)
+    parser.add_argument("--first-request-budget-ms", type=float)
+    args = parser.parse_args()
+
+    report = {"import": measure_import(args.runs)}
+    if not args.skip_server:
+        report["first_request"] = measure_first_request(args.runs, args.timeout)
+
+    failures = []
+    if report["import"]["heavy_modules_loaded"]:
+        failures.append(f"heavy modules imported at startup: {', '.join(report['import']['heavy_modules_loaded'])}")
+    if args.import_budget_ms is not None and report["import"]["median_ms"] > args.import_budget_ms:
+        failures.append(f"import took {report['import']['median_ms']} ms, budget {args.import_budget_ms} ms")
+    if (args.first_request_budget_ms is not None and "first_request" in report
+            and report["first_request"]["median_ms"] > args.first_request_budget_ms):
+        failures.append(f"first request after {report['first_request']['median_ms']} ms, "
+                        f"budget {args.first_request_budget_ms} ms")
+    report["failures"] = failures
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Broadcast latency of ConnectionManager with many simulated sockets.
+
+Each fake socket takes a few milliseconds per send; a fraction of them are
+"slow mobile clients" that stall for seconds. Reports how long broadcast()
+blocks its caller and the delivery latency percentiles to healthy clients.
+
+With --geo, sockets subscribe at random points across a ~40 km city and
+each broadcast is a located alert, so only nearby subscribers are targeted.
+
+Run from backend/:  python -m benchmarks.bench_ws_broadcast --sockets 10000 [--geo]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from realtime import ConnectionManager
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))]
+
+class FakeSocket:
+    def __init__(self, rng: random.Random, slow: bool, received: list):
+        self.delay = 2.0 if slow else rng.uniform(0.001, 0.005)
+        self.slow = slow
+        self.received = received
+
+    async def send_text(self, payload: str):
+        await asyncio.sleep(self.delay)
+        if not self.slow:
+            self.received.append((payload, time.perf_counter()))
+
+CITY = (12.80, 77.45, 13.15, 77.80)
+
+def city_point(rng: random.Random):
+    return rng.uniform(CITY[0], CITY[2]), rng.uniform(CITY[1], CITY[3])
+
+async def run(sockets: int, messages: int, slow_fraction: float, interval: float, seed: int, geo: bool):
+    rng = random.Random(seed)
+    manager = ConnectionManager()
+    received = []
+    for _ in range(sockets):
+        socket = FakeSocket(rng, rng.random() < slow_fraction, received)
+        manager.register(socket)
+        if geo:
+            manager.subscribe(socket, *city_point(rng), radius=2000.0)
+
+    call_times = []
+    expected = 0
+    for i in range(messages):
+        started = time.perf_counter()
+        if geo:
+            latitude, longitude = city_point(rng)
+            await manager.broadcast({"type": "alert", "seq": i, "sent_at": started},
+                                    latitude=latitude, longitude=longitude, radius=500.0)
+            call_times.append(time.perf_counter() - started)
+            targets = manager.subscribers_for(latitude, longitude, 500.0)
+        else:
+            await manager.broadcast({"type": "alert", "seq": i, "sent_at": started})
+            call_times.append(time.perf_counter() - started)
+            targets = manager.connections.values()
+        expected += sum(1 for c in targets if not c.websocket.slow)
+        await asyncio.sleep(interval)
+
+    deadline = time.perf_counter() + 30
+    while len(received) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    # Payloads are encoded once per broadcast, so decode each distinct one once
+    sent_at = {}
+    latencies = []
+    for payload, at in received:
+        if payload not in sent_at:
+            sent_at[payload] = json.loads(payload)["sent_at"]
+        latencies.append(at - sent_at[payload])
+    result = {
+        "sockets": sockets,
+        "messages": messages,
+        "delivered_to_healthy": len(received),
+        "expected_healthy": expected,
+        "dropped": manager.dropped(),
+        "broadcast_call_ms": {q: round(percentile(call_times, q) * 1000, 2) for q in (50, 95, 99)},
+        "delivery_ms": {q: round(percentile(latencies, q) * 1000, 2) for q in (50, 95, 99)},
+    }
+    await manager.close()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sockets", type=int, default=10_000)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--slow-fraction", type=float, default=0.01)
+    parser.add_argument("--interval", type=float, default=0.25, help="seconds between broadcasts")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--geo", action="store_true", help="subscribe sockets across a city and send located alerts")
+    args = parser.parse_args()
+    result = asyncio.run(run(args.sockets, args.messages, args.slow_fraction, args.interval, args.seed, args.geo))
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""Scripted endpoint mixes against a synthetic city, with per-endpoint latency percentiles.
+
+Generates a city (benchmarks.synthetic_city) and loads it into the
+database. Then it runs the API's startup hooks in-process and drives the
+app through httpx's ASGI transport: --users virtual users, for --seconds
+after --warmup. Each user keeps picking an action from the mix:
+    browse   locations, barriers and alerts around a viewport, plus the
+             heatmap; sometimes the next page of locations
+    route    a route between two nearby points
+    report   a new barrier, or now and then an alert
+    search   AI search, blocking or streamed, with the fake LLM backend
+The mixes are browse, route, report, search and mixed. The output is
+JSON: overall throughput and, per endpoint, the count, the errors and
+p50/p95/p99/max in milliseconds.
+
+--mongo memory (the default) uses the in-memory stand-in from
+benchmarks.memory_mongo. A mongodb:// URL loads the city into a scratch
+database on that server, which is dropped afterwards unless --keep is given.
+
+Client and server share one process and event loop, so absolute numbers
+include client overhead. Compare runs made with the same settings. Save a
+run with --output, then pass it to a later run as --baseline to get each
+endpoint's change in percent. Run from backend/:
+    python -m benchmarks.loadtest --mix mixed --users 20 --seconds 30 --output before.json
+    python -m benchmarks.loadtest --mix mixed --users 20 --seconds 30 --baseline before.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.synthetic_city import City, generate_city, insert_city, offset
+
+MIXES = {
+    "browse": {"browse": 1.0},
+    "route": {"route": 1.0},
+    "report": {"report": 1.0},
+    "search": {"search": 1.0},
+    "mixed": {"browse": 0.6, "route": 0.2, "report": 0.12, "search": 0.08},
+}
+SEARCH_QUERIES = (
+    "wheelchair accessible cafe", "library with an elevator", "step-free pharmacy nearby",
+    "quiet museum with smooth paths", "station with a ramp", "accessible restaurant with parking",
+)
+MODES = ("wheelchair", "blind", "deaf")
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))] if ordered else 0.0
+
+class Recorder:
+    """Latency samples and failures per endpoint label, e.g. "GET /api/locations" """
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.actions: Dict[str, int] = defaultdict(int)
+        self.enabled = True
+
+    def record(self, label: str, seconds: float, ok: bool):
+        if not self.enabled:
+            return
+        self.latencies[label].append(seconds)
+        if not ok:
+            self.errors[label] += 1
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for label in sorted(self.latencies):
+            values = self.latencies[label]
+            endpoints[label] = {
+                "count": len(values),
+                "errors": self.errors[label],
+                "rps": round(len(values) / elapsed, 1),
+                **{f"p{q}_ms": round(percentile(values, q) * 1000, 2) for q in (50, 95, 99)},
+                "max_ms": round(max(values) * 1000, 2),
+            }
+        total = sum(len(values) for values in self.latencies.values())
+        return {
+            "requests": total,
+            "errors": sum(self.errors.values()),
+            "throughput_rps": round(total / elapsed, 1),
+            "actions": dict(sorted(self.actions.items())),
+            "endpoints": endpoints,
+        }
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, city: City, recorder: Recorder, rng: random.Random):
+        self.client = client
+        self.city = city
+        self.recorder = recorder
+        self.rng = rng
+        self.user_id = rng.choice(city.user_ids)
+        self.mode = rng.choice(MODES)
+
+    async def request(self, label: str, method: str, path: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, **kwargs)
+        except httpx.HTTPError:
+            self.recorder.record(label, time.perf_counter() - started, False)
+            return None
+        self.recorder.record(label, time.perf_counter() - started, response.status_code < 400)
+        return response
+
+    async def stream(self, label: str, path: str, body: dict):
+        """Time a streamed response until its last byte"""
+        started = time.perf_counter()
+        ok = False
+        try:
+            async with self.client.stream("POST", path, json=body) as response:
+                async for _ in response.aiter_raw():
+                    pass
+                ok = response.status_code < 400
+        except httpx.HTTPError:
+            pass
+        self.recorder.record(label, time.perf_counter() - started, ok)
+
+    def position(self) -> dict:
+        latitude, longitude = self.city.busy_point(self.rng)
+        return {"latitude": latitude, "longitude": longitude}
+
+    async def browse(self):
+        viewport = {**self.position(), "radius": self.rng.choice((500.0, 1000.0, 2000.0))}
+        response = await self.request("GET /api/locations", "GET", "/api/locations", params=viewport)
+        await self.request("GET /api/barriers", "GET", "/api/barriers", params=viewport)
+        await self.request("GET /api/alerts", "GET", "/api/alerts", params=viewport)
+        await self.request("GET /api/locations/heatmap", "GET", "/api/locations/heatmap", params=viewport)
+        next_cursor = response.headers.get("x-next-cursor") if response is not None else None
+        if next_cursor and self.rng.random() < 0.3:
+            await self.request("GET /api/locations (next page)", "GET", "/api/locations",
+                               params={**viewport, "cursor": next_cursor})
+
+    async def route(self):
+        start = self.position()
+        distance = self.rng.uniform(300.0, 3000.0)
+        bearing = self.rng.uniform(0.0, 2 * math.pi)
+        end_lat, end_lng = offset(start["latitude"], start["longitude"],
+                                  distance * math.cos(bearing), distance * math.sin(bearing))
+        await self.request("POST /api/routes", "POST", "/api/routes", json={
+            "user_id": self.user_id, "start_lat": start["latitude"], "start_lng": start["longitude"],
+            "end_lat": end_lat, "end_lng": end_lng, "mode": self.mode,
+        })
+
+    async def report(self):
+        where = self.position()
+        if self.rng.random() < 0.2:
+            await self.request("POST /api/alerts", "POST", "/api/alerts", json={
+                **where, "alert_type": self.rng.choice(("hazard", "pothole", "construction")),
+                "message": "Reported during load test", "severity": self.rng.choice(("low", "medium", "high")),
+            })
+            return
+        await self.request("POST /api/barriers", "POST", "/api/barriers", json={
+            **where, "user_id": self.user_id,
+            "barrier_type": self.rng.choice(("pothole", "missing_ramp", "stairs", "construction", "curb")),
+            "severity": self.rng.choice(("low", "medium", "high")), "description": "Reported during load test",
+        })
+
+    async def search(self):
+        body = {"query": self.rng.choice(SEARCH_QUERIES), "user_mode": self.mode, **self.position(), "radius": 2000.0}
+        if self.rng.random() < 0.5:
+            await self.stream("POST /api/ai/search/stream", "/api/ai/search/stream?format=ndjson", body)
+        else:
+            await self.request("POST /api/ai/search", "POST", "/api/ai/search", json=body)
+
+    async def run(self, mix: Dict[str, float], deadline: float):
+        actions, weights = zip(*mix.items())
+        while time.perf_counter() < deadline:
+            action = self.rng.choices(actions, weights=weights)[0]
+            if self.recorder.enabled:
+                self.recorder.actions[action] += 1
+            await getattr(self, action)()
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, check=True).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(report: dict, baseline: dict) -> dict:
+    """Percent change per endpoint against an earlier report (positive = slower / more throughput)"""
+    def change(new, old):
+        return round((new / old - 1.0) * 100.0, 1) if old else None
+
+    endpoints = {}
+    for label, stats in report["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(label)
+        if before is not None:
+            endpoints[label] = {key: change(stats[key], before[key]) for key in ("rps", "p50_ms", "p95_ms", "p99_ms")}
+    return {
+        "commit": baseline.get("config", {}).get("commit"),
+        "throughput_rps": change(report["throughput_rps"], baseline.get("throughput_rps", 0.0)),
+        "endpoints": endpoints,
+    }
+
+def configure(args, photo_dir: str):
+    """Environment for the in-process server; must run before `server` is imported"""
+    os.environ["MONGO_URL"] = "mongodb://localhost:27017" if args.mongo == "memory" else args.mongo
+    os.environ["DB_NAME"] = args.db
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ.setdefault("FAKE_LLM_FIRST_TOKEN_MS", str(args.llm_first_token_ms))
+    os.environ.setdefault("FAKE_LLM_TOKEN_MS", str(args.llm_token_ms))
+    os.environ["PHOTO_STORE_PATH"] = photo_dir
+    os.environ.setdefault("ALERT_BROKER", "memory")
+
+async def run(args) -> dict:
+    import server
+
+    if args.mongo == "memory":
+        from benchmarks.memory_mongo import MemoryClient
+        server.client = MemoryClient(latency=args.db_latency_ms / 1000.0)
+        server.db = server.client[args.db]
+        # Bound to a collection when server.py was imported
+        server.route_history.collection = server.db.routes
+    elif not args.keep:
+        await server.client.drop_database(args.db)
+
+    city = generate_city(args.locations, args.barriers, args.alerts, args.seed)
+    started = time.perf_counter()
+    await insert_city(server.db, city)
+    await server.app.router.startup()
+    await server.heatmap.task
+    setup_seconds = time.perf_counter() - started
+
+    recorder = Recorder()
+    transport = httpx.ASGITransport(app=server.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as client:
+            users = [VirtualUser(client, city, recorder, random.Random(args.seed * 1000 + i)) for i in range(args.users)]
+            mix = MIXES[args.mix]
+            if args.warmup > 0:
+                recorder.enabled = False
+                deadline = time.perf_counter() + args.warmup
+                await asyncio.gather(*(user.run(mix, deadline) for user in users))
+                recorder.enabled = True
+            started = time.perf_counter()
+            deadline = started + args.seconds
+            await asyncio.gather(*(user.run(mix, deadline) for user in users))
+            elapsed = time.perf_counter() - started
+    finally:
+        if args.mongo != "memory" and not args.keep:
+            await server.client.drop_database(args.db)
+        await server.app.router.shutdown()
+
+    return {
+        "config": {
+            "commit": git_commit(),
+            "mix": args.mix,
+            "users": args.users,
+            "seconds": args.seconds,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "mongo": "memory" if args.mongo == "memory" else "mongodb",
+            "db_latency_ms": args.db_latency_ms if args.mongo == "memory" else None,
+            "city": city.summary(),
+            "setup_seconds": round(setup_seconds, 2),
+        },
+        **recorder.report(elapsed),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds run before measuring")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--locations", type=int, default=20000)
+    parser.add_argument("--barriers", type=int, default=5000)
+    parser.add_argument("--alerts", type=int, default=300)
+    parser.add_argument("--mongo", default="memory", help="'memory' or a mongodb:// URL")
+    parser.add_argument("--db", default="sanchara_loadtest")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch database on a real MongoDB")
+    parser.add_argument("--db-latency-ms", type=float, default=0.0, help="simulated round trip for --mongo memory")
+    parser.add_argument("--llm-first-token-ms", type=float, default=300.0)
+    parser.add_argument("--llm-token-ms", type=float, default=15.0)
+    parser.add_argument("--output", type=Path, help="also write the report here")
+    parser.add_argument("--baseline", type=Path, help="earlier report to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="sanchara-loadtest-") as photo_dir:
+        configure(args, photo_dir)
+        report = asyncio.run(run(args))
+    if args.baseline is not None:
+        report["baseline"] = compare(report, json.loads(args.baseline.read_text()))
+    text = json.dumps(report, indent=2)
+    if args.output is not None:
+        args.output.write_text(text + "\n")
+    print(text)
+    return 1 if report["requests"] == 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,801 @@
+"""In-memory stand-in for the parts of Motor the API uses.
+
+Good enough to run the server and the load test without a mongod.
+Collections keep their documents in a dict. Unique indexes, compound and
+partial ones included, are enforced (DuplicateKeyError). A 2dsphere index
+is a geo.GridIndex that serves $geoNear and narrows $geoWithin. What is supported is what
+server.py, pagination.py, scoring.py and ingest.py send:
+    filters      equality, $eq $ne $gt $gte $lt $lte $in $nin $exists $type $not,
+                 $and $or $nor, $geoWithin with a GeoJSON polygon
+    updates      $set $unset $inc $setOnInsert $push, and pipeline updates whose
+                 $set values are literals, field paths or $add expressions
+    aggregation  $geoNear (first stage only), $match $sort $skip $limit $project $count
+    also         find_one_and_update with projection, upsert and return_document
+TTL indexes are accepted but never delete anything. Every call yields to
+the event loop, after `latency` seconds if set, as a network round trip would.
+"""
+import asyncio
+import itertools
+import operator
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, IndexModel, InsertOne, ReplaceOne, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+from geo import GridIndex, haversine_m
+
+GEO_CELL_SIZE = 0.01  # degrees, ~1.1 km
+MISSING = object()
+
+COMPARISONS = {"$gt": operator.gt, "$gte": operator.ge, "$lt": operator.lt, "$lte": operator.le}
+TYPE_NAMES = {
+    "string": (str,), "double": (float,), "int": (int,), "long": (int,), "number": (int, float),
+    "bool": (bool,), "object": (dict,), "array": (list,), "date": (datetime,), "objectId": (ObjectId,),
+    "null": (type(None),),
+}
+
+# ============ Documents ============
+
+def _copy(value):
+    """Copy of the dicts and lists in a document; leaves are immutable or treated as such"""
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+def _get(document: dict, path: str):
+    value = document
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part, MISSING)
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return MISSING
+        if value is MISSING:
+            return MISSING
+    return value
+
+def _set(document: dict, path: str, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        document = document.setdefault(part, {})
+    document[last] = value
+
+def _unset(document: dict, path: str):
+    *parents, last = path.split(".")
+    for part in parents:
+        document = document.get(part)
+        if not isinstance(document, dict):
+            return
+    document.pop(last, None)
+
+def _hashable(value):
+    """Key for a unique index entry; a missing field indexes as null"""
+    if value is MISSING:
+        return None
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
+def _project(document: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return _copy(document)
+    included = {field for field, flag in projection.items() if flag}
+    if included:
+        # Inclusion projection: _id comes along unless excluded
+        keep_id = projection.get("_id", 1)
+        return {
+            field: _copy(value) for field, value in document.items()
+            if (field == "_id" and keep_id) or (field != "_id" and field in included)
+        }
+    excluded = {field for field, flag in projection.items() if not flag}
+    return {field: _copy(value) for field, value in document.items() if field not in excluded}
+
+def _sort_key(value):
+    # Missing and null sort before everything else, as in MongoDB
+    return (0, 0) if value is MISSING or value is None else (1, value)
+
+def _sorted(documents: List[dict], spec: List[Tuple[str, int]]) -> List[dict]:
+    documents = list(documents)
+    for field, direction in reversed(spec):
+        documents.sort(key=lambda document: _sort_key(_get(document, field)), reverse=direction < 0)
+    return documents
+
+# ============ Geometry ============
+
+def _point(value) -> Optional[Tuple[float, float]]:
+    """(lat, lng) of a GeoJSON point or a legacy [lng, lat] pair"""
+    if isinstance(value, dict) and value.get("type") == "Point":
+        value = value.get("coordinates")
+    if isinstance(value, (list, tuple)) and len(value) == 2:
+        return float(value[1]), float(value[0])
+    return None
+
+def _polygon_ring(geo_within: dict) -> List[List[float]]:
+    geometry = geo_within.get("$geometry") if isinstance(geo_within, dict) else None
+    if not isinstance(geometry, dict) or geometry.get("type") != "Polygon":
+        raise OperationFailure("Only $geoWithin with a GeoJSON Polygon $geometry is supported")
+    return geometry["coordinates"][0]
+
+def _ring_box(ring: List[List[float]]) -> Tuple[float, float, float, float]:
+    lats = [lat for _, lat in ring]
+    lngs = [lng for lng, _ in ring]
+    return min(lats), min(lngs), max(lats), max(lngs)
+
+def _in_ring(latitude: float, longitude: float, ring: List[List[float]]) -> bool:
+    """Even-odd test in plain lng/lat, which is close enough for city-sized polygons"""
+    inside = False
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:]):
+        if (y1 > latitude) != (y2 > latitude) and longitude < x1 + (latitude - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+    return inside
+
+# ============ Filters ============
+
+def _is_operators(condition) -> bool:
+    return isinstance(condition, dict) and bool(condition) and all(key.startswith("$") for key in condition)
+
+def _equals(value, target) -> bool:
+    if target is None:
+        return value is MISSING or value is None
+    if value is MISSING:
+        return False
+    if isinstance(value, list) and not isinstance(target, list):
+        return target in value
+    return value == target
+
+def _has_type(value, name) -> bool:
+    types = TYPE_NAMES.get(name)
+    if types is None:
+        raise OperationFailure(f"Unsupported $type: {name}")
+    if isinstance(value, bool) and bool not in types:
+        return False
+    return isinstance(value, types)
+
+def _apply_operator(value, op: str, argument) -> bool:
+    if op == "$eq":
+        return _equals(value, argument)
+    if op == "$ne":
+        return not _equals(value, argument)
+    if op == "$in":
+        return any(_equals(value, item) for item in argument)
+    if op == "$nin":
+        return not any(_equals(value, item) for item in argument)
+    if op == "$exists":
+        return (value is not MISSING) == bool(argument)
+    if op == "$type":
+        return value is not MISSING and _has_type(value, argument)
+    if op == "$not":
+        return not _match_field(value, argument)
+    if op in COMPARISONS:
+        if value is MISSING or value is None:
+            return False
+        try:
+            return COMPARISONS[op](value, argument)
+        except TypeError:
+            return False
+    if op == "$geoWithin":
+        point = _point(value)
+        return point is not None and _in_ring(point[0], point[1], _polygon_ring(argument))
+    raise OperationFailure(f"unknown operator: {op}")
+
+def _match_field(value, condition) -> bool:
+    if not _is_operators(condition):
+        return _equals(value, condition)
+    return all(_apply_operator(value, op, argument) for op, argument in condition.items())
+
+def matches(document: dict, query: dict) -> bool:
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(matches(document, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(document, clause) for clause in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(document, clause) for clause in condition):
+                return False
+        elif not _match_field(_get(document, key), condition):
+            return False
+    return True
+
+# ============ Updates ============
+
+def _add(values: list):
+    if any(value is None for value in values):
+        return None
+    moments = [value for value in values if isinstance(value, datetime)]
+    numbers = sum(value for value in values if not isinstance(value, datetime))
+    if moments:
+        # Dates plus numbers are dates, the numbers being milliseconds
+        return moments[0] + timedelta(milliseconds=numbers)
+    return numbers
+
+def _evaluate(expression, document: dict):
+    if isinstance(expression, str) and expression.startswith("$") and not expression.startswith("$$"):
+        value = _get(document, expression[1:])
+        return None if value is MISSING else value
+    if isinstance(expression, list):
+        return [_evaluate(item, document) for item in expression]
+    if isinstance(expression, dict):
+        if len(expression) == 1 and next(iter(expression)).startswith("$"):
+            op, arguments = next(iter(expression.items()))
+            if op == "$literal":
+                return arguments
+            if op == "$add":
+                return _add([_evaluate(argument, document) for argument in arguments])
+            raise OperationFailure(f"Unsupported expression: {op}")
+        return {key: _evaluate(value, document) for key, value in expression.items()}
+    return expression
+
+def _apply_update(document: dict, update, inserting: bool = False) -> dict:
+    updated = _copy(document)
+    if isinstance(update, list):
+        for stage in update:
+            (name, spec), = stage.items()
+            if name in ("$set", "$addFields"):
+                values = {path: _evaluate(expression, updated) for path, expression in spec.items()}
+                for path, value in values.items():
+                    _set(updated, path, value)
+            elif name == "$unset":
+                for path in [spec] if isinstance(spec, str) else spec:
+                    _unset(updated, path)
+            else:
+                raise OperationFailure(f"Unsupported update pipeline stage: {name}")
+        return updated
+    if not update or not all(key.startswith("$") for key in update):
+        raise ValueError("update only works with $ operators")
+    for op, fields in update.items():
+        for path, value in fields.items():
+            if op == "$set" or (op == "$setOnInsert" and inserting):
+                _set(updated, path, _copy(value))
+            elif op == "$unset":
+                _unset(updated, path)
+            elif op == "$inc":
+                current = _get(updated, path)
+                _set(updated, path, (0 if current is MISSING else current) + value)
+            elif op == "$push":
+                current = _get(updated, path)
+                _set(updated, path, ([] if current is MISSING else list(current)) + [_copy(value)])
+            elif op != "$setOnInsert":
+                raise OperationFailure(f"Unknown modifier: {op}")
+    return updated
+
+def _with_id(document: dict) -> dict:
+    """The document with _id first, as MongoDB stores it"""
+    document_id = document.pop("_id", MISSING)
+    return {"_id": ObjectId() if document_id is MISSING else document_id, **document}
+
+class UniqueIndex:
+    """Unique index on one or more fields, optionally limited by a partialFilterExpression"""
+
+    def __init__(self, name: str, fields: Tuple[str, ...], partial: Optional[dict] = None):
+        self.name = name
+        self.fields = fields
+        self.partial = partial
+        self.entries: Dict[tuple, Any] = {}
+
+    def key(self, document: dict) -> Optional[tuple]:
+        """Index key of a document, None if the partial filter leaves it out"""
+        if self.partial is not None and not matches(document, self.partial):
+            return None
+        return tuple(_hashable(_get(document, field)) for field in self.fields)
+
+    def duplicate(self, collection: str, key: tuple) -> DuplicateKeyError:
+        shown = ", ".join(f"{field}: {value!r}" for field, value in zip(self.fields, key))
+        return DuplicateKeyError(
+            f"E11000 duplicate key error collection: {collection} index: {self.name} dup key: {{ {shown} }}", 11000
+        )
+
+# ============ Cursors ============
+
+class MemoryCursor:
+    """AsyncIOMotorCursor look-alike over a snapshot taken when the first batch is fetched"""
+
+    def __init__(self, collection: "MemoryCollection", fetch: Callable[[], List[dict]],
+                 projection: Optional[dict] = None, copy: bool = True):
+        self.collection = collection
+        self._fetch = fetch
+        self._projection = projection
+        self._copy = copy
+        self._sort: List[Tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+        self._results: Optional[Iterator[dict]] = None
+
+    def sort(self, key, direction: int = 1) -> "MemoryCursor":
+        self._sort = [(key, direction)] if isinstance(key, str) else list(key)
+        return self
+
+    def skip(self, count: int) -> "MemoryCursor":
+        self._skip = count
+        return self
+
+    def limit(self, count: int) -> "MemoryCursor":
+        self._limit = abs(count)
+        return self
+
+    def batch_size(self, count: int) -> "MemoryCursor":
+        return self
+
+    def _start(self) -> Iterator[dict]:
+        if self._results is None:
+            documents = self._fetch()
+            if self._sort:
+                documents = _sorted(documents, self._sort)
+            documents = documents[self._skip:]
+            if self._limit:
+                documents = documents[:self._limit]
+            if self._copy:
+                documents = (_project(document, self._projection) for document in documents)
+            self._results = iter(documents)
+        return self._results
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        await self.collection.database.roundtrip()
+        results = self._start()
+        return list(results if length is None else itertools.islice(results, length))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        if self._results is None:
+            await self.collection.database.roundtrip()
+        try:
+            return next(self._start())
+        except StopIteration:
+            raise StopAsyncIteration
+
+# ============ Collections ============
+
+class MemoryCollection:
+    def __init__(self, database: "MemoryDatabase", name: str):
+        self.database = database
+        self.name = name
+        self.full_name = f"{database.name}.{name}"
+        self.documents: Dict[Any, dict] = {}
+        self.indexes: Dict[str, dict] = {"_id_": {"key": {"_id": 1}}}
+        self.unique: List[UniqueIndex] = []
+        # 2dsphere indexes: field -> grid of _ids
+        self.geo: Dict[str, GridIndex] = {}
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    # ---- index maintenance ----
+
+    def _check_unique(self, document: dict, replacing: Any = MISSING):
+        for index in self.unique:
+            key = index.key(document)
+            if key is None:
+                continue
+            owner = index.entries.get(key, MISSING)
+            if owner is not MISSING and owner != replacing:
+                raise index.duplicate(self.full_name, key)
+
+    def _index(self, document: dict):
+        for index in self.unique:
+            key = index.key(document)
+            if key is not None:
+                index.entries[key] = document["_id"]
+        for field, grid in self.geo.items():
+            point = _point(_get(document, field))
+            if point is not None:
+                grid.insert(document["_id"], point[0], point[1])
+
+    def _unindex(self, document: dict):
+        for index in self.unique:
+            key = index.key(document)
+            if key is not None and index.entries.get(key, MISSING) == document["_id"]:
+                del index.entries[key]
+        for grid in self.geo.values():
+            grid.remove(document["_id"])
+
+    def _insert(self, document: dict):
+        if document["_id"] in self.documents:
+            raise DuplicateKeyError(
+                f"E11000 duplicate key error collection: {self.full_name} index: _id_ "
+                f"dup key: {{ _id: {document['_id']!r} }}", 11000
+            )
+        self._check_unique(document)
+        self.documents[document["_id"]] = document
+        self._index(document)
+
+    def _replace(self, previous: dict, document: dict):
+        if document["_id"] != previous["_id"]:
+            raise OperationFailure("Performing an update on the path '_id' would modify the immutable field '_id'")
+        self._check_unique(document, replacing=previous["_id"])
+        self._unindex(previous)
+        self.documents[document["_id"]] = document
+        self._index(document)
+
+    def _delete(self, document: dict):
+        self._unindex(document)
+        del self.documents[document["_id"]]
+
+    # ---- query planning ----
+
+    def _geo_boxes(self, query: dict, field: str) -> Optional[List[Tuple[float, float, float, float]]]:
+        """Boxes that together contain every match, when the query confines `field` to polygons"""
+        condition = query.get(field)
+        if isinstance(condition, dict) and "$geoWithin" in condition:
+            return [_ring_box(_polygon_ring(condition["$geoWithin"]))]
+        clauses = query.get("$or")
+        if clauses:
+            boxes = []
+            for clause in clauses:
+                narrowed = self._geo_boxes(clause, field) if len(clause) == 1 else None
+                if narrowed is None:
+                    return None
+                boxes.extend(narrowed)
+            return boxes
+        return None
+
+    def _candidates(self, query: dict) -> List[dict]:
+        """Stored documents that may match, narrowed through an index when the query allows"""
+        condition = query.get("_id", MISSING)
+        if condition is not MISSING and not _is_operators(condition):
+            document = self.documents.get(condition)
+            return [] if document is None else [document]
+        for index in self.unique:
+            if len(index.fields) != 1 or index.partial is not None:
+                continue
+            condition = query.get(index.fields[0], MISSING)
+            if condition is not MISSING and condition is not None and not _is_operators(condition):
+                document_id = index.entries.get((_hashable(condition),), MISSING)
+                return [] if document_id is MISSING else [self.documents[document_id]]
+        for field, grid in self.geo.items():
+            boxes = self._geo_boxes(query, field)
+            if boxes is not None:
+                found = {}
+                for box in boxes:
+                    for document_id, _ in grid.within_bbox(*box):
+                        found[document_id] = self.documents[document_id]
+                return list(found.values())
+        return list(self.documents.values())
+
+    def _find(self, query: Optional[dict]) -> List[dict]:
+        query = query or {}
+        return [document for document in self._candidates(query) if matches(document, query)]
+
+    def _geo_near(self, spec: dict) -> List[dict]:
+        field = spec.get("key")
+        if field is None:
+            if len(self.geo) != 1:
+                raise OperationFailure(
+                    f"$geoNear requires exactly one 2dsphere index on {self.full_name} unless `key` is given"
+                )
+            field = next(iter(self.geo))
+        grid = self.geo.get(field)
+        if grid is None:
+            raise OperationFailure(f"$geoNear found no 2dsphere index on {self.full_name}.{field}")
+        latitude, longitude = _point(spec["near"])
+        max_distance = spec.get("maxDistance")
+        min_distance = spec.get("minDistance", 0.0)
+        if max_distance is None:
+            ranked = []
+            for document_id in grid.positions:
+                lat, lng, _ = grid.get(document_id)
+                ranked.append((haversine_m(latitude, longitude, lat, lng), document_id))
+            ranked.sort(key=lambda item: item[0])
+        else:
+            ranked = [(distance, document_id) for distance, document_id, _ in
+                      grid.within_radius(latitude, longitude, max_distance)]
+        query = spec.get("query") or {}
+        results = []
+        for distance, document_id in ranked:
+            document = self.documents[document_id]
+            if distance >= min_distance and matches(document, query):
+                document = _copy(document)
+                _set(document, spec["distanceField"], distance)
+                results.append(document)
+        return results
+
+    def _aggregate(self, pipeline: List[dict]) -> List[dict]:
+        stages = list(pipeline)
+        if stages and "$geoNear" in stages[0]:
+            documents = self._geo_near(stages.pop(0)["$geoNear"])
+        else:
+            documents = [_copy(document) for document in self.documents.values()]
+        for stage in stages:
+            (name, spec), = stage.items()
+            if name == "$match":
+                documents = [document for document in documents if matches(document, spec)]
+            elif name == "$sort":
+                documents = _sorted(documents, list(spec.items()))
+            elif name == "$skip":
+                documents = documents[spec:]
+            elif name == "$limit":
+                documents = documents[:spec]
+            elif name == "$project":
+                documents = [_project(document, spec) for document in documents]
+            elif name == "$count":
+                documents = [{spec: len(documents)}]
+            elif name == "$geoNear":
+                raise OperationFailure("$geoNear is only valid as the first stage in a pipeline")
+            else:
+                raise OperationFailure(f"Unsupported aggregation stage: {name}")
+        return documents
+
+    # ---- writes ----
+
+    def _update(self, query: dict, update, upsert: bool, multi: bool) -> dict:
+        matched = modified = 0
+        for document in self._candidates(query):
+            if not matches(document, query):
+                continue
+            matched += 1
+            updated = _apply_update(document, update)
+            if updated != document:
+                self._replace(document, updated)
+                modified += 1
+            if not multi:
+                break
+        result = {"n": matched, "nModified": modified, "ok": 1.0}
+        if not matched and upsert:
+            seed = {key: _copy(value) for key, value in query.items()
+                    if not key.startswith("$") and not _is_operators(value)}
+            document = _with_id(_apply_update(seed, update, inserting=True))
+            self._insert(document)
+            result.update(n=1, upserted=document["_id"])
+        return result
+
+    def _replace_one(self, query: dict, replacement: dict, upsert: bool) -> dict:
+        for document in self._candidates(query):
+            if matches(document, query):
+                updated = {"_id": document["_id"], **{k: _copy(v) for k, v in replacement.items() if k != "_id"}}
+                self._replace(document, updated)
+                return {"n": 1, "nModified": int(updated != document), "ok": 1.0}
+        if upsert:
+            document = _with_id(_copy(replacement))
+            if "_id" not in replacement and "_id" in query and not _is_operators(query["_id"]):
+                document["_id"] = query["_id"]
+            self._insert(document)
+            return {"n": 1, "nModified": 0, "upserted": document["_id"], "ok": 1.0}
+        return {"n": 0, "nModified": 0, "ok": 1.0}
+
+    def _delete_matching(self, query: dict, multi: bool) -> int:
+        deleted = 0
+        for document in self._candidates(query or {}):
+            if matches(document, query or {}):
+                self._delete(document)
+                deleted += 1
+                if not multi:
+                    break
+        return deleted
+
+    def _insert_new(self, document: dict) -> Any:
+        """insert_one semantics: an _id is added to the caller's document"""
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        self._insert(_with_id(_copy(document)))
+        return document["_id"]
+
+    # ---- Motor API ----
+
+    async def insert_one(self, document: dict, **kwargs) -> InsertOneResult:
+        await self.database.roundtrip()
+        return InsertOneResult(self._insert_new(document), True)
+
+    async def insert_many(self, documents, ordered: bool = True, **kwargs) -> InsertManyResult:
+        await self.database.roundtrip()
+        inserted, errors = [], []
+        for index, document in enumerate(documents):
+            try:
+                inserted.append(self._insert_new(document))
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e), "op": document})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({
+                "writeErrors": errors, "writeConcernErrors": [], "nInserted": len(inserted),
+                "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": [],
+            })
+        return InsertManyResult(inserted, True)
+
+    async def find_one(self, filter: Optional[dict] = None, projection: Optional[dict] = None, **kwargs):
+        await self.database.roundtrip()
+        for document in self._candidates(filter or {}):
+            if matches(document, filter or {}):
+                return _project(document, projection)
+        return None
+
+    async def find_one_and_update(self, filter: dict, update, projection: Optional[dict] = None,
+                                  upsert: bool = False, return_document: bool = ReturnDocument.BEFORE, **kwargs):
+        await self.database.roundtrip()
+        for document in self._candidates(filter):
+            if matches(document, filter):
+                updated = _apply_update(document, update)
+                if updated != document:
+                    self._replace(document, updated)
+                return _project(updated if return_document else document, projection)
+        if upsert:
+            self._update(filter, update, True, multi=False)
+            if return_document:
+                return _project(self._find(filter)[0], projection)
+        return None
+
+    def find(self, filter: Optional[dict] = None, projection: Optional[dict] = None, **kwargs) -> MemoryCursor:
+        return MemoryCursor(self, lambda: self._find(filter), projection)
+
+    def aggregate(self, pipeline: List[dict], **kwargs) -> MemoryCursor:
+        return MemoryCursor(self, lambda: self._aggregate(pipeline), copy=False)
+
+    async def count_documents(self, filter: dict, **kwargs) -> int:
+        await self.database.roundtrip()
+        return len(self._find(filter))
+
+    async def estimated_document_count(self, **kwargs) -> int:
+        await self.database.roundtrip()
+        return len(self.documents)
+
+    async def update_one(self, filter: dict, update, upsert: bool = False, **kwargs) -> UpdateResult:
+        await self.database.roundtrip()
+        return UpdateResult(self._update(filter, update, upsert, multi=False), True)
+
+    async def update_many(self, filter: dict, update, upsert: bool = False, **kwargs) -> UpdateResult:
+        await self.database.roundtrip()
+        return UpdateResult(self._update(filter, update, upsert, multi=True), True)
+
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        await self.database.roundtrip()
+        return UpdateResult(self._replace_one(filter, replacement, upsert), True)
+
+    async def delete_one(self, filter: dict, **kwargs) -> DeleteResult:
+        await self.database.roundtrip()
+        return DeleteResult({"n": self._delete_matching(filter, multi=False), "ok": 1.0}, True)
+
+    async def delete_many(self, filter: dict, **kwargs) -> DeleteResult:
+        await self.database.roundtrip()
+        return DeleteResult({"n": self._delete_matching(filter, multi=True), "ok": 1.0}, True)
+
+    async def bulk_write(self, requests, ordered: bool = True, **kwargs) -> BulkWriteResult:
+        await self.database.roundtrip()
+        result = {
+            "writeErrors": [], "writeConcernErrors": [], "nInserted": 0, "nUpserted": 0,
+            "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": [],
+        }
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    self._insert_new(request._doc)
+                    result["nInserted"] += 1
+                    continue
+                if isinstance(request, (DeleteOne, DeleteMany)):
+                    result["nRemoved"] += self._delete_matching(request._filter, isinstance(request, DeleteMany))
+                    continue
+                if isinstance(request, ReplaceOne):
+                    outcome = self._replace_one(request._filter, request._doc, request._upsert)
+                elif isinstance(request, (UpdateOne, UpdateMany)):
+                    outcome = self._update(request._filter, request._doc, request._upsert, isinstance(request, UpdateMany))
+                else:
+                    raise TypeError(f"Unsupported bulk operation: {request!r}")
+            except DuplicateKeyError as e:
+                result["writeErrors"].append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+                continue
+            if "upserted" in outcome:
+                result["nUpserted"] += 1
+                result["upserted"].append({"index": index, "_id": outcome["upserted"]})
+            else:
+                result["nMatched"] += outcome["n"]
+                result["nModified"] += outcome["nModified"]
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    async def create_indexes(self, indexes: List[IndexModel], **kwargs) -> List[str]:
+        await self.database.roundtrip()
+        names = []
+        for model in indexes:
+            spec = model.document
+            keys = list(spec["key"].items())
+            field, kind = keys[0]
+            if kind == "2dsphere" and field not in self.geo:
+                grid = GridIndex(cell_size=GEO_CELL_SIZE)
+                for document in self.documents.values():
+                    point = _point(_get(document, field))
+                    if point is not None:
+                        grid.insert(document["_id"], point[0], point[1])
+                self.geo[field] = grid
+            if spec.get("unique") and spec["name"] not in self.indexes:
+                index = UniqueIndex(spec["name"], tuple(name for name, _ in keys), spec.get("partialFilterExpression"))
+                for document in self.documents.values():
+                    key = index.key(document)
+                    if key is None:
+                        continue
+                    if key in index.entries:
+                        raise index.duplicate(self.full_name, key)
+                    index.entries[key] = document["_id"]
+                self.unique.append(index)
+            self.indexes[spec["name"]] = spec
+            names.append(spec["name"])
+        return names
+
+    async def create_index(self, keys, **kwargs) -> str:
+        return (await self.create_indexes([IndexModel(keys, **kwargs)]))[0]
+
+    async def index_information(self) -> Dict[str, dict]:
+        await self.database.roundtrip()
+        return {name: dict(spec) for name, spec in self.indexes.items()}
+
+    async def drop(self):
+        await self.database.drop_collection(self.name)
+
+class MemoryDatabase:
+    def __init__(self, name: str, latency: float = 0.0):
+        self.name = name
+        self.latency = latency
+        self.collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        collection = self.collections.get(name)
+        if collection is None:
+            collection = self.collections[name] = MemoryCollection(self, name)
+        return collection
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name: str) -> MemoryCollection:
+        return self[name]
+
+    async def roundtrip(self):
+        await asyncio.sleep(self.latency)
+
+    async def command(self, command, **kwargs) -> dict:
+        await self.roundtrip()
+        name = command if isinstance(command, str) else next(iter(command))
+        if name in ("ping", "hello", "isMaster", "ismaster"):
+            return {"ok": 1.0}
+        raise OperationFailure(f"no such command: '{name}'")
+
+    async def list_collection_names(self, **kwargs) -> List[str]:
+        await self.roundtrip()
+        return list(self.collections)
+
+    async def drop_collection(self, name: str):
+        await self.roundtrip()
+        self.collections.pop(name, None)
+
+class MemoryClient:
+    """AsyncIOMotorClient look-alike; databases are created on first access"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.databases: Dict[str, MemoryDatabase] = {}
+        # There is no pool, so nothing to warm (read by server.provision_database)
+        self.options = SimpleNamespace(pool_options=SimpleNamespace(min_pool_size=0, max_pool_size=1))
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        database = self.databases.get(name)
+        if database is None:
+            database = self.databases[name] = MemoryDatabase(name, self.latency)
+        return database
+
+    def __getattr__(self, name: str) -> MemoryDatabase:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_database(self, name: str) -> MemoryDatabase:
+        return self[name]
+
+    async def drop_database(self, name: str):
+        self.databases.pop(name, None)
+
+    def close(self):
+        pass
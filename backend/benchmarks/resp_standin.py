@@ -0,0 +1,84 @@
+"""Minimal RESP pub/sub server for exercising RedisBroker without Redis.
+
+Supports PING, AUTH, SUBSCRIBE, UNSUBSCRIBE and PUBLISH, which is all the
+broker uses.
+
+Run from backend/:  python -m benchmarks.resp_standin --port 6399
+"""
+import argparse
+import asyncio
+from typing import Dict, Set
+
+from broker import read_reply
+
+def _array(*parts) -> bytes:
+    out = [b"*%d\r\n" % len(parts)]
+    for part in parts:
+        if isinstance(part, int):
+            out.append(b":%d\r\n" % part)
+        else:
+            out.append(b"$%d\r\n%s\r\n" % (len(part), part))
+    return b"".join(out)
+
+class RespStandin:
+    def __init__(self):
+        self.channels: Dict[bytes, Set[asyncio.StreamWriter]] = {}
+        self.server = None
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        subscribed: Set[bytes] = set()
+        try:
+            while True:
+                command = await read_reply(reader)
+                if not isinstance(command, list) or not command:
+                    break
+                name = command[0].upper()
+                if name == b"PING":
+                    writer.write(b"+PONG\r\n")
+                elif name == b"AUTH":
+                    writer.write(b"+OK\r\n")
+                elif name == b"SUBSCRIBE":
+                    for channel in command[1:]:
+                        self.channels.setdefault(channel, set()).add(writer)
+                        subscribed.add(channel)
+                        writer.write(_array(b"subscribe", channel, len(subscribed)))
+                elif name == b"UNSUBSCRIBE":
+                    for channel in command[1:] or list(subscribed):
+                        self.channels.get(channel, set()).discard(writer)
+                        subscribed.discard(channel)
+                        writer.write(_array(b"unsubscribe", channel, len(subscribed)))
+                elif name == b"PUBLISH":
+                    channel, data = command[1], command[2]
+                    receivers = self.channels.get(channel, set())
+                    frame = _array(b"message", channel, data)
+                    for receiver in list(receivers):
+                        receiver.write(frame)
+                    writer.write(b":%d\r\n" % len(receivers))
+                else:
+                    writer.write(b"-ERR unknown command\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for channel in subscribed:
+                self.channels.get(channel, set()).discard(writer)
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+async def main(port: int):
+    standin = RespStandin()
+    bound = await standin.start(port=port)
+    print(f"RESP stand-in listening on 127.0.0.1:{bound}")
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=6399)
+    asyncio.run(main(parser.parse_args().port))
@@ -0,0 +1,255 @@
+"""Synthetic cities for benchmarks and load tests.
+
+A city is a handful of districts of different sizes and densities, plus a
+thin uniform background:
+- Locations cluster around district centres (normally distributed, with a
+  dense downtown). Newer districts more often have ramps, elevators and
+  smooth step-free access.
+- Barriers mostly lie along the streets joining neighbouring districts.
+- Alerts sit next to barriers and are still active when the city is
+  generated.
+Everything is derived from the seed, so the same arguments always give
+the same city.
+
+Documents are shaped the way the API stores them, with ids, the GeoJSON
+`location`, scores and expiry filled in, ready for insert_many. Run from
+backend/ to write NDJSON that `python -m ingest` and the /bulk endpoints
+accept:
+    python -m benchmarks.synthetic_city --locations 20000 --barriers 5000 --out /tmp/city
+"""
+import argparse
+import json
+import math
+import random
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from alerts import ALERT_LIFETIMES, default_expiry
+from geo import METERS_PER_DEGREE_LAT, haversine_m
+from scoring import sanchara_score
+
+# Midtown Manhattan, where the app's demo data is
+DEFAULT_CENTER = (40.758896, -73.985130)
+DEFAULT_RADIUS = 8000.0  # meters
+BACKGROUND_SHARE = 0.1  # of locations spread uniformly over the whole city
+STREET_BARRIER_SHARE = 0.7  # of barriers on streets; the rest around district centres
+STREET_JITTER = 12.0  # meters either side of a street
+
+PLACE_KINDS = ("Cafe", "Library", "Pharmacy", "Station", "Museum", "Clinic", "Market", "Park", "Bank", "Cinema")
+STREET_NAMES = ("Main", "Oak", "Park", "Church", "Mill", "River", "Station", "Market", "Hill", "Lake")
+BARRIER_TYPES = (("pothole", 4), ("missing_ramp", 3), ("stairs", 2), ("construction", 2), ("curb", 3))
+SEVERITIES = (("low", 5), ("medium", 3), ("high", 2))
+INCLINES = ("low", "moderate", "high")
+
+def offset(latitude: float, longitude: float, north: float, east: float) -> Tuple[float, float]:
+    """Point `north` and `east` meters away (flat-earth, fine at city scale)"""
+    return (
+        latitude + north / METERS_PER_DEGREE_LAT,
+        longitude + east / (METERS_PER_DEGREE_LAT * math.cos(math.radians(latitude))),
+    )
+
+def weighted(rng: random.Random, choices) -> str:
+    values, weights = zip(*choices)
+    return rng.choices(values, weights=weights)[0]
+
+def random_id(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+def geo_point(latitude: float, longitude: float) -> dict:
+    return {"type": "Point", "coordinates": [longitude, latitude]}
+
+class District:
+    def __init__(self, latitude: float, longitude: float, spread: float, weight: float, modern: float):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.spread = spread  # meters, standard deviation of the location cluster
+        self.weight = weight  # share of the clustered locations
+        self.modern = modern  # 0..1, how likely places are to be accessible
+
+    def sample(self, rng: random.Random) -> Tuple[float, float]:
+        return offset(self.latitude, self.longitude, rng.gauss(0.0, self.spread), rng.gauss(0.0, self.spread))
+
+class City:
+    def __init__(self, center: Tuple[float, float], radius: float, districts: List[District],
+                 streets: List[Tuple[District, District]]):
+        self.center = center
+        self.radius = radius
+        self.districts = districts
+        self.streets = streets
+        self.locations: List[dict] = []
+        self.barriers: List[dict] = []
+        self.alerts: List[dict] = []
+        self.user_ids: List[str] = []
+
+    def uniform_point(self, rng: random.Random) -> Tuple[float, float]:
+        distance = self.radius * math.sqrt(rng.random())
+        angle = rng.uniform(0.0, 2 * math.pi)
+        return offset(self.center[0], self.center[1], distance * math.cos(angle), distance * math.sin(angle))
+
+    def district(self, rng: random.Random) -> District:
+        return rng.choices(self.districts, weights=[d.weight for d in self.districts])[0]
+
+    def busy_point(self, rng: random.Random) -> Tuple[float, float]:
+        """Somewhere people are likely to be: distributed like the locations"""
+        if rng.random() < BACKGROUND_SHARE:
+            return self.uniform_point(rng)
+        return self.district(rng).sample(rng)
+
+    def street_point(self, rng: random.Random) -> Tuple[float, float]:
+        a, b = rng.choice(self.streets)
+        t = rng.random()
+        latitude = a.latitude + t * (b.latitude - a.latitude)
+        longitude = a.longitude + t * (b.longitude - a.longitude)
+        return offset(latitude, longitude, rng.gauss(0.0, STREET_JITTER), rng.gauss(0.0, STREET_JITTER))
+
+    def summary(self) -> dict:
+        return {
+            "center": list(self.center), "radius": self.radius, "districts": len(self.districts),
+            "locations": len(self.locations), "barriers": len(self.barriers), "alerts": len(self.alerts),
+        }
+
+def layout(rng: random.Random, center: Tuple[float, float], radius: float, districts: int) -> City:
+    """Districts (a dense downtown first) joined by streets to their two nearest neighbours"""
+    placed = [District(center[0], center[1], 0.08 * radius, 1.0, rng.uniform(0.5, 0.9))]
+    for rank in range(1, districts):
+        distance = radius * rng.uniform(0.2, 0.85)
+        angle = rng.uniform(0.0, 2 * math.pi)
+        latitude, longitude = offset(center[0], center[1], distance * math.cos(angle), distance * math.sin(angle))
+        placed.append(District(
+            latitude, longitude, radius * rng.uniform(0.03, 0.12),
+            1.0 / (rank + 1) ** 0.8, rng.random()
+        ))
+    streets = {}
+    for district in placed:
+        neighbours = sorted(
+            (other for other in placed if other is not district),
+            key=lambda other: haversine_m(district.latitude, district.longitude, other.latitude, other.longitude)
+        )
+        for other in neighbours[:2]:
+            pair = tuple(sorted((placed.index(district), placed.index(other))))
+            streets[pair] = (placed[pair[0]], placed[pair[1]])
+    return City(center, radius, placed, list(streets.values()) or [(placed[0], placed[0])])
+
+def make_location(rng: random.Random, latitude: float, longitude: float, modern: float, number: int,
+                  created_at: datetime) -> dict:
+    location = {
+        "id": random_id(rng),
+        "name": f"{rng.choice(PLACE_KINDS)} {number}",
+        "latitude": latitude,
+        "longitude": longitude,
+        "address": f"{rng.randint(1, 999)} {rng.choice(STREET_NAMES)} St",
+        "sanchara_score": 5.0,
+        "has_ramp": rng.random() < 0.15 + 0.6 * modern,
+        "has_elevator": rng.random() < 0.05 + 0.5 * modern,
+        "has_stairs": rng.random() < 0.85 - 0.5 * modern,
+        "surface_type": "smooth" if rng.random() < 0.3 + 0.5 * modern else "rough",
+        "incline_level": rng.choices(INCLINES, weights=(1 + 3 * modern, 3, 2 - modern))[0],
+        "description": "Accessible entrance at the side" if rng.random() < 0.2 else None,
+        "created_at": created_at,
+    }
+    location["sanchara_score"] = sanchara_score(location)
+    location["location"] = geo_point(latitude, longitude)
+    return location
+
+def make_barrier(rng: random.Random, latitude: float, longitude: float, user_id: str, created_at: datetime) -> dict:
+    barrier_type = weighted(rng, BARRIER_TYPES)
+    return {
+        "id": random_id(rng),
+        "user_id": user_id,
+        "latitude": latitude,
+        "longitude": longitude,
+        "barrier_type": barrier_type,
+        "severity": weighted(rng, SEVERITIES),
+        "description": f"{barrier_type.replace('_', ' ').capitalize()} reported",
+        "photo_url": None,
+        "thumbnail_url": None,
+        "ai_classification": None,
+        "verified": rng.random() < 0.3,
+        "created_at": created_at,
+        "location": geo_point(latitude, longitude),
+    }
+
+def make_alert(rng: random.Random, latitude: float, longitude: float, now: datetime) -> dict:
+    alert_type = rng.choice(sorted(ALERT_LIFETIMES))
+    # Somewhere in the first 90% of its lifetime, so it is still active
+    created_at = now - ALERT_LIFETIMES[alert_type] * rng.uniform(0.0, 0.9)
+    return {
+        "id": random_id(rng),
+        "latitude": latitude,
+        "longitude": longitude,
+        "alert_type": alert_type,
+        "message": f"{alert_type.replace('_', ' ').capitalize()} ahead",
+        "severity": weighted(rng, SEVERITIES),
+        "radius": rng.choice((50.0, 100.0, 200.0)),
+        "created_at": created_at,
+        "expires_at": default_expiry(alert_type, created_at),
+        "location": geo_point(latitude, longitude),
+    }
+
+def generate_city(locations: int = 10000, barriers: int = 2000, alerts: int = 200, seed: int = 1,
+                  center: Tuple[float, float] = DEFAULT_CENTER, radius: float = DEFAULT_RADIUS,
+                  districts: int = 12, users: int = 500, now: Optional[datetime] = None) -> City:
+    rng = random.Random(seed)
+    now = now or datetime.utcnow()
+    city = layout(rng, center, radius, max(1, districts))
+    city.user_ids = [random_id(rng) for _ in range(max(1, users))]
+
+    for number in range(locations):
+        if rng.random() < BACKGROUND_SHARE:
+            (latitude, longitude), modern = city.uniform_point(rng), rng.random() * 0.5
+        else:
+            district = city.district(rng)
+            (latitude, longitude), modern = district.sample(rng), district.modern
+        created_at = now - timedelta(days=rng.uniform(0, 730))
+        city.locations.append(make_location(rng, latitude, longitude, modern, number, created_at))
+
+    for _ in range(barriers):
+        if rng.random() < STREET_BARRIER_SHARE:
+            latitude, longitude = city.street_point(rng)
+        else:
+            latitude, longitude = city.district(rng).sample(rng)
+        created_at = now - timedelta(days=rng.uniform(0, 90))
+        city.barriers.append(make_barrier(rng, latitude, longitude, rng.choice(city.user_ids), created_at))
+
+    for _ in range(alerts):
+        if city.barriers:
+            near = rng.choice(city.barriers)
+            latitude, longitude = offset(near["latitude"], near["longitude"], rng.gauss(0.0, 30.0), rng.gauss(0.0, 30.0))
+        else:
+            latitude, longitude = city.busy_point(rng)
+        city.alerts.append(make_alert(rng, latitude, longitude, now))
+    return city
+
+async def insert_city(db, city: City, batch_size: int = 1000):
+    """Load a city into `db` (Motor or the in-memory stand-in), before the indexes are built"""
+    for name, documents in (("locations", city.locations), ("barriers", city.barriers), ("alerts", city.alerts)):
+        for start in range(0, len(documents), batch_size):
+            await db[name].insert_many([dict(document) for document in documents[start:start + batch_size]])
+
+def write_ndjson(city: City, directory: Path):
+    directory.mkdir(parents=True, exist_ok=True)
+    for name, documents in (("locations", city.locations), ("barriers", city.barriers), ("alerts", city.alerts)):
+        with open(directory / f"{name}.ndjson", "w") as out:
+            for document in documents:
+                row = {key: value for key, value in document.items() if key != "location"}
+                out.write(json.dumps(row, default=lambda value: value.isoformat()) + "\n")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--locations", type=int, default=10000)
+    parser.add_argument("--barriers", type=int, default=2000)
+    parser.add_argument("--alerts", type=int, default=200)
+    parser.add_argument("--districts", type=int, default=12)
+    parser.add_argument("--radius", type=float, default=DEFAULT_RADIUS, help="meters")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", type=Path, required=True, help="directory for the NDJSON files")
+    args = parser.parse_args()
+    city = generate_city(args.locations, args.barriers, args.alerts, args.seed,
+                         radius=args.radius, districts=args.districts)
+    write_ndjson(city, args.out)
+    print(json.dumps(city.summary()))
+
+if __name__ == "__main__":
+    main()
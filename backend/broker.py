@@ -0,0 +1,304 @@
+"""Pub/sub transports that carry alert broadcasts between server processes.
+
+A message is published as opaque bytes. It is delivered to the local handler
+right away and buffered for the other processes; buffered messages are sent
+as one length-prefixed batch per flush (BATCH_DELAY or BATCH_BYTES,
+whichever comes first). Every batch carries the publishing process's origin
+id, so a process never handles its own messages twice.
+
+Backends:
+- InProcessBroker: single process, nothing leaves the process.
+- UnixSocketBroker: workers on one host; each binds a datagram socket in a
+  shared directory and sends batches to every peer socket found there.
+- RedisBroker: any number of hosts, over PUBLISH/SUBSCRIBE on one channel
+  with a minimal RESP client (works with Redis or any RESP stand-in).
+"""
+import asyncio
+import glob
+import logging
+import os
+import socket
+import struct
+import uuid
+from typing import Callable, List, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+BATCH_DELAY = 0.005  # seconds
+BATCH_BYTES = 60000  # stays under the default AF_UNIX datagram limit
+ORIGIN_BYTES = 16
+FRAME_HEADER = struct.Struct(">I")
+
+Handler = Callable[[bytes], None]
+
+class BrokerError(Exception):
+    pass
+
+def encode_batch(origin: bytes, messages: List[bytes]) -> bytes:
+    parts = [origin]
+    for message in messages:
+        parts.append(FRAME_HEADER.pack(len(message)))
+        parts.append(message)
+    return b"".join(parts)
+
+def decode_batch(batch: bytes):
+    """(origin, [messages]) from a batch built by encode_batch"""
+    origin = batch[:ORIGIN_BYTES]
+    messages = []
+    offset = ORIGIN_BYTES
+    while offset < len(batch):
+        (length,) = FRAME_HEADER.unpack_from(batch, offset)
+        offset += FRAME_HEADER.size
+        messages.append(batch[offset:offset + length])
+        offset += length
+    return origin, messages
+
+class Broker:
+    """Local delivery plus batched forwarding; subclasses implement the transport"""
+
+    # False for transports with no other processes to forward to
+    forwards = True
+
+    def __init__(self, batch_delay: float = BATCH_DELAY, batch_bytes: int = BATCH_BYTES):
+        self.origin = uuid.uuid4().bytes
+        self.batch_delay = batch_delay
+        self.batch_bytes = batch_bytes
+        self.handler: Optional[Handler] = None
+        self.pending: List[bytes] = []
+        self.pending_bytes = 0
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self.sending: set = set()
+        self.published = 0
+        self.received = 0
+        self.batches_sent = 0
+
+    async def start(self, handler: Handler):
+        self.handler = handler
+        await self.connect()
+
+    def publish(self, message: bytes):
+        """Deliver locally now and queue for the other processes"""
+        self.published += 1
+        self.handler(message)
+        if not self.forwards:
+            return
+        self.pending.append(message)
+        self.pending_bytes += len(message) + FRAME_HEADER.size
+        if self.pending_bytes >= self.batch_bytes:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(self.batch_delay, self.flush)
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if not self.pending:
+            return
+        batch = encode_batch(self.origin, self.pending)
+        self.pending = []
+        self.pending_bytes = 0
+        self.batches_sent += 1
+        task = asyncio.get_running_loop().create_task(self.send_batch(batch))
+        self.sending.add(task)
+        task.add_done_callback(self.sending.discard)
+
+    def receive_batch(self, batch: bytes):
+        """Hand every message of a peer's batch to the local handler"""
+        try:
+            origin, messages = decode_batch(batch)
+        except struct.error:
+            logger.warning("Discarding malformed broker batch (%d bytes)", len(batch))
+            return
+        if origin == self.origin:
+            return
+        for message in messages:
+            self.received += 1
+            self.handler(message)
+
+    async def close(self):
+        self.flush()
+        if self.sending:
+            await asyncio.gather(*self.sending, return_exceptions=True)
+        await self.disconnect()
+
+    # Transport hooks
+
+    async def connect(self):
+        pass
+
+    async def send_batch(self, batch: bytes):
+        raise NotImplementedError
+
+    async def disconnect(self):
+        pass
+
+class InProcessBroker(Broker):
+    forwards = False
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, broker: "UnixSocketBroker"):
+        self.broker = broker
+
+    def datagram_received(self, data: bytes, addr):
+        self.broker.receive_batch(data)
+
+    def error_received(self, exc: Exception):
+        logger.warning("Unix broker receive error: %s", exc)
+
+class UnixSocketBroker(Broker):
+    """Peers are the *.sock files in a shared directory, one per process"""
+
+    def __init__(self, directory: str, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}-{self.origin.hex()[:8]}.sock")
+        self.transport = None
+        self.sender: Optional[socket.socket] = None
+
+    async def connect(self):
+        os.makedirs(self.directory, exist_ok=True)
+        receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        receiver.bind(self.path)
+        receiver.setblocking(False)
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(lambda: _DatagramProtocol(self), sock=receiver)
+        self.sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sender.setblocking(False)
+
+    def peers(self) -> List[str]:
+        return [path for path in glob.glob(os.path.join(self.directory, "*.sock")) if path != self.path]
+
+    async def send_batch(self, batch: bytes):
+        for peer in self.peers():
+            try:
+                self.sender.sendto(batch, peer)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The process behind this socket is gone
+                try:
+                    os.unlink(peer)
+                except OSError:
+                    pass
+            except BlockingIOError:
+                logger.warning("Unix broker peer %s is not draining; batch dropped", peer)
+
+    async def disconnect(self):
+        if self.transport is not None:
+            self.transport.close()
+        if self.sender is not None:
+            self.sender.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+def encode_command(*parts: bytes) -> bytes:
+    out = [b"*%d\r\n" % len(parts)]
+    for part in parts:
+        out.append(b"$%d\r\n%s\r\n" % (len(part), part))
+    return b"".join(out)
+
+async def read_reply(reader: asyncio.StreamReader):
+    """One RESP2 reply"""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("connection closed")
+    prefix, body = line[:1], line[1:-2]
+    if prefix == b"+":
+        return body
+    if prefix == b"-":
+        raise BrokerError(body.decode(errors="replace"))
+    if prefix == b":":
+        return int(body)
+    if prefix == b"$":
+        length = int(body)
+        if length < 0:
+            return None
+        return (await reader.readexactly(length + 2))[:-2]
+    if prefix == b"*":
+        length = int(body)
+        if length < 0:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise BrokerError(f"unexpected RESP prefix {prefix!r}")
+
+class RedisBroker(Broker):
+    """PUBLISH/SUBSCRIBE on one channel; reconnects with backoff"""
+
+    def __init__(self, url: str, channel: str = "sanchara:alerts", **kwargs):
+        super().__init__(**kwargs)
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.channel = channel.encode()
+        self.publisher = None
+        self.publish_lock = asyncio.Lock()
+        self.subscriber_task: Optional[asyncio.Task] = None
+        self.subscribed = asyncio.Event()
+
+    async def _open(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            writer.write(encode_command(b"AUTH", self.password.encode()))
+            await read_reply(reader)
+        return reader, writer
+
+    async def connect(self):
+        self.subscriber_task = asyncio.get_running_loop().create_task(self._subscribe_forever())
+        await asyncio.wait_for(self.subscribed.wait(), timeout=10)
+
+    async def _subscribe_forever(self):
+        delay = 0.1
+        while True:
+            try:
+                reader, writer = await self._open()
+                writer.write(encode_command(b"SUBSCRIBE", self.channel))
+                await writer.drain()
+                await read_reply(reader)
+                self.subscribed.set()
+                delay = 0.1
+                while True:
+                    reply = await read_reply(reader)
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                        self.receive_batch(reply[2])
+            except asyncio.CancelledError:
+                raise
+            except (OSError, ConnectionError, BrokerError, asyncio.IncompleteReadError) as exc:
+                logger.warning("Redis broker subscription lost (%s); retrying in %.1fs", exc, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+
+    async def send_batch(self, batch: bytes):
+        async with self.publish_lock:
+            for attempt in range(2):
+                try:
+                    if self.publisher is None:
+                        self.publisher = await self._open()
+                    reader, writer = self.publisher
+                    writer.write(encode_command(b"PUBLISH", self.channel, batch))
+                    await writer.drain()
+                    await read_reply(reader)
+                    return
+                except (OSError, ConnectionError, BrokerError, asyncio.IncompleteReadError) as exc:
+                    self.publisher = None
+                    if attempt:
+                        logger.warning("Redis broker publish failed, batch dropped: %s", exc)
+
+    async def disconnect(self):
+        if self.subscriber_task is not None:
+            self.subscriber_task.cancel()
+        if self.publisher is not None:
+            self.publisher[1].close()
+            self.publisher = None
+
+def create_broker(kind: str = "memory", path: Optional[str] = None, url: Optional[str] = None) -> Broker:
+    """Broker for ALERT_BROKER=memory|unix|redis"""
+    if kind == "unix":
+        return UnixSocketBroker(path or "/tmp/sanchara-alerts")
+    if kind == "redis":
+        return RedisBroker(url or "redis://localhost:6379")
+    if kind == "memory":
+        return InProcessBroker()
+    raise ValueError(f"Unknown alert broker: {kind}")
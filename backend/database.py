@@ -0,0 +1,148 @@
+"""MongoDB client settings, index provisioning and pool warm-up.
+
+Every index the API relies on is declared in INDEXES and ensured at
+startup, one index at a time. create_indexes is a no-op for indexes that
+already exist, so this is safe on every boot and from every worker.
+
+Fields older documents lack (GeoJSON `location`, alert expires_at, barrier
+report_count) are backfilled by a one-off migration rather than at every
+boot, since each backfill scans a whole collection. Run it once after
+upgrading, from backend/:
+    python -m database
+
+Pool size and timeouts come from the environment:
+    MONGO_MAX_POOL_SIZE            (default 100)
+    MONGO_MIN_POOL_SIZE            (default 10, also the connections opened at startup)
+    MONGO_MAX_IDLE_TIME_MS         (default 300000)
+    MONGO_CONNECT_TIMEOUT_MS       (default 5000)
+    MONGO_SERVER_SELECTION_TIMEOUT_MS (default 5000)
+    MONGO_SOCKET_TIMEOUT_MS        (default none)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS    (default none)
+"""
+import asyncio
+import json
+import logging
+import os
+from datetime import timedelta
+from typing import Dict, List
+
+from pymongo import ASCENDING, GEOSPHERE, IndexModel
+from pymongo.errors import OperationFailure
+
+from alerts import ALERT_LIFETIMES, DEFAULT_ALERT_LIFETIME
+
+logger = logging.getLogger(__name__)
+
+POOL_SETTINGS = {
+    "maxPoolSize": ("MONGO_MAX_POOL_SIZE", 100),
+    "minPoolSize": ("MONGO_MIN_POOL_SIZE", 10),
+    "maxIdleTimeMS": ("MONGO_MAX_IDLE_TIME_MS", 300000),
+    "connectTimeoutMS": ("MONGO_CONNECT_TIMEOUT_MS", 5000),
+    "serverSelectionTimeoutMS": ("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+    "socketTimeoutMS": ("MONGO_SOCKET_TIMEOUT_MS", None),
+    "waitQueueTimeoutMS": ("MONGO_WAIT_QUEUE_TIMEOUT_MS", None),
+}
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("username", ASCENDING)], unique=True),
+    ],
+    "locations": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("location", GEOSPHERE), ("sanchara_score", ASCENDING)]),
+    ],
+    "barriers": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("location", GEOSPHERE)]),
+        # One barrier per type and merge cell (see barriers.py); bulk-imported barriers have no cell
+        IndexModel(
+            [("barrier_type", ASCENDING), ("cell", ASCENDING)],
+            unique=True, partialFilterExpression={"cell": {"$exists": True}}
+        ),
+    ],
+    "alerts": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("location", GEOSPHERE)]),
+        # Documents are removed by MongoDB once expires_at has passed
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "routes": [
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+}
+
+def mongo_client_options() -> dict:
+    """AsyncIOMotorClient keyword arguments from the MONGO_* environment"""
+    options = {}
+    for option, (variable, default) in POOL_SETTINGS.items():
+        value = os.environ.get(variable)
+        value = int(value) if value else default
+        if value is not None:
+            options[option] = value
+    return options
+
+async def ensure_indexes(db) -> List[str]:
+    """Create any missing index; returns "collection.index" for each index that could not be built.
+
+    Indexes are created one at a time, so duplicate legacy values under a
+    unique index do not keep the 2dsphere and TTL indexes from being built.
+    """
+    failed = []
+    for collection, indexes in INDEXES.items():
+        for index in indexes:
+            name = index.document["name"]
+            try:
+                await db[collection].create_indexes([index])
+            except OperationFailure as e:
+                # Typically duplicate values under a unique index: lookups by that key scan instead
+                logger.error("Could not create index %s on %s: %s", name, collection, e)
+                failed.append(f"{collection}.{name}")
+    return failed
+
+async def warm_pool(db, connections: int):
+    """Open `connections` pooled connections now, so the first requests do not pay for the handshakes"""
+    if connections > 0:
+        await asyncio.gather(*(db.command("ping") for _ in range(connections)))
+
+# ============ Migration ============
+
+async def backfill_legacy_fields(db) -> Dict[str, int]:
+    """Add the fields documents stored before they existed lack; returns documents changed per collection"""
+    changed = {}
+    for collection in (db.locations, db.barriers, db.alerts):
+        result = await collection.update_many(
+            {"location": {"$exists": False}, "latitude": {"$exists": True}},
+            [{"$set": {"location": {"type": "Point", "coordinates": ["$longitude", "$latitude"]}}}]
+        )
+        changed[collection.name] = result.modified_count
+    for alert_type, lifetime in ALERT_LIFETIMES.items():
+        result = await db.alerts.update_many(
+            {"expires_at": None, "alert_type": alert_type},
+            [{"$set": {"expires_at": {"$add": ["$created_at", lifetime // timedelta(milliseconds=1)]}}}]
+        )
+        changed["alerts"] += result.modified_count
+    result = await db.alerts.update_many(
+        {"expires_at": None},
+        [{"$set": {"expires_at": {"$add": ["$created_at", DEFAULT_ALERT_LIFETIME // timedelta(milliseconds=1)]}}}]
+    )
+    changed["alerts"] += result.modified_count
+    result = await db.barriers.update_many(
+        {"report_count": {"$exists": False}},
+        [{"$set": {"report_count": 1, "last_reported_at": "$created_at"}}]
+    )
+    changed["barriers"] += result.modified_count
+    return changed
+
+async def migrate(db) -> dict:
+    changed = await backfill_legacy_fields(db)
+    return {"backfilled": changed, "index_failures": await ensure_indexes(db)}
+
+def main():
+    # The server module owns the database settings
+    import server
+
+    print(json.dumps(asyncio.run(migrate(server.db))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import math
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Tuple
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE_LAT = 111320.0
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance in meters"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+def radius_to_degrees(latitude: float, radius: float) -> Tuple[float, float]:
+    """Half-widths (dlat, dlng) in degrees of the box enclosing a circle of `radius` meters"""
+    dlat = radius / METERS_PER_DEGREE_LAT
+    cos_lat = math.cos(math.radians(min(89.0, abs(latitude))))
+    dlng = min(180.0, radius / (METERS_PER_DEGREE_LAT * cos_lat))
+    return dlat, dlng
+
+class GridIndex:
+    """Uniform lat/lng bucket grid for radius and bounding-box lookups.
+
+    Each entry lives in exactly one cell, so inserts, moves and removes are O(1)
+    and a lookup only visits the cells overlapping the query box. Longitudes
+    wrap at the antimeridian.
+    """
+
+    def __init__(self, cell_size: float = 0.01):
+        self.cell_size = cell_size
+        self.columns = max(1, int(round(360.0 / cell_size)))
+        self.cells: Dict[Tuple[int, int], Dict[Hashable, Tuple[float, float, Any]]] = {}
+        self.positions: Dict[Hashable, Tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.positions
+
+    def cell_of(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        row = int(math.floor((latitude + 90.0) / self.cell_size))
+        column = int(math.floor((longitude + 180.0) / self.cell_size)) % self.columns
+        return row, column
+
+    def insert(self, key: Hashable, latitude: float, longitude: float, value: Any = None):
+        """Add an entry, or move it if the key is already indexed"""
+        cell = self.cell_of(latitude, longitude)
+        previous = self.positions.get(key)
+        if previous is not None and previous != cell:
+            self._drop(key, previous)
+        self.cells.setdefault(cell, {})[key] = (latitude, longitude, value)
+        self.positions[key] = cell
+
+    def remove(self, key: Hashable) -> bool:
+        cell = self.positions.pop(key, None)
+        if cell is None:
+            return False
+        self._drop(key, cell)
+        return True
+
+    def get(self, key: Hashable) -> Optional[Tuple[float, float, Any]]:
+        cell = self.positions.get(key)
+        if cell is None:
+            return None
+        return self.cells[cell][key]
+
+    def _drop(self, key: Hashable, cell: Tuple[int, int]):
+        bucket = self.cells.get(cell)
+        if bucket is not None:
+            bucket.pop(key, None)
+            if not bucket:
+                del self.cells[cell]
+
+    def _cells_in_box(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> Iterator[Dict]:
+        first_row, first_column = self.cell_of(max(-90.0, min_lat), min_lng)
+        last_row, _ = self.cell_of(min(90.0, max_lat), max_lng)
+        span = int(math.floor((max_lng + 180.0) / self.cell_size)) - int(math.floor((min_lng + 180.0) / self.cell_size))
+        span = min(span, self.columns - 1)
+        for row in range(first_row, last_row + 1):
+            for offset in range(span + 1):
+                bucket = self.cells.get((row, (first_column + offset) % self.columns))
+                if bucket:
+                    yield bucket
+
+    def within_bbox(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> List[Tuple[Hashable, Any]]:
+        """Entries inside the box; min_lng > max_lng means the box crosses the antimeridian"""
+        if min_lng > max_lng:
+            max_lng += 360.0
+        results = []
+        for bucket in self._cells_in_box(min_lat, min_lng, max_lat, max_lng):
+            for key, (lat, lng, value) in bucket.items():
+                if not min_lat <= lat <= max_lat:
+                    continue
+                if lng < min_lng:
+                    lng += 360.0
+                if lng <= max_lng:
+                    results.append((key, value))
+        return results
+
+    def within_radius(self, latitude: float, longitude: float, radius: float) -> List[Tuple[float, Hashable, Any]]:
+        """(distance, key, value) for entries within `radius` meters, nearest first"""
+        dlat, dlng = radius_to_degrees(latitude, radius)
+        results = []
+        for bucket in self._cells_in_box(latitude - dlat, longitude - dlng, latitude + dlat, longitude + dlng):
+            for key, (lat, lng, value) in bucket.items():
+                distance = haversine_m(latitude, longitude, lat, lng)
+                if distance <= radius:
+                    results.append((distance, key, value))
+        results.sort(key=lambda item: item[0])
+        return results
+
+# ============ Polylines and corridors ============
+
+def _project(latitude: float, longitude: float, origin_lat: float, origin_lng: float) -> Tuple[float, float]:
+    """Local equirectangular projection in meters around an origin"""
+    x = (longitude - origin_lng) * METERS_PER_DEGREE_LAT * math.cos(math.radians(origin_lat))
+    y = (latitude - origin_lat) * METERS_PER_DEGREE_LAT
+    return x, y
+
+def _unproject(x: float, y: float, origin_lat: float, origin_lng: float) -> Tuple[float, float]:
+    latitude = origin_lat + y / METERS_PER_DEGREE_LAT
+    longitude = origin_lng + x / (METERS_PER_DEGREE_LAT * math.cos(math.radians(origin_lat)))
+    return latitude, longitude
+
+def _segment_distance(px: float, py: float, ax: float, ay: float, bx: float, by: float) -> float:
+    dx, dy = bx - ax, by - ay
+    length_sq = dx * dx + dy * dy
+    t = 0.0 if length_sq == 0 else max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length_sq))
+    return math.hypot(px - ax - t * dx, py - ay - t * dy)
+
+def distance_to_polyline_m(latitude: float, longitude: float, polyline: List[Tuple[float, float]]) -> float:
+    """Shortest distance in meters from a point to a (lat, lng) polyline"""
+    if len(polyline) == 1:
+        return haversine_m(latitude, longitude, *polyline[0])
+    points = [_project(lat, lng, latitude, longitude) for lat, lng in polyline]
+    return min(
+        _segment_distance(0.0, 0.0, ax, ay, bx, by)
+        for (ax, ay), (bx, by) in zip(points, points[1:])
+    )
+
+def simplify_polyline(polyline: List[Tuple[float, float]], tolerance: float) -> List[Tuple[float, float]]:
+    """Douglas-Peucker simplification; no dropped vertex is further than `tolerance` meters away"""
+    if len(polyline) < 3:
+        return list(polyline)
+    origin_lat, origin_lng = polyline[0]
+    points = [_project(lat, lng, origin_lat, origin_lng) for lat, lng in polyline]
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        farthest, farthest_distance = None, tolerance
+        for i in range(first + 1, last):
+            distance = _segment_distance(*points[i], *points[first], *points[last])
+            if distance > farthest_distance:
+                farthest, farthest_distance = i, distance
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return [point for point, kept in zip(polyline, keep) if kept]
+
+def corridor_polygons(polyline: List[Tuple[float, float]], buffer: float, max_segment: float = 2000.0) -> List[dict]:
+    """GeoJSON rectangles that together cover every point within `buffer` meters of the polyline.
+
+    Each segment gets a rectangle extended by `buffer` past both ends, so the
+    round caps at the joints are covered too. Long segments are split so the
+    geodesic rectangle edges stay close to the planar ones.
+    """
+    polygons = []
+    for (a_lat, a_lng), (b_lat, b_lng) in zip(polyline, polyline[1:] or polyline):
+        bx, by = _project(b_lat, b_lng, a_lat, a_lng)
+        length = math.hypot(bx, by)
+        pieces = max(1, int(math.ceil(length / max_segment)))
+        ux, uy = (bx / length, by / length) if length else (1.0, 0.0)
+        nx, ny = -uy, ux
+        for piece in range(pieces):
+            start, end = length * piece / pieces - buffer, length * (piece + 1) / pieces + buffer
+            corners = [
+                (ux * start + nx * buffer, uy * start + ny * buffer),
+                (ux * end + nx * buffer, uy * end + ny * buffer),
+                (ux * end - nx * buffer, uy * end - ny * buffer),
+                (ux * start - nx * buffer, uy * start - ny * buffer),
+            ]
+            ring = []
+            for x, y in corners:
+                lat, lng = _unproject(x, y, a_lat, a_lng)
+                ring.append([lng, lat])
+            ring.append(ring[0])
+            polygons.append({"type": "Polygon", "coordinates": [ring]})
+    return polygons
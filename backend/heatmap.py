@@ -0,0 +1,199 @@
+"""Pre-aggregated accessibility heatmap tiles.
+
+Every location is folded into one cell per served zoom level as it is
+inserted, so serving a slippy-map tile is a dictionary lookup. Each tile at
+zoom z holds a CELLS_PER_SIDE x CELLS_PER_SIDE grid of cells (count, mean
+and min sanchara_score), and its encoded body and ETag are cached until the
+next insert lands in it.
+
+Every worker keeps its own tiles. New locations are published on the
+broker's "heatmap" topic and folded in by every worker, so they all serve
+the same counts and ETags.
+
+LiveHeatmap builds the tiles from the database in a background task, so a
+worker reports ready without waiting for the scan, and swaps the finished
+tiles in with one assignment; until the first build is done there are no
+tiles to serve. Points published during a build are held back and folded
+in at the end if they were created after the scan started, so none is
+missed or counted twice.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import math
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from geo import radius_to_degrees
+
+MIN_ZOOM = 8
+MAX_ZOOM = 15
+CELL_SHIFT = 4  # 16 x 16 cells per tile
+CELLS_PER_SIDE = 1 << CELL_SHIFT
+MAX_LATITUDE = 85.05112878
+EARTH_CIRCUMFERENCE_M = 40075016.686
+
+BUILD_YIELD_EVERY = 1000  # locations folded between yields to the event loop
+
+logger = logging.getLogger(__name__)
+
+TileKey = Tuple[int, int, int]
+
+def lat_lng_to_tile_xy(latitude: float, longitude: float, zoom: int) -> Tuple[float, float]:
+    """Fractional Web Mercator tile coordinates"""
+    latitude = max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude))
+    scale = 1 << zoom
+    x = (longitude + 180.0) / 360.0 * scale
+    phi = math.radians(latitude)
+    y = (1.0 - math.log(math.tan(phi) + 1.0 / math.cos(phi)) / math.pi) / 2.0 * scale
+    return min(max(x, 0.0), scale - 1e-9), min(max(y, 0.0), scale - 1e-9)
+
+def tile_xy_to_lat_lng(x: float, y: float, zoom: int) -> Tuple[float, float]:
+    scale = 1 << zoom
+    longitude = x / scale * 360.0 - 180.0
+    latitude = math.degrees(math.atan(math.sinh(math.pi * (1.0 - 2.0 * y / scale))))
+    return latitude, longitude
+
+def zoom_for_radius(latitude: float, radius: float) -> int:
+    """Zoom at which a tile is about as wide as the viewport radius"""
+    width = EARTH_CIRCUMFERENCE_M * math.cos(math.radians(min(MAX_LATITUDE, abs(latitude))))
+    zoom = int(math.floor(math.log2(width / max(radius, 1.0))))
+    return max(MIN_ZOOM, min(MAX_ZOOM, zoom))
+
+class HeatmapTiles:
+    """Incrementally maintained per-cell score aggregates for zooms MIN_ZOOM..MAX_ZOOM"""
+
+    def __init__(self):
+        # tile -> {(column, row) within tile: [count, total score, min score]}
+        self.tiles: Dict[TileKey, Dict[Tuple[int, int], List[float]]] = {}
+        # tile -> (etag, encoded body, points); dropped whenever the tile changes
+        self.encoded: Dict[TileKey, Tuple[str, bytes, List[dict]]] = {}
+
+    def add(self, latitude: float, longitude: float, score: float):
+        for zoom in range(MIN_ZOOM, MAX_ZOOM + 1):
+            x, y = lat_lng_to_tile_xy(latitude, longitude, zoom + CELL_SHIFT)
+            cell_x, cell_y = int(x), int(y)
+            key = (zoom, cell_x >> CELL_SHIFT, cell_y >> CELL_SHIFT)
+            cells = self.tiles.setdefault(key, {})
+            cell = (cell_x & (CELLS_PER_SIDE - 1), cell_y & (CELLS_PER_SIDE - 1))
+            aggregate = cells.get(cell)
+            if aggregate is None:
+                cells[cell] = [1, score, score]
+            else:
+                aggregate[0] += 1
+                aggregate[1] += score
+                if score < aggregate[2]:
+                    aggregate[2] = score
+            self.encoded.pop(key, None)
+
+    def clear(self):
+        self.tiles.clear()
+        self.encoded.clear()
+
+    def cells(self, zoom: int, x: int, y: int) -> List[dict]:
+        """Heatmap points (cell centers with aggregates) for one tile"""
+        points = []
+        for (column, row), (count, total, minimum) in self.tiles.get((zoom, x, y), {}).items():
+            latitude, longitude = tile_xy_to_lat_lng(
+                (x * CELLS_PER_SIDE + column + 0.5) / CELLS_PER_SIDE,
+                (y * CELLS_PER_SIDE + row + 0.5) / CELLS_PER_SIDE,
+                zoom
+            )
+            mean = total / count
+            points.append({
+                "latitude": latitude,
+                "longitude": longitude,
+                "score": round(mean, 2),
+                "intensity": round(mean / 10.0, 3),
+                "count": count,
+                "min_score": minimum,
+            })
+        return points
+
+    def tile(self, zoom: int, x: int, y: int) -> Tuple[str, bytes, List[dict]]:
+        """(ETag, JSON body, points) for a tile, built once per change"""
+        key = (zoom, x, y)
+        cached = self.encoded.get(key)
+        if cached is None:
+            points = self.cells(zoom, x, y)
+            body = json.dumps({"z": zoom, "x": x, "y": y, "heatmap": points}).encode()
+            cached = (f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"', body, points)
+            self.encoded[key] = cached
+        return cached
+
+    def tiles_for_viewport(self, latitude: float, longitude: float, radius: float, zoom: Optional[int] = None) -> List[TileKey]:
+        """Tiles covering the box of `radius` meters around a point"""
+        zoom = zoom_for_radius(latitude, radius) if zoom is None else zoom
+        dlat, dlng = radius_to_degrees(latitude, radius)
+        min_x, min_y = lat_lng_to_tile_xy(latitude + dlat, longitude - dlng, zoom)
+        max_x, max_y = lat_lng_to_tile_xy(latitude - dlat, longitude + dlng, zoom)
+        return [
+            (zoom, x, y)
+            for x in range(int(min_x), int(max_x) + 1)
+            for y in range(int(min_y), int(max_y) + 1)
+        ]
+
+class LiveHeatmap:
+    """The tiles a worker serves, rebuilt from the database in the background and replaced whole"""
+
+    PROJECTION = {"_id": 0, "latitude": 1, "longitude": 1, "sanchara_score": 1}
+
+    def __init__(self):
+        self.tiles: Optional[HeatmapTiles] = None  # None until the first build has finished
+        # Points published while a build runs: (latitude, longitude, score, created_at)
+        self.backlog: Optional[List[Tuple[float, float, float, Optional[datetime]]]] = None
+        self.task: Optional[asyncio.Task] = None
+        self.builds = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.tiles is not None
+
+    def add(self, latitude: float, longitude: float, score: float, created_at: Optional[datetime] = None):
+        if self.tiles is not None:
+            self.tiles.add(latitude, longitude, score)
+        if self.backlog is not None:
+            self.backlog.append((latitude, longitude, score, created_at))
+
+    async def build(self, collection):
+        """Fold every stored location into new tiles, then serve those"""
+        self.backlog = []
+        started = datetime.utcnow()
+        tiles = HeatmapTiles()
+        folded = 0
+        cursor = collection.find({"created_at": {"$not": {"$gte": started}}}, self.PROJECTION)
+        async for loc in cursor.batch_size(5000):
+            tiles.add(loc["latitude"], loc["longitude"], loc.get("sanchara_score", 5.0))
+            folded += 1
+            if folded % BUILD_YIELD_EVERY == 0:
+                await asyncio.sleep(0)
+        # The scan skipped what was created after it started; those arrived as points
+        for latitude, longitude, score, created_at in self.backlog:
+            if created_at is not None and created_at >= started:
+                tiles.add(latitude, longitude, score)
+        self.backlog = None
+        self.tiles = tiles
+        self.builds += 1
+        logger.info("Heatmap built from %d locations", folded)
+
+    def rebuild(self, collection) -> asyncio.Task:
+        """Start a build in the background, replacing one still running; the current tiles serve meanwhile"""
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+        self.task = asyncio.get_running_loop().create_task(self._run(collection))
+        return self.task
+
+    async def _run(self, collection):
+        try:
+            await self.build(collection)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Building the heatmap failed")
+            if self.task is asyncio.current_task():
+                self.backlog = None
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
@@ -0,0 +1,199 @@
+"""Bulk NDJSON ingestion for locations and barriers.
+
+Input is consumed a chunk at a time and written in batches with unordered
+insert_many, and the next batch is only read once the previous one is
+stored, so memory depends on the batch size and not on the file size. A bad
+row (invalid JSON, failed validation, a rejected write) is reported with
+its line number and the rest of the stream carries on.
+
+Also a CLI that writes straight to MongoDB with the server's settings, run
+from backend/:
+    python -m ingest locations survey.ndjson
+    python -m ingest barriers reports.ndjson.gz --batch-size 2000
+Errors are printed one JSON object per line; a summary goes to stderr.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import sys
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+
+BATCH_SIZE = 1000
+MAX_LINE_BYTES = 1024 * 1024
+MAX_REPORTED_ERRORS = 1000  # per HTTP response; the counts always cover every row
+READ_CHUNK = 1024 * 1024
+
+Prepare = Callable[[dict], Awaitable[dict]]
+
+async def ndjson_lines(chunks: AsyncIterator[bytes], max_line: int = MAX_LINE_BYTES) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """(line number, raw line) for every non-blank line; a line longer than max_line comes back as None"""
+    buffer = bytearray()
+    line_no = 0
+    oversized = False
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if end < 0:
+                if not oversized:
+                    buffer += chunk[start:]
+                    if len(buffer) > max_line:
+                        oversized = True
+                        buffer.clear()
+                break
+            line_no += 1
+            if not oversized:
+                buffer += chunk[start:end]
+            if oversized or len(buffer) > max_line:
+                yield line_no, None
+            elif buffer.strip():
+                yield line_no, bytes(buffer)
+            buffer.clear()
+            oversized = False
+            start = end + 1
+    if oversized:
+        yield line_no + 1, None
+    elif buffer.strip():
+        yield line_no + 1, bytes(buffer)
+
+def describe(exc: Exception) -> str:
+    if isinstance(exc, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in error['loc']) or 'row'}: {error['msg']}"
+            for error in exc.errors()
+        )
+    return str(exc)
+
+class BulkIngest:
+    """Validate, batch and insert rows from ndjson_lines, counting and reporting failures"""
+
+    def __init__(self, collection, prepare: Prepare, batch_size: int = BATCH_SIZE,
+                 before_insert: Optional[Callable[[List[dict]], None]] = None,
+                 on_inserted: Optional[Callable[[dict], None]] = None,
+                 after_batch: Optional[Callable[[List[dict]], None]] = None):
+        """`on_inserted` is called for every stored document, `after_batch` once per batch with all of them"""
+        self.collection = collection
+        self.prepare = prepare
+        self.batch_size = batch_size
+        self.before_insert = before_insert
+        self.on_inserted = on_inserted
+        self.after_batch = after_batch
+        self.lines = 0
+        self.inserted = 0
+        self.failed = 0
+
+    def summary(self) -> Dict[str, int]:
+        return {"lines": self.lines, "inserted": self.inserted, "failed": self.failed}
+
+    def _error(self, line_no: int, detail: str) -> dict:
+        self.failed += 1
+        return {"line": line_no, "error": detail}
+
+    async def run(self, lines: AsyncIterator[Tuple[int, Optional[bytes]]]) -> AsyncIterator[dict]:
+        """Yields one {"line", "error"} dict per failed row"""
+        batch: List[dict] = []
+        batch_lines: List[int] = []
+        async for line_no, raw in lines:
+            self.lines += 1
+            if raw is None:
+                yield self._error(line_no, f"Line exceeds {MAX_LINE_BYTES} bytes")
+                continue
+            try:
+                row = json.loads(raw)
+                if not isinstance(row, dict):
+                    raise ValueError("Expected a JSON object")
+                document = await self.prepare(row)
+            except (ValueError, TypeError) as exc:
+                yield self._error(line_no, describe(exc))
+                continue
+            batch.append(document)
+            batch_lines.append(line_no)
+            if len(batch) >= self.batch_size:
+                for error in await self.flush(batch, batch_lines):
+                    yield error
+                batch, batch_lines = [], []
+        if batch:
+            for error in await self.flush(batch, batch_lines):
+                yield error
+
+    async def flush(self, batch: List[dict], batch_lines: List[int]) -> List[dict]:
+        if self.before_insert is not None:
+            self.before_insert(batch)
+        rejected: Dict[int, str] = {}
+        try:
+            await self.collection.insert_many(batch, ordered=False)
+        except BulkWriteError as exc:
+            for write_error in exc.details.get("writeErrors", []):
+                rejected[write_error["index"]] = write_error.get("errmsg", "Write failed")
+        errors = []
+        stored = []
+        for index, (document, line_no) in enumerate(zip(batch, batch_lines)):
+            if index in rejected:
+                errors.append(self._error(line_no, rejected[index]))
+                continue
+            self.inserted += 1
+            stored.append(document)
+            if self.on_inserted is not None:
+                self.on_inserted(document)
+        if stored and self.after_batch is not None:
+            self.after_batch(stored)
+        return errors
+
+    async def report(self, lines: AsyncIterator[Tuple[int, Optional[bytes]]],
+                     max_errors: int = MAX_REPORTED_ERRORS) -> Dict[str, Any]:
+        """Run to the end; the summary plus the first max_errors row errors"""
+        errors = []
+        async for error in self.run(lines):
+            if len(errors) < max_errors:
+                errors.append(error)
+        return {**self.summary(), "errors": errors, "errors_truncated": self.failed > len(errors)}
+
+async def file_chunks(path: str, size: int = READ_CHUNK) -> AsyncIterator[bytes]:
+    """Chunks of a file (gzip if it ends in .gz, stdin for -), read off the event loop"""
+    if path == "-":
+        handle = sys.stdin.buffer
+    elif path.endswith(".gz"):
+        handle = gzip.open(path, "rb")
+    else:
+        handle = open(path, "rb")
+    try:
+        while True:
+            chunk = await asyncio.to_thread(handle.read, size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        if handle is not sys.stdin.buffer:
+            handle.close()
+
+async def ingest_file(kind: str, path: str, batch_size: int) -> Dict[str, int]:
+    # The server module owns the models, scoring and database settings
+    import server
+
+    # Running workers drop their cached routes and heatmap tiles when told over the broker
+    await server.manager.use_broker(server.configured_broker())
+    try:
+        ingest = server.bulk_ingest(kind, batch_size)
+        async for error in ingest.run(ndjson_lines(file_chunks(path))):
+            print(json.dumps(error), flush=True)
+        return ingest.summary()
+    finally:
+        # Flushes the batch notices still queued in the broker
+        await server.manager.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load NDJSON locations or barriers into MongoDB")
+    parser.add_argument("kind", choices=["locations", "barriers"])
+    parser.add_argument("path", help="NDJSON file, .gz for gzip, - for stdin")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+    summary = asyncio.run(ingest_file(args.kind, args.path, args.batch_size))
+    print(json.dumps(summary), file=sys.stderr)
+    sys.exit(1 if summary["failed"] else 0)
+
+if __name__ == "__main__":
+    main()
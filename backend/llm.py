@@ -0,0 +1,170 @@
+"""LLM backends for the AI search endpoints.
+
+LLM_BACKEND selects the backend:
+- gemini (default): Gemini through emergentintegrations. The import, API
+  key and model are set up once per process, but LlmChat keeps the
+  conversation history of its session, so every call gets a new chat with
+  its own session id: no request sees another's prompts or answers.
+  The integration (and the Google/LLM stack under it) is imported on first
+  use, so workers that never answer AI searches never load it; set
+  LLM_PRELOAD=1 on dedicated AI workers to load it at startup instead.
+- fake: a local stub that streams a canned answer with configurable
+  first-token and per-token delays (FAKE_LLM_FIRST_TOKEN_MS,
+  FAKE_LLM_TOKEN_MS), for benchmarking without network access.
+
+Latency, time to first chunk and token counts go to the metrics registry
+per backend. The integration does not report token usage, so the counts
+are estimates from the text length.
+"""
+import asyncio
+import os
+import time
+import uuid
+from typing import Any, AsyncIterator, Optional
+
+from metrics import LLM_BUCKETS, REGISTRY
+
+SYSTEM_MESSAGE = """You are an accessibility assistant for Sanchara app.
+Help users find accessible locations based on their needs. Consider:
+- Blind users: Need clear audio landmarks, minimal obstacles
+- Deaf users: Need visual information, good lighting
+- Wheelchair users: Need ramps, elevators, smooth surfaces, low incline
+
+Provide specific location recommendations with accessibility scores."""
+
+CHARS_PER_TOKEN = 4
+
+llm_duration = REGISTRY.histogram(
+    "llm_request_duration_seconds", "LLM answer latency by backend and outcome", ("backend", "outcome"), LLM_BUCKETS
+)
+llm_first_chunk = REGISTRY.histogram(
+    "llm_first_chunk_seconds", "Time to the first streamed chunk of an LLM answer", ("backend",), LLM_BUCKETS
+)
+llm_tokens = REGISTRY.counter(
+    "llm_tokens_total", "Estimated LLM tokens by backend and direction (prompt, completion)", ("backend", "direction")
+)
+
+class GeminiBackend:
+    name = "gemini"
+
+    model = ("gemini", "gemini-2.0-flash")
+
+    def __init__(self):
+        self.classes: Any = None
+        self.api_key: Optional[str] = None
+
+    def load(self):
+        """Import the integration; slow the first time, so call it off the event loop"""
+        if self.classes is None:
+            from emergentintegrations.llm.chat import LlmChat, UserMessage
+            self.classes = (LlmChat, UserMessage)
+            self.api_key = os.environ['EMERGENT_LLM_KEY']
+        return self.classes
+
+    def new_chat(self):
+        """A chat with a session of its own; sessions keep history, so they are never shared"""
+        LlmChat, _ = self.load()
+        return LlmChat(
+            api_key=self.api_key,
+            session_id=f"search_{uuid.uuid4()}",
+            system_message=SYSTEM_MESSAGE
+        ).with_model(*self.model)
+
+    async def complete(self, prompt: str) -> str:
+        if self.classes is None:
+            await asyncio.to_thread(self.load)
+        _, UserMessage = self.classes
+        return await self.new_chat().send_message(UserMessage(text=prompt))
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        # The chat client returns whole answers, so the stream is a single chunk
+        yield await self.complete(prompt)
+
+class FakeBackend:
+    name = "fake"
+
+    def __init__(self, first_token_ms: float = 400.0, token_ms: float = 20.0):
+        self.first_token = first_token_ms / 1000.0
+        self.per_token = token_ms / 1000.0
+
+    def load(self):
+        pass
+
+    def answer(self, prompt: str) -> str:
+        listed = [line[2:].split(" at (")[0] for line in prompt.splitlines() if line.startswith("- ")]
+        if not listed:
+            return "I could not find accessible locations within your search radius."
+        return "Based on your needs, the most accessible options nearby are " + ", ".join(listed) + "."
+
+    async def complete(self, prompt: str) -> str:
+        chunks = [chunk async for chunk in self.stream(prompt)]
+        return "".join(chunks)
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        await asyncio.sleep(self.first_token)
+        words = self.answer(prompt).split(" ")
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(self.per_token)
+            yield word if i == 0 else " " + word
+
+def create_backend(kind: Optional[str] = None):
+    kind = kind or os.environ.get('LLM_BACKEND', 'gemini')
+    if kind == "fake":
+        return FakeBackend(
+            float(os.environ.get('FAKE_LLM_FIRST_TOKEN_MS', 400)),
+            float(os.environ.get('FAKE_LLM_TOKEN_MS', 20))
+        )
+    if kind == "gemini":
+        return GeminiBackend()
+    raise ValueError(f"Unknown LLM backend: {kind}")
+
+_backend = None
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = create_backend()
+    return _backend
+
+async def preload():
+    """Load the configured backend's dependencies now rather than on the first search"""
+    await asyncio.to_thread(get_backend().load)
+
+def estimate_tokens(characters: int) -> int:
+    return (characters + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def record(backend, outcome: str, started: float, prompt: str, answered: int):
+    llm_duration.labels(backend.name, outcome).observe(time.perf_counter() - started)
+    llm_tokens.labels(backend.name, "prompt").inc(estimate_tokens(len(prompt)))
+    llm_tokens.labels(backend.name, "completion").inc(estimate_tokens(answered))
+
+async def complete(prompt: str) -> str:
+    backend = get_backend()
+    started = time.perf_counter()
+    try:
+        response = await backend.complete(prompt)
+    except Exception:
+        record(backend, "error", started, prompt, 0)
+        raise
+    record(backend, "ok", started, prompt, len(response))
+    return response
+
+async def stream(prompt: str) -> AsyncIterator[str]:
+    backend = get_backend()
+    started = time.perf_counter()
+    # "aborted" stays if the consumer stops reading before the end
+    outcome, answered, first = "aborted", 0, True
+    try:
+        async for chunk in backend.stream(prompt):
+            if first:
+                llm_first_chunk.labels(backend.name).observe(time.perf_counter() - started)
+                first = False
+            answered += len(chunk)
+            yield chunk
+        outcome = "ok"
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        record(backend, outcome, started, prompt, answered)
@@ -0,0 +1,272 @@
+"""Prometheus metrics without a client library.
+
+Counters, gauges and histograms with labels, rendered in the text
+exposition format (0.0.4) for /metrics. An update is a dict lookup and an
+addition under a per-series lock; the lock is there because PyMongo reports
+command events from Motor's worker threads. That is cheap enough to leave
+on in production. A metric can instead take its value from a function
+called at scrape time, for numbers that are already kept elsewhere (such as
+WebSocket queue depth).
+
+Each process has its own registry. With several workers in a pod, each
+worker only reports what it served itself.
+
+MetricsMiddleware times HTTP requests per route template, method and
+status. MongoCommandMetrics is a PyMongo CommandListener that times every
+command per collection and command name.
+"""
+import bisect
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HTTP_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _number(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Value:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = float(value)
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable] = None):
+        """`function`, if given, is called at scrape time and returns the value,
+        or a dict of label-value tuples to values for a labelled metric"""
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self.children: Dict[Tuple[str, ...], object] = {}
+        # Children by the label values exactly as passed (ints, say), to skip converting them again
+        self.lookup: Dict[tuple, object] = {}
+        self.lock = threading.Lock()
+
+    def new_child(self):
+        return _Value()
+
+    def labels(self, *values):
+        child = self.lookup.get(values)
+        if child is None:
+            key = tuple(str(value) for value in values)
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {key}")
+            with self.lock:
+                child = self.children.setdefault(key, self.new_child())
+                self.lookup[values] = child
+        return child
+
+    def samples(self) -> List[Tuple[str, Tuple[str, ...], str, float]]:
+        """(name suffix, label values, extra label, value) for every series"""
+        if self.function is not None:
+            values = self.function()
+            if not isinstance(values, dict):
+                values = {(): values}
+            return [("", tuple(str(v) for v in key), "", value) for key, value in values.items()]
+        return [("", key, "", child.value) for key, child in list(self.children.items())]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {_escape(self.documentation)}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_label_text(self.labelnames, key, extra)} {_number(value)}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = HTTP_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.bounds = tuple(sorted(buckets)) + (math.inf,)
+
+    def new_child(self):
+        return _Buckets(self.bounds)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def samples(self):
+        samples = []
+        for key, child in list(self.children.items()):
+            with child.lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.bounds, counts):
+                cumulative += count
+                samples.append(("_bucket", key, f'le="{_number(bound)}"', cumulative))
+            samples.append(("_sum", key, "", total))
+            samples.append(("_count", key, "", cumulative))
+        return samples
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        """Add a metric; registering a name again returns the metric already there"""
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                if existing.kind != metric.kind:
+                    raise ValueError(f"{metric.name} is already registered as a {existing.kind}")
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                function: Optional[Callable] = None) -> Counter:
+        return self.register(Counter(name, documentation, labelnames, function))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              function: Optional[Callable] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = HTTP_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+class MetricsMiddleware:
+    """ASGI middleware timing HTTP requests by method, route template and status.
+
+    The route label is the matched path template (/api/photos/{digest}), so
+    the number of series stays bounded; requests no route matched are
+    "unmatched". Timing runs until the response is fully sent, streamed
+    bodies included.
+    """
+
+    def __init__(self, app, registry: Registry = REGISTRY):
+        self.app = app
+        self.duration = registry.histogram(
+            "http_request_duration_seconds", "HTTP request latency by method, route and status",
+            ("method", "route", "status"), HTTP_BUCKETS
+        )
+        self.in_progress = registry.gauge("http_requests_in_progress", "HTTP requests being served")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        self.in_progress.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.in_progress.dec()
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            self.duration.labels(scope["method"], route, status).observe(time.perf_counter() - started)
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Command latency and failures by collection and command; pass it in the client's event_listeners"""
+
+    def __init__(self, registry: Registry = REGISTRY):
+        self.duration = registry.histogram(
+            "mongodb_command_duration_seconds", "MongoDB command latency by collection and command",
+            ("collection", "command"), MONGO_BUCKETS
+        )
+        self.failures = registry.counter(
+            "mongodb_command_failures_total", "Failed MongoDB commands by collection and command",
+            ("collection", "command")
+        )
+        # Collection of each command in flight; only the started event names it
+        self.in_flight: Dict[int, str] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        command = event.command
+        target = command.get("collection") if event.command_name == "getMore" else command.get(event.command_name)
+        self.in_flight[event.request_id] = target if isinstance(target, str) else ""
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        collection = self.in_flight.pop(event.request_id, "")
+        self.duration.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        collection = self.in_flight.pop(event.request_id, "")
+        self.duration.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+        self.failures.labels(collection, event.command_name).inc()
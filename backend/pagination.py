@@ -0,0 +1,114 @@
+"""Keyset pagination and streaming for nearest-first list endpoints.
+
+Results are ordered by distance, so a page ends at a (distance, ids)
+boundary: the next page is a $geoNear with minDistance set to that
+distance, excluding the ids already returned at exactly that distance.
+Every page is one bounded index scan no matter how deep the client has
+paged, and nothing but the page itself is held in memory.
+
+Continuation tokens are opaque URL-safe strings. They carry a fingerprint
+of the query they came from, so a token cannot be replayed against a
+different position, radius or filter.
+"""
+import base64
+import hashlib
+import json
+from typing import AsyncIterator, List, Optional, Tuple
+
+DISTANCE_FIELD = "_distance"
+STREAM_BATCH_SIZE = 500
+MAX_PAGE_SIZE = 1000
+
+class InvalidCursor(ValueError):
+    pass
+
+def query_fingerprint(*parts) -> str:
+    return hashlib.blake2b(repr(parts).encode(), digest_size=6).hexdigest()
+
+def encode_cursor(distance: float, ids: List[str], fingerprint: str) -> str:
+    payload = json.dumps({"d": distance, "i": ids, "q": fingerprint}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def decode_cursor(token: str, fingerprint: str) -> Tuple[float, List[str]]:
+    """(boundary distance, ids already returned at it); raises InvalidCursor"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        distance, ids, origin = float(payload["d"]), payload["i"], payload["q"]
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor("Malformed cursor")
+    if origin != fingerprint or not isinstance(ids, list):
+        raise InvalidCursor("Cursor does not belong to this query")
+    return distance, [str(i) for i in ids]
+
+def boundary_cursor(page: List[Tuple[float, str]], after: Optional[Tuple[float, List[str]]], fingerprint: str) -> str:
+    """Token resuming after the last (distance, id) of a page"""
+    boundary = page[-1][0]
+    seen = [doc_id for distance, doc_id in page if distance == boundary]
+    if after is not None and after[0] == boundary:
+        seen = after[1] + seen
+    return encode_cursor(boundary, seen, fingerprint)
+
+def geo_near_stage(point: dict, radius: float, query: dict,
+                   after: Optional[Tuple[float, List[str]]] = None) -> dict:
+    stage = {
+        "near": point,
+        "distanceField": DISTANCE_FIELD,
+        "maxDistance": radius,
+        "spherical": True,
+        "query": dict(query),
+    }
+    if after is not None:
+        distance, seen = after
+        stage["minDistance"] = distance
+        if seen:
+            stage["query"]["id"] = {"$nin": seen}
+    return {"$geoNear": stage}
+
+async def geo_page(collection, point: dict, radius: float, query: dict, projection: dict,
+                   limit: int, fingerprint: str, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """One page nearest first, and the token for the next page (None on the last one)"""
+    after = decode_cursor(cursor, fingerprint) if cursor else None
+    documents = await collection.aggregate([
+        geo_near_stage(point, radius, query, after),
+        {"$limit": limit + 1},
+        {"$project": {**projection, DISTANCE_FIELD: 1}},
+    ]).to_list(limit + 1)
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = boundary_cursor([(doc[DISTANCE_FIELD], doc["id"]) for doc in documents], after, fingerprint)
+    for doc in documents:
+        del doc[DISTANCE_FIELD]
+    return documents, next_cursor
+
+def page_ranked(ranked: List[Tuple[float, str, dict]], limit: int, fingerprint: str,
+                cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """geo_page over an in-memory list of (distance, id, document) sorted by distance then id"""
+    after = decode_cursor(cursor, fingerprint) if cursor else None
+    if after is not None:
+        distance, seen = after[0], set(after[1])
+        ranked = [item for item in ranked if item[0] > distance or (item[0] == distance and item[1] not in seen)]
+    next_cursor = None
+    if len(ranked) > limit:
+        ranked = ranked[:limit]
+        next_cursor = boundary_cursor([(item[0], item[1]) for item in ranked], after, fingerprint)
+    return [item[2] for item in ranked], next_cursor
+
+def geo_stream(collection, point: dict, radius: float, query: dict, projection: dict,
+               fingerprint: str, cursor: Optional[str] = None,
+               batch_size: int = STREAM_BATCH_SIZE) -> AsyncIterator[List[dict]]:
+    """Every match nearest first, one cursor batch at a time; the cursor is checked before streaming starts"""
+    after = decode_cursor(cursor, fingerprint) if cursor else None
+
+    async def batches():
+        results = collection.aggregate([
+            geo_near_stage(point, radius, query, after),
+            {"$project": projection},
+        ], batchSize=batch_size)
+        while True:
+            batch = await results.to_list(batch_size)
+            if not batch:
+                break
+            yield batch
+
+    return batches()
@@ -0,0 +1,173 @@
+"""Content-addressed store for barrier photos.
+
+Uploads are decoded once and written under their SHA-256 digest, so the same
+picture reported twice is stored once and a URL never changes meaning.
+Thumbnails sit next to the original and are made off the request path; the
+thumbnail endpoint builds one on demand if the background job has not run
+yet. Barrier documents only carry the URLs.
+"""
+import base64
+import binascii
+import hashlib
+import io
+import os
+import re
+import tempfile
+from typing import Optional, Tuple
+
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_QUALITY = 80
+MAX_PHOTO_BYTES = 10 * 1024 * 1024
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+MAGIC_TYPES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF8", "image/gif"),
+)
+
+class PhotoError(ValueError):
+    pass
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+def decode_photo(data: str) -> bytes:
+    """Raw bytes from base64, with or without a data: URL prefix; line breaks (MIME-style wrapping) are ignored"""
+    if data.startswith("data:"):
+        data = data.partition(",")[2]
+    data = "".join(data.split())
+    try:
+        raw = base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError):
+        raise PhotoError("photo_base64 is not valid base64")
+    if not raw:
+        raise PhotoError("photo_base64 is empty")
+    if len(raw) > MAX_PHOTO_BYTES:
+        raise PhotoError(f"Photo exceeds {MAX_PHOTO_BYTES // (1024 * 1024)} MB")
+    return raw
+
+def photo_digest(data: bytes) -> str:
+    """Name a photo is stored under"""
+    return hashlib.sha256(data).hexdigest()
+
+def sniff_content_type(head: bytes) -> str:
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for magic, content_type in MAGIC_TYPES:
+        if head.startswith(magic):
+            return content_type
+    return "application/octet-stream"
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) for a single `bytes=` range, None to send everything"""
+    if not header:
+        return None
+    match = RANGE_PATTERN.match(header.strip())
+    if match is None or match.group(1) == match.group(2) == "":
+        # Multiple or malformed ranges: ignore the header and send the whole body
+        return None
+    first, last = match.groups()
+    if first == "":
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable(header)
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = size - 1 if last == "" else min(int(last), size - 1)
+    if start >= size or end < start:
+        raise RangeNotSatisfiable(header)
+    return start, end
+
+class PhotoStore:
+    """Files under root/<first two hex digits>/<digest>[.thumb]"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, digest: str, thumbnail: bool = False) -> str:
+        name = digest + ".thumb" if thumbnail else digest
+        return os.path.join(self.root, digest[:2], name)
+
+    def exists(self, digest: str, thumbnail: bool = False) -> bool:
+        return os.path.exists(self.path(digest, thumbnail))
+
+    def _write(self, path: str, data: bytes):
+        """Atomic write, so readers never see a partial file"""
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                handle.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            try:
+                os.unlink(temporary)
+            except OSError:
+                pass
+            raise
+
+    def put(self, data: bytes) -> str:
+        """Store a photo and return its digest; identical photos are stored once"""
+        return self.add(data)[0]
+
+    def add(self, data: bytes) -> Tuple[str, bool]:
+        """Like put, also telling whether the file is new (no earlier upload had the same bytes)"""
+        digest = photo_digest(data)
+        if self.exists(digest):
+            return digest, False
+        self._write(self.path(digest), data)
+        return digest, True
+
+    def delete(self, digest: str):
+        """Remove a photo and its thumbnail, for a new file that ended up unused"""
+        for thumbnail in (False, True):
+            try:
+                os.unlink(self.path(digest, thumbnail))
+            except FileNotFoundError:
+                pass
+
+    def make_thumbnail(self, digest: str) -> bool:
+        """Write the JPEG thumbnail for a stored photo; False if it cannot be decoded"""
+        if self.exists(digest, thumbnail=True):
+            return True
+        from PIL import Image, ImageOps, UnidentifiedImageError
+
+        try:
+            with Image.open(self.path(digest)) as image:
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail(THUMBNAIL_SIZE)
+                if image.mode not in ("RGB", "L"):
+                    image = image.convert("RGB")
+                out = io.BytesIO()
+                image.save(out, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+        except (UnidentifiedImageError, OSError):
+            return False
+        self._write(self.path(digest, thumbnail=True), out.getvalue())
+        return True
+
+    def stat(self, digest: str, thumbnail: bool = False) -> Optional[Tuple[int, str]]:
+        """(size, content type) of a stored file, None if missing"""
+        try:
+            with open(self.path(digest, thumbnail), "rb") as handle:
+                head = handle.read(16)
+                size = os.fstat(handle.fileno()).st_size
+        except FileNotFoundError:
+            return None
+        return size, sniff_content_type(head)
+
+    def read(self, digest: str, start: int, end: int, thumbnail: bool = False) -> bytes:
+        """Bytes start..end inclusive"""
+        with open(self.path(digest, thumbnail), "rb") as handle:
+            handle.seek(start)
+            return handle.read(end - start + 1)
+
+def photo_url(digest: str) -> str:
+    return f"/api/photos/{digest}"
+
+def thumbnail_url(digest: str) -> str:
+    return f"/api/photos/{digest}/thumbnail"
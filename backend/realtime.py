@@ -0,0 +1,283 @@
+"""WebSocket fan-out for real-time alerts.
+
+Each connection gets a bounded send queue drained by its own writer task. A
+broadcast encodes the message once and hands it to a fan-out task, so the
+request that triggered it never waits on sockets, and a slow client delays
+nobody but itself.
+
+Clients subscribe with a position and radius. Located broadcasts (alerts,
+barriers) only reach subscribers whose circle intersects the event's circle,
+found through a spatial grid of subscribers, so the cost of an alert scales
+with local density rather than with the number of connections.
+
+Broadcasts travel through a pluggable broker (see broker.py) as one encoded
+envelope, so every server process fans out to its own sockets. A broadcast
+can also carry a topic; each process hands messages on a topic to the
+handler registered for it, which keeps per-process state (such as the
+active alert index) in step. When a client's queue is full, a pending message
+with the same coalesce key is replaced, otherwise the oldest pending message
+is dropped. Sockets the server gives up on (stuck or failing sends) are
+closed with a close code rather than just forgotten.
+"""
+import asyncio
+import json
+import logging
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Set
+
+from fastapi import WebSocket
+
+from broker import Broker, InProcessBroker
+from geo import GridIndex
+
+logger = logging.getLogger(__name__)
+
+SEND_QUEUE_SIZE = 64
+SEND_TIMEOUT = 10.0  # seconds before a stuck client is disconnected
+FANOUT_CHUNK = 256  # sockets enqueued before yielding back to the event loop
+MAX_SUBSCRIPTION_RADIUS = 20000.0  # meters
+DEFAULT_SUBSCRIPTION_RADIUS = 2000.0
+SUBSCRIBER_CELL_SIZE = 0.05  # degrees, ~5.5 km
+CLOSE_TIMEOUT = 5.0  # seconds a close frame may take before the socket is left to the server
+CLOSE_TRY_AGAIN_LATER = 1013  # the client fell behind; it may reconnect
+CLOSE_INTERNAL_ERROR = 1011  # a send failed
+CLOSE_GOING_AWAY = 1001  # shutdown
+
+class ClientConnection:
+    """One socket with its pending messages and writer task"""
+
+    def __init__(self, websocket: WebSocket, queue_size: int = SEND_QUEUE_SIZE):
+        self.websocket = websocket
+        self.queue_size = queue_size
+        # Entries are [coalesce key, payload] so a newer payload can replace one in place
+        self.pending: Deque[List] = deque()
+        self.by_key: Dict[str, List] = {}
+        self.wakeup = asyncio.Event()
+        self.dropped = 0
+        self.writer: Optional[asyncio.Task] = None
+        # Loop time the in-flight send started, None when idle
+        self.sending_since: Optional[float] = None
+
+    def offer(self, payload: str, key: Optional[str] = None):
+        """Queue a payload without waiting; never blocks the caller"""
+        if key is not None:
+            entry = self.by_key.get(key)
+            if entry is not None:
+                entry[1] = payload
+                return
+        if len(self.pending) >= self.queue_size:
+            oldest = self.pending.popleft()
+            if oldest[0] is not None and self.by_key.get(oldest[0]) is oldest:
+                del self.by_key[oldest[0]]
+            self.dropped += 1
+        entry = [key, payload]
+        self.pending.append(entry)
+        if key is not None:
+            self.by_key[key] = entry
+        self.wakeup.set()
+
+    async def run(self, on_failure):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                while self.pending:
+                    entry = self.pending.popleft()
+                    if entry[0] is not None and self.by_key.get(entry[0]) is entry:
+                        del self.by_key[entry[0]]
+                    self.sending_since = loop.time()
+                    await self.websocket.send_text(entry[1])
+                    self.sending_since = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.info("Dropping alert socket after failed send: %s", exc)
+            on_failure(self.websocket)
+
+class ConnectionManager:
+    def __init__(self, queue_size: int = SEND_QUEUE_SIZE, send_timeout: float = SEND_TIMEOUT):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.connections: Dict[WebSocket, ClientConnection] = {}
+        self.reaper: Optional[asyncio.Task] = None
+        # Subscribed sockets keyed by websocket, value is the subscription radius
+        self.subscribers = GridIndex(cell_size=SUBSCRIBER_CELL_SIZE)
+        # Encoded broadcasts waiting for the fan-out task
+        self.outbox: Deque = deque()
+        self.outbox_ready = asyncio.Event()
+        self.fanout: Optional[asyncio.Task] = None
+        self.broker: Broker = InProcessBroker()
+        self.broker.handler = self.deliver
+        self.topics: Dict[str, Callable[[dict], None]] = {}
+        # Drops counted by sockets that have since gone away
+        self.dropped_closed = 0
+        # Close handshakes still in progress, kept so they are not garbage collected
+        self.closing: Set[asyncio.Task] = set()
+
+    async def use_broker(self, broker: Broker):
+        """Route broadcasts through `broker` so every process sees them"""
+        await broker.start(self.deliver)
+        self.broker = broker
+
+    def on_topic(self, topic: str, handler: Callable[[dict], None]):
+        """Call `handler` with every message broadcast on `topic`, from any process"""
+        self.topics[topic] = handler
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.connections)
+
+    async def connect(self, websocket: WebSocket):
+        await websocket.accept()
+        self.register(websocket)
+
+    def register(self, websocket: WebSocket) -> ClientConnection:
+        """Track an already-accepted socket and start its writer"""
+        connection = ClientConnection(websocket, self.queue_size)
+        connection.writer = asyncio.create_task(
+            connection.run(lambda failed: self.disconnect(failed, CLOSE_INTERNAL_ERROR))
+        )
+        self.connections[websocket] = connection
+        if self.reaper is None or self.reaper.done():
+            self.reaper = asyncio.create_task(self.reap_stuck())
+        return connection
+
+    async def reap_stuck(self):
+        """Disconnect sockets whose current send has been in flight longer than send_timeout.
+
+        One sweep for all sockets is far cheaper than a timeout per send.
+        """
+        loop = asyncio.get_running_loop()
+        while self.connections:
+            await asyncio.sleep(self.send_timeout / 2)
+            cutoff = loop.time() - self.send_timeout
+            for websocket, connection in list(self.connections.items()):
+                if connection.sending_since is not None and connection.sending_since < cutoff:
+                    logger.info("Dropping alert socket stuck in send for %.0fs", self.send_timeout)
+                    self.disconnect(websocket, CLOSE_TRY_AGAIN_LATER)
+
+    def subscribe(self, websocket: WebSocket, latitude: float, longitude: float,
+                  radius: float = DEFAULT_SUBSCRIPTION_RADIUS) -> float:
+        """Set (or move) a socket's area of interest; returns the radius actually used"""
+        radius = max(0.0, min(float(radius), MAX_SUBSCRIPTION_RADIUS))
+        self.subscribers.insert(websocket, latitude, longitude, radius)
+        return radius
+
+    def unsubscribe(self, websocket: WebSocket):
+        self.subscribers.remove(websocket)
+
+    def send(self, websocket: WebSocket, message: dict):
+        """Queue a message for a single socket"""
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            connection.offer(json.dumps(message, default=str))
+
+    def disconnect(self, websocket: WebSocket, code: Optional[int] = None):
+        """Forget a socket; with a close `code`, also close it (for sockets the client has not closed)"""
+        self.subscribers.remove(websocket)
+        connection = self.connections.pop(websocket, None)
+        if connection is not None:
+            self.dropped_closed += connection.dropped
+            if connection.writer is not None:
+                connection.writer.cancel()
+            if code is not None:
+                task = asyncio.get_running_loop().create_task(self.close_socket(websocket, code))
+                self.closing.add(task)
+                task.add_done_callback(self.closing.discard)
+
+    @staticmethod
+    async def close_socket(websocket: WebSocket, code: int):
+        """Send a close frame; a socket that is already gone or stuck is left as it is"""
+        try:
+            await asyncio.wait_for(websocket.close(code=code), CLOSE_TIMEOUT)
+        except Exception as exc:
+            logger.debug("Closing alert socket with %d failed: %r", code, exc)
+
+    @staticmethod
+    def envelope(message: dict, key: Optional[str], latitude: Optional[float], longitude: Optional[float],
+                 radius: float, topic: Optional[str] = None, fanout: bool = True) -> bytes:
+        area = [latitude, longitude, radius] if latitude is not None and longitude is not None else None
+        header = json.dumps({"key": key, "area": area, "topic": topic, "fanout": fanout}).encode()
+        return header + b"\n" + json.dumps(message, default=str).encode()
+
+    async def broadcast(self, message: dict, key: Optional[str] = None,
+                        latitude: Optional[float] = None, longitude: Optional[float] = None,
+                        radius: float = 0.0, topic: Optional[str] = None):
+        """Encode once and hand off to the fan-out task; returns without touching any socket.
+
+        With a position, only subscribers whose area intersects the circle of
+        `radius` meters around it receive the message; without one, every
+        connected socket does.
+        """
+        self.broker.publish(self.envelope(message, key, latitude, longitude, radius, topic))
+
+    def notify(self, topic: str, message: dict):
+        """Hand a message to the `topic` handler of every process without sending it to any socket"""
+        self.broker.publish(self.envelope(message, None, None, None, 0.0, topic, fanout=False))
+
+    def broadcast_local(self, message: dict, key: Optional[str] = None,
+                        latitude: Optional[float] = None, longitude: Optional[float] = None,
+                        radius: float = 0.0):
+        """Like broadcast, but only to this process's sockets (for events every process raises itself)"""
+        self.deliver(self.envelope(message, key, latitude, longitude, radius))
+
+    def deliver(self, envelope: bytes):
+        """Broker handler: queue an envelope from any process for local fan-out"""
+        header, _, payload = envelope.partition(b"\n")
+        meta = json.loads(header)
+        area = meta.get("area")
+        handler = self.topics.get(meta.get("topic"))
+        if handler is not None:
+            try:
+                handler(json.loads(payload))
+            except Exception:
+                logger.exception("Handler for broadcast topic %s failed", meta.get("topic"))
+        if meta.get("fanout") is False:
+            return
+        self.outbox.append((payload.decode(), meta.get("key"), tuple(area) if area else None))
+        self.outbox_ready.set()
+        if self.fanout is None or self.fanout.done():
+            self.fanout = asyncio.get_running_loop().create_task(self.run_fanout())
+
+    async def run_fanout(self):
+        """Copy queued broadcasts into every socket's queue, yielding between chunks"""
+        while True:
+            await self.outbox_ready.wait()
+            self.outbox_ready.clear()
+            while self.outbox:
+                payload, key, area = self.outbox.popleft()
+                targets = list(self.connections.values()) if area is None else self.subscribers_for(*area)
+                for count, connection in enumerate(targets, 1):
+                    connection.offer(payload, key)
+                    if count % FANOUT_CHUNK == 0:
+                        await asyncio.sleep(0)
+
+    def subscribers_for(self, latitude: float, longitude: float, radius: float) -> List[ClientConnection]:
+        """Connections whose subscription circle intersects the given circle"""
+        targets = []
+        for distance, websocket, subscribed_radius in self.subscribers.within_radius(
+            latitude, longitude, radius + MAX_SUBSCRIPTION_RADIUS
+        ):
+            if distance <= radius + subscribed_radius:
+                connection = self.connections.get(websocket)
+                if connection is not None:
+                    targets.append(connection)
+        return targets
+
+    def queued(self) -> int:
+        return sum(len(connection.pending) for connection in self.connections.values())
+
+    def dropped(self) -> int:
+        """Messages dropped from full queues since startup, closed sockets included"""
+        return self.dropped_closed + sum(connection.dropped for connection in self.connections.values())
+
+    async def close(self):
+        for websocket in list(self.connections):
+            self.disconnect(websocket, CLOSE_GOING_AWAY)
+        for task in (self.reaper, self.fanout):
+            if task is not None:
+                task.cancel()
+        if self.closing:
+            await asyncio.wait(list(self.closing))
+        await self.broker.close()
@@ -0,0 +1,90 @@
+"""Context retrieval for AI search prompts.
+
+Candidates are the nearest locations within the search radius (from the
+2dsphere index, with distances); they are ranked by a mode-specific blend of
+accessibility features, score and proximity, and only the top k go into the
+prompt. Each location's prompt line is cached and rebuilt only when the
+fields it is made from change.
+"""
+from typing import Dict, List, Tuple
+
+from cachetools import LRUCache
+
+CANDIDATE_LIMIT = 200
+TOP_K = 8
+SNIPPET_CACHE_SIZE = 50000
+
+# Feature weights per mode; a feature counts when the location has it
+MODE_FEATURES: Dict[str, Dict[str, float]] = {
+    "wheelchair": {"has_ramp": 2.0, "has_elevator": 1.5, "step_free": 1.5, "smooth": 1.0, "low_incline": 1.0},
+    "blind": {"step_free": 1.5, "smooth": 1.0, "low_incline": 0.5, "has_elevator": 0.5},
+    "deaf": {"has_elevator": 0.5, "smooth": 0.5},
+}
+SCORE_WEIGHT = 3.0
+DISTANCE_WEIGHT = 2.0
+
+SNIPPET_FIELDS = (
+    "name", "latitude", "longitude", "sanchara_score", "has_ramp", "has_elevator",
+    "has_stairs", "surface_type", "incline_level", "description",
+)
+# Projection for candidate queries: only what ranking and snippets read
+CANDIDATE_PROJECTION = {"_id": 0, "id": 1, **{field: 1 for field in SNIPPET_FIELDS}}
+
+def location_features(loc: dict) -> Dict[str, bool]:
+    return {
+        "has_ramp": bool(loc.get("has_ramp")),
+        "has_elevator": bool(loc.get("has_elevator")),
+        "step_free": not loc.get("has_stairs", True),
+        "smooth": loc.get("surface_type") == "smooth",
+        "low_incline": loc.get("incline_level") == "low",
+    }
+
+def relevance(loc: dict, distance: float, mode: str, radius: float) -> float:
+    weights = MODE_FEATURES.get(mode, MODE_FEATURES["wheelchair"])
+    features = location_features(loc)
+    feature_score = sum(weight for name, weight in weights.items() if features[name]) / sum(weights.values())
+    proximity = 1.0 - min(1.0, distance / radius) if radius > 0 else 1.0
+    return (
+        sum(weights.values()) * feature_score
+        + SCORE_WEIGHT * loc.get("sanchara_score", 5.0) / 10.0
+        + DISTANCE_WEIGHT * proximity
+    )
+
+def rank_locations(candidates: List[dict], mode: str, radius: float, k: int = TOP_K) -> List[dict]:
+    """Top k candidates (each with a `distance` field) for the mode"""
+    return sorted(
+        candidates,
+        key=lambda loc: relevance(loc, loc.get("distance", 0.0), mode, radius),
+        reverse=True
+    )[:k]
+
+class SnippetCache:
+    """Per-location prompt lines, keyed by id and invalidated by content"""
+
+    def __init__(self, maxsize: int = SNIPPET_CACHE_SIZE):
+        self.entries: LRUCache = LRUCache(maxsize=maxsize)
+        self.hits = 0
+        self.misses = 0
+
+    def snippet(self, loc: dict) -> str:
+        fingerprint = tuple(loc.get(field) for field in SNIPPET_FIELDS)
+        cached = self.entries.get(loc["id"])
+        if cached is not None and cached[0] == fingerprint:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        text = (
+            f"{loc['name']} at ({loc['latitude']}, {loc['longitude']}) - Score: {loc.get('sanchara_score', 5.0)}/10, "
+            f"Ramp: {loc.get('has_ramp', False)}, Elevator: {loc.get('has_elevator', False)}, "
+            f"Stairs: {loc.get('has_stairs', True)}, Surface: {loc.get('surface_type', 'unknown')}, "
+            f"Incline: {loc.get('incline_level', 'unknown')}"
+        )
+        if loc.get("description"):
+            text += f" ({loc['description']})"
+        self.entries[loc["id"]] = (fingerprint, text)
+        return text
+
+def build_context(snippets: "SnippetCache", ranked: List[dict]) -> Tuple[str, int]:
+    """Prompt section listing the ranked locations, and how many were listed"""
+    lines = [f"- {snippets.snippet(loc)}, {loc.get('distance', 0.0):.0f} m away" for loc in ranked]
+    return "\n".join(lines), len(lines)
@@ -0,0 +1,238 @@
+"""Route results cached by snapped endpoints and mode, with barrier-aware invalidation.
+
+Routes are cached by (mode, start cell, end cell), with cells of
+ROUTE_CACHE_CELL degrees (~22 m by default), LRU eviction and a TTL. A
+hit returns the cached path with its first and last waypoints moved to
+the requested points. Identical requests that arrive while a route is
+being computed wait on the same task.
+
+Each cached path is registered in a reverse index: every cell of a coarse
+grid that its corridor crosses maps to the routes through it. When a
+barrier or alert is added, changed or removed, only the routes registered
+in the cells around it are checked, exactly against their polyline, and
+those passing within the corridor (plus the alert's radius) are dropped.
+A bulk import announces each batch once, as a bounding box.
+A barrier removed near a path but outside its corridor might make another
+path better; such routes are kept until the TTL.
+"""
+import asyncio
+import math
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Set, Tuple
+
+from cachetools import TTLCache
+
+from geo import distance_to_polyline_m, haversine_m, radius_to_degrees, simplify_polyline
+
+CACHE_SIZE = 8192
+CACHE_TTL = 900.0  # seconds
+ROUTE_CELL = float(os.environ.get("ROUTE_CACHE_CELL", "0.0002"))  # degrees
+INDEX_CELL = 0.005  # degrees, ~550 m
+SWEEP_SLACK = 1024  # evicted routes left in the reverse index before it is swept
+
+Cell = Tuple[int, int]
+
+def route_cache_key(mode: str, start_lat: float, start_lng: float, end_lat: float, end_lng: float) -> Tuple:
+    return (
+        mode.strip().lower(),
+        math.floor(start_lat / ROUTE_CELL), math.floor(start_lng / ROUTE_CELL),
+        math.floor(end_lat / ROUTE_CELL), math.floor(end_lng / ROUTE_CELL),
+    )
+
+def with_endpoints(route: dict, start_lat: float, start_lng: float,
+                   end_lat: float, end_lng: float) -> Tuple[List[Dict[str, float]], float]:
+    """Waypoints and distance of a cached route, starting and ending at the requested points"""
+    waypoints = [dict(point) for point in route["waypoints"]]
+    distance = route["distance"]
+    for index, latitude, longitude in ((0, start_lat, start_lng), (-1, end_lat, end_lng)):
+        if len(waypoints) < 2:
+            break
+        point = waypoints[index]
+        neighbour = waypoints[1 if index == 0 else -2]
+        distance += (haversine_m(latitude, longitude, neighbour["latitude"], neighbour["longitude"])
+                     - haversine_m(point["latitude"], point["longitude"], neighbour["latitude"], neighbour["longitude"]))
+        point["latitude"], point["longitude"] = latitude, longitude
+    return waypoints, max(0.0, distance)
+
+class RouteCache:
+    def __init__(self, corridor: float, maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL,
+                 index_cell: float = INDEX_CELL):
+        """`corridor` is the distance in meters from a path within which a barrier changes the route"""
+        self.corridor = corridor
+        self.index_cell = index_cell
+        self.entries: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.inflight: Dict[Hashable, asyncio.Task] = {}
+        # Reverse index: cell -> keys of the cached routes whose corridor crosses it
+        self.cells: Dict[Cell, Set[Hashable]] = {}
+        self.paths: Dict[Hashable, Tuple[List[Tuple[float, float]], List[Cell]]] = {}
+        # Bumped by every invalidation, so a route computed meanwhile is not cached
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0  # barrier and alert changes that dropped at least one route
+        self.invalidated = 0  # routes dropped by them
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[dict]]) -> dict:
+        """Cached route for `key`, or the result of `compute` (a dict with waypoints), cached unless invalidated meanwhile"""
+        try:
+            value = self.entries[key]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            return value
+
+        task = self.inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(compute())
+            self.inflight[key] = task
+            version = self.version
+            task.add_done_callback(lambda done: self._finish(key, done, version))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task, version: int):
+        self.inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None or version != self.version:
+            return
+        self.put(key, task.result())
+
+    def put(self, key: Hashable, route: dict):
+        self._unregister(key)
+        self.entries[key] = route
+        path = [(point["latitude"], point["longitude"]) for point in route["waypoints"]]
+        cells = self._corridor_cells(path)
+        self.paths[key] = (path, cells)
+        for cell in cells:
+            self.cells.setdefault(cell, set()).add(key)
+        if len(self.paths) > self.entries.maxsize + SWEEP_SLACK:
+            self._sweep()
+
+    def _cells_in_box(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> List[Cell]:
+        size = self.index_cell
+        return [
+            (row, column)
+            for row in range(math.floor(min_lat / size), math.floor(max_lat / size) + 1)
+            for column in range(math.floor(min_lng / size), math.floor(max_lng / size) + 1)
+        ]
+
+    def _registered_in_box(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> Set[Hashable]:
+        """Keys of the routes registered in any index cell overlapping a box"""
+        size = self.index_cell
+        rows = math.floor(max_lat / size) - math.floor(min_lat / size) + 1
+        columns = math.floor(max_lng / size) - math.floor(min_lng / size) + 1
+        found: Set[Hashable] = set()
+        if rows * columns > len(self.cells):
+            # A wide box (a bulk import): cheaper to go through the occupied cells
+            for (row, column), keys in self.cells.items():
+                if min_lat <= (row + 1) * size and row * size <= max_lat and \
+                        min_lng <= (column + 1) * size and column * size <= max_lng:
+                    found.update(keys)
+            return found
+        for cell in self._cells_in_box(min_lat, min_lng, max_lat, max_lng):
+            found.update(self.cells.get(cell, ()))
+        return found
+
+    def _corridor_cells(self, path: List[Tuple[float, float]]) -> List[Cell]:
+        """Index cells covering the corridor, one padded box per segment of the simplified path"""
+        tolerance = self.corridor / 2
+        simplified = simplify_polyline(path, tolerance) if len(path) > 2 else path
+        cells: Set[Cell] = set()
+        for (lat1, lng1), (lat2, lng2) in zip(simplified, simplified[1:] or simplified):
+            dlat, dlng = radius_to_degrees(max(abs(lat1), abs(lat2)), self.corridor + tolerance)
+            cells.update(self._cells_in_box(
+                min(lat1, lat2) - dlat, min(lng1, lng2) - dlng, max(lat1, lat2) + dlat, max(lng1, lng2) + dlng
+            ))
+        return list(cells)
+
+    def _unregister(self, key: Hashable):
+        registered = self.paths.pop(key, None)
+        if registered is None:
+            return
+        for cell in registered[1]:
+            keys = self.cells.get(cell)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.cells[cell]
+
+    def _sweep(self):
+        """Drop routes the TTL or LRU evicted from the reverse index"""
+        for key in [key for key in self.paths if key not in self.entries]:
+            self._unregister(key)
+
+    def invalidate_near(self, latitude: float, longitude: float, radius: float = 0.0) -> int:
+        """Drop cached routes passing within the corridor (plus `radius` meters) of a changed barrier or alert"""
+        self.version += 1
+        reach = self.corridor + radius
+        dlat, dlng = radius_to_degrees(latitude, reach)
+        candidates = self._registered_in_box(latitude - dlat, longitude - dlng, latitude + dlat, longitude + dlng)
+        dropped = 0
+        for key in candidates:
+            path = self.paths[key][0]
+            if key not in self.entries:
+                self._unregister(key)
+            elif distance_to_polyline_m(latitude, longitude, path) <= reach:
+                self.entries.pop(key, None)
+                self._unregister(key)
+                dropped += 1
+        if dropped:
+            self.invalidations += 1
+            self.invalidated += dropped
+        return dropped
+
+    def invalidate_box(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> int:
+        """Drop cached routes whose corridor may reach a box, for a batch of changes at once.
+
+        Conservative: a route goes if the box, padded by the corridor,
+        overlaps the bounding box of any of its segments.
+        """
+        self.version += 1
+        dlat, dlng = radius_to_degrees(max(abs(min_lat), abs(max_lat)), self.corridor)
+        min_lat, min_lng, max_lat, max_lng = min_lat - dlat, min_lng - dlng, max_lat + dlat, max_lng + dlng
+        candidates = self._registered_in_box(min_lat, min_lng, max_lat, max_lng)
+        dropped = 0
+        for key in candidates:
+            path = self.paths[key][0]
+            if key not in self.entries:
+                self._unregister(key)
+                continue
+            if any(
+                min(lat1, lat2) <= max_lat and max(lat1, lat2) >= min_lat
+                and min(lng1, lng2) <= max_lng and max(lng1, lng2) >= min_lng
+                for (lat1, lng1), (lat2, lng2) in zip(path, path[1:] or path)
+            ):
+                self.entries.pop(key, None)
+                self._unregister(key)
+                dropped += 1
+        if dropped:
+            self.invalidations += 1
+            self.invalidated += dropped
+        return dropped
+
+    def clear(self):
+        self.version += 1
+        self.entries.clear()
+        self.cells.clear()
+        self.paths.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.coalesced) / requests, 4) if requests else 0.0,
+            "size": len(self.entries),
+            "inflight": len(self.inflight),
+            "invalidations": self.invalidations,
+            "invalidated": self.invalidated,
+            "indexed_cells": len(self.cells),
+            "route_cell": ROUTE_CELL,
+        }
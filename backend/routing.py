@@ -0,0 +1,419 @@
+"""Accessible pedestrian routing over an OSM extract.
+
+The walkable network is held in compressed sparse row (CSR) form: node
+coordinates and per-edge attributes live in flat `array` buffers, so a city
+network costs a few dozen bytes per edge. Routes are found with A* using a
+great-circle heuristic; edge costs are meters scaled by a per-mode profile
+plus node penalties for nearby barriers.
+"""
+import bz2
+import gzip
+import heapq
+import math
+import os
+import pickle
+import re
+import xml.etree.ElementTree as ET
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from geo import METERS_PER_DEGREE_LAT, haversine_m
+
+WALKABLE_HIGHWAYS = {
+    "footway", "pedestrian", "path", "steps", "living_street", "residential",
+    "service", "unclassified", "tertiary", "tertiary_link", "secondary",
+    "secondary_link", "primary", "primary_link", "track", "corridor",
+    "crossing", "cycleway", "road",
+}
+NO_ACCESS = {"no", "private"}
+
+SURFACE_SMOOTH, SURFACE_ROUGH, SURFACE_UNPAVED = 0, 1, 2
+SURFACE_CLASSES = {
+    "asphalt": SURFACE_SMOOTH, "concrete": SURFACE_SMOOTH, "paved": SURFACE_SMOOTH,
+    "paving_stones": SURFACE_SMOOTH, "concrete:plates": SURFACE_SMOOTH,
+    "concrete:lanes": SURFACE_SMOOTH, "metal": SURFACE_SMOOTH, "wood": SURFACE_SMOOTH,
+    "tartan": SURFACE_SMOOTH, "rubber": SURFACE_SMOOTH,
+    "sett": SURFACE_ROUGH, "cobblestone": SURFACE_ROUGH, "unhewn_cobblestone": SURFACE_ROUGH,
+    "compacted": SURFACE_ROUGH, "fine_gravel": SURFACE_ROUGH, "grass_paver": SURFACE_ROUGH,
+    "gravel": SURFACE_UNPAVED, "pebblestone": SURFACE_UNPAVED, "dirt": SURFACE_UNPAVED,
+    "earth": SURFACE_UNPAVED, "ground": SURFACE_UNPAVED, "grass": SURFACE_UNPAVED,
+    "sand": SURFACE_UNPAVED, "mud": SURFACE_UNPAVED, "unpaved": SURFACE_UNPAVED,
+}
+# Surface assumed when a way has no surface tag
+DEFAULT_SURFACE = {"path": SURFACE_ROUGH, "track": SURFACE_UNPAVED}
+
+FLAG_STEPS = 1
+FLAG_NO_WHEELCHAIR = 2
+
+# Cost multipliers are >= 1 so the distance heuristic stays admissible.
+# `steps`/`no_wheelchair` of None make the edge impassable for that mode.
+MODE_PROFILES = {
+    "wheelchair": {
+        "surface": (1.0, 1.8, 4.0),
+        "incline_per_percent": 0.25,
+        "max_incline": 8.0,
+        "steps": None,
+        "no_wheelchair": None,
+    },
+    "blind": {
+        "surface": (1.0, 1.2, 1.5),
+        "incline_per_percent": 0.02,
+        "max_incline": None,
+        "steps": 2.0,
+        "no_wheelchair": 1.0,
+    },
+    "deaf": {
+        "surface": (1.0, 1.05, 1.2),
+        "incline_per_percent": 0.0,
+        "max_incline": None,
+        "steps": 1.0,
+        "no_wheelchair": 1.0,
+    },
+}
+DEFAULT_MODE = "wheelchair"
+
+# Extra cost, in meters, for passing a node next to a reported barrier
+BARRIER_PENALTIES = {
+    "wheelchair": {"low": 50.0, "medium": 250.0, "high": 2000.0},
+    "blind": {"low": 30.0, "medium": 150.0, "high": 1000.0},
+    "deaf": {"low": 10.0, "medium": 50.0, "high": 300.0},
+}
+BARRIER_NODE_RADIUS = 25.0  # meters
+
+INCLINE_RE = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*(%|°)?\s*$")
+SNAP_CELL_SIZE = 0.001  # degrees, ~110 m
+# Cell ids are row * CELL_ROW_STRIDE + column; columns run up to 360 / SNAP_CELL_SIZE = 360000
+CELL_ROW_STRIDE = 1 << 20
+
+def parse_incline(value: Optional[str]) -> float:
+    """Absolute grade in percent from an OSM `incline` tag"""
+    if not value:
+        return 0.0
+    if value in ("up", "down", "yes"):
+        return 8.0
+    match = INCLINE_RE.match(value)
+    if not match:
+        return 0.0
+    number = abs(float(match.group(1)))
+    if match.group(2) == "°":
+        return math.tan(math.radians(number)) * 100.0
+    return number
+
+def is_walkable(tags: Dict[str, str]) -> bool:
+    if tags.get("highway") not in WALKABLE_HIGHWAYS:
+        return False
+    if tags.get("foot") in NO_ACCESS:
+        return False
+    if tags.get("access") in NO_ACCESS and tags.get("foot") not in ("yes", "designated", "permissive"):
+        return False
+    return True
+
+def edge_attributes(tags: Dict[str, str]) -> Tuple[int, float, int]:
+    highway = tags.get("highway")
+    surface = SURFACE_CLASSES.get(tags.get("surface"), DEFAULT_SURFACE.get(highway, SURFACE_SMOOTH))
+    flags = 0
+    if highway == "steps":
+        flags |= FLAG_STEPS
+    if tags.get("wheelchair") == "no":
+        flags |= FLAG_NO_WHEELCHAIR
+    return surface, parse_incline(tags.get("incline")), flags
+
+def edge_multiplier(mode: str, surface: int, incline: float, flags: int) -> float:
+    """Cost per meter for one edge, math.inf when the mode cannot use it"""
+    profile = MODE_PROFILES.get(mode, MODE_PROFILES[DEFAULT_MODE])
+    multiplier = profile["surface"][surface]
+    if flags & FLAG_STEPS:
+        if profile["steps"] is None:
+            return math.inf
+        multiplier *= profile["steps"]
+    if flags & FLAG_NO_WHEELCHAIR:
+        if profile["no_wheelchair"] is None:
+            return math.inf
+        multiplier *= profile["no_wheelchair"]
+    if profile["max_incline"] is not None and incline > profile["max_incline"]:
+        return math.inf
+    return multiplier * (1.0 + profile["incline_per_percent"] * incline)
+
+def _open(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    return open(path, "rb")
+
+def _iter_osm(path: str):
+    """Yield top-level node/way/relation elements, releasing each once consumed"""
+    with _open(path) as source:
+        context = ET.iterparse(source, events=("start", "end"))
+        _, root = next(context)
+        depth = 0
+        for event, elem in context:
+            if event == "start":
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 0:
+                yield elem
+                root.clear()
+
+class PedestrianGraph:
+    """Walkable network in CSR form with per-mode edge costs"""
+
+    def __init__(self):
+        self.node_lat = array("d")
+        self.node_lng = array("d")
+        self.offsets = array("l", [0])
+        self.targets = array("l")
+        self.lengths = array("f")
+        self.surface = array("B")
+        self.incline = array("f")
+        self.flags = array("B")
+        self.costs: Dict[str, array] = {}
+        # Nodes sorted by snapping cell for nearest-node lookups
+        self.cell_ids = array("q")
+        self.cell_nodes = array("l")
+
+    @property
+    def node_count(self) -> int:
+        return len(self.node_lat)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.targets)
+
+    # ---- Building ----
+
+    @classmethod
+    def from_osm(cls, path: str) -> "PedestrianGraph":
+        """Build from an OSM XML extract (.osm, .osm.gz or .osm.bz2)"""
+        from_refs = array("q")
+        to_refs = array("q")
+        surfaces = array("B")
+        inclines = array("f")
+        flags = array("B")
+        needed = set()
+
+        # Pass 1: walkable ways
+        for elem in _iter_osm(path):
+            if elem.tag != "way":
+                continue
+            tags = {tag.get("k"): tag.get("v") for tag in elem.iter("tag")}
+            if not is_walkable(tags):
+                continue
+            refs = [int(nd.get("ref")) for nd in elem.iter("nd")]
+            surface, incline, edge_flags = edge_attributes(tags)
+            for u, v in zip(refs, refs[1:]):
+                from_refs.append(u)
+                to_refs.append(v)
+                surfaces.append(surface)
+                inclines.append(incline)
+                flags.append(edge_flags)
+            needed.update(refs)
+
+        # Pass 2: coordinates of the nodes those ways use
+        graph = cls()
+        index_of: Dict[int, int] = {}
+        for elem in _iter_osm(path):
+            if elem.tag == "node":
+                ref = int(elem.get("id"))
+                if ref in needed:
+                    index_of[ref] = len(graph.node_lat)
+                    graph.node_lat.append(float(elem.get("lat")))
+                    graph.node_lng.append(float(elem.get("lon")))
+        del needed
+
+        # Segments become a directed edge each way, keyed by dense node index
+        sources, targets, segments = array("l"), array("l"), array("l")
+        for i in range(len(from_refs)):
+            u = index_of.get(from_refs[i])
+            v = index_of.get(to_refs[i])
+            if u is None or v is None or u == v:
+                continue
+            sources.extend((u, v))
+            targets.extend((v, u))
+            segments.extend((i, i))
+        del index_of, from_refs, to_refs
+        graph._build_csr(sources, targets, segments, surfaces, inclines, flags)
+        return graph
+
+    def _build_csr(self, sources: array, targets: array, segments: array, surfaces: array, inclines: array, flags: array):
+        n = self.node_count
+        m = len(sources)
+        degree = [0] * (n + 1)
+        for u in sources:
+            degree[u + 1] += 1
+        for i in range(n):
+            degree[i + 1] += degree[i]
+        self.offsets = array("l", degree)
+        cursor = degree[:n]
+        self.targets = array("l", bytes(self.offsets.itemsize * m))
+        self.lengths = array("f", bytes(4 * m))
+        self.surface = array("B", bytes(m))
+        self.incline = array("f", bytes(4 * m))
+        self.flags = array("B", bytes(m))
+        lat, lng = self.node_lat, self.node_lng
+        for i in range(m):
+            u, v, segment = sources[i], targets[i], segments[i]
+            slot = cursor[u]
+            cursor[u] += 1
+            self.targets[slot] = v
+            self.lengths[slot] = haversine_m(lat[u], lng[u], lat[v], lng[v])
+            self.surface[slot] = surfaces[segment]
+            self.incline[slot] = inclines[segment]
+            self.flags[slot] = flags[segment]
+        self._prepare()
+
+    def _prepare(self):
+        """Derive per-mode costs and the snapping index from the CSR arrays"""
+        self.costs = {}
+        for mode in MODE_PROFILES:
+            multipliers: Dict[Tuple[int, float, int], float] = {}
+            costs = array("f", bytes(4 * self.edge_count))
+            for slot in range(self.edge_count):
+                key = (self.surface[slot], self.incline[slot], self.flags[slot])
+                multiplier = multipliers.get(key)
+                if multiplier is None:
+                    multiplier = multipliers[key] = edge_multiplier(mode, *key)
+                costs[slot] = self.lengths[slot] * multiplier
+            self.costs[mode] = costs
+        order = sorted(range(self.node_count), key=lambda node: self._cell_id(self.node_lat[node], self.node_lng[node]))
+        self.cell_nodes = array("l", order)
+        self.cell_ids = array("q", (self._cell_id(self.node_lat[node], self.node_lng[node]) for node in order))
+
+    @staticmethod
+    def _cell_id(latitude: float, longitude: float) -> int:
+        row = int(math.floor((latitude + 90.0) / SNAP_CELL_SIZE))
+        column = int(math.floor((longitude + 180.0) / SNAP_CELL_SIZE))
+        return row * CELL_ROW_STRIDE + column
+
+    # ---- Persistence ----
+
+    def save(self, path: str):
+        state = {name: getattr(self, name) for name in (
+            "node_lat", "node_lng", "offsets", "targets", "lengths", "surface", "incline", "flags",
+        )}
+        with open(path, "wb") as target:
+            pickle.dump(state, target, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: str) -> "PedestrianGraph":
+        graph = cls()
+        with open(path, "rb") as source:
+            for name, value in pickle.load(source).items():
+                setattr(graph, name, value)
+        graph._prepare()
+        return graph
+
+    # ---- Queries ----
+
+    def nearest_node(self, latitude: float, longitude: float, max_distance: float = 500.0) -> Optional[int]:
+        """Closest graph node within `max_distance` meters"""
+        rings = int(max_distance / (SNAP_CELL_SIZE * METERS_PER_DEGREE_LAT * max(0.1, math.cos(math.radians(latitude))))) + 1
+        center = self._cell_id(latitude, longitude)
+        ring_width = SNAP_CELL_SIZE * METERS_PER_DEGREE_LAT * math.cos(math.radians(min(89.0, abs(latitude) + 1)))
+        best, best_distance = None, max_distance
+        for ring in range(rings + 1):
+            for row in range(-ring, ring + 1):
+                base = center + row * CELL_ROW_STRIDE
+                # Interior rows of the ring only contribute their two edge cells
+                spans = ((base - ring, base + ring),) if abs(row) == ring else ((base - ring, base - ring), (base + ring, base + ring))
+                for first, last in spans:
+                    for position in range(bisect_left(self.cell_ids, first), bisect_right(self.cell_ids, last)):
+                        node = self.cell_nodes[position]
+                        distance = haversine_m(latitude, longitude, self.node_lat[node], self.node_lng[node])
+                        if distance <= best_distance:
+                            best, best_distance = node, distance
+            # Anything in a further ring is at least `ring` cells away
+            if best is not None and best_distance <= ring * ring_width:
+                break
+        return best
+
+    def barrier_penalties(self, mode: str, barriers: Iterable[dict]) -> Dict[int, float]:
+        """Node penalties for barriers, applied to nodes within BARRIER_NODE_RADIUS"""
+        table = BARRIER_PENALTIES.get(mode, BARRIER_PENALTIES[DEFAULT_MODE])
+        penalties: Dict[int, float] = {}
+        for barrier in barriers:
+            node = self.nearest_node(barrier["latitude"], barrier["longitude"], BARRIER_NODE_RADIUS)
+            if node is not None:
+                penalties[node] = penalties.get(node, 0.0) + table.get(barrier.get("severity", "medium"), table["medium"])
+        return penalties
+
+    def shortest_path(self, source: int, target: int, mode: str, penalties: Optional[Dict[int, float]] = None) -> Optional[Tuple[List[int], float]]:
+        """A* from source to target; returns (node path, length in meters) or None"""
+        costs = self.costs.get(mode, self.costs[DEFAULT_MODE])
+        penalties = penalties or {}
+        offsets, targets, lengths = self.offsets, self.targets, self.lengths
+        lat, lng = self.node_lat, self.node_lng
+        goal_lat, goal_lng = lat[target], lng[target]
+        # Equirectangular estimate, shrunk slightly so it never exceeds the haversine edge lengths
+        scale_lat = METERS_PER_DEGREE_LAT * 0.995
+        scale_lng = scale_lat * math.cos(math.radians(min(89.0, abs(goal_lat) + 0.5)))
+
+        def estimate(node: int) -> float:
+            return math.hypot((lat[node] - goal_lat) * scale_lat, (lng[node] - goal_lng) * scale_lng)
+
+        best = {source: 0.0}
+        parent = {source: (-1, 0.0)}
+        # Ties on f are broken towards the larger g, i.e. the node closer to the goal
+        frontier = [(estimate(source), 0.0, source)]
+        closed = set()
+        while frontier:
+            _, negative_cost, node = heapq.heappop(frontier)
+            cost = -negative_cost
+            if node == target:
+                break
+            if node in closed:
+                continue
+            closed.add(node)
+            for slot in range(offsets[node], offsets[node + 1]):
+                step = costs[slot]
+                if step == math.inf:
+                    continue
+                neighbor = targets[slot]
+                candidate = cost + step + penalties.get(neighbor, 0.0)
+                if candidate < best.get(neighbor, math.inf):
+                    best[neighbor] = candidate
+                    parent[neighbor] = (node, lengths[slot])
+                    heapq.heappush(frontier, (candidate + estimate(neighbor), -candidate, neighbor))
+        else:
+            return None
+
+        path, meters = [], 0.0
+        node = target
+        while node != -1:
+            path.append(node)
+            node, length = parent[node]
+            meters += length
+        path.reverse()
+        return path, meters
+
+    def route(self, start_lat: float, start_lng: float, end_lat: float, end_lng: float,
+              mode: str, barriers: Iterable[dict] = (), snap_distance: float = 500.0) -> Optional[dict]:
+        """Route between two coordinates; None when either end is off-network or unreachable"""
+        source = self.nearest_node(start_lat, start_lng, snap_distance)
+        target = self.nearest_node(end_lat, end_lng, snap_distance)
+        if source is None or target is None:
+            return None
+        found = self.shortest_path(source, target, mode, self.barrier_penalties(mode, barriers))
+        if found is None:
+            return None
+        path, meters = found
+        waypoints = [{"latitude": start_lat, "longitude": start_lng}]
+        waypoints += [{"latitude": self.node_lat[node], "longitude": self.node_lng[node]} for node in path]
+        waypoints.append({"latitude": end_lat, "longitude": end_lng})
+        meters += haversine_m(start_lat, start_lng, self.node_lat[source], self.node_lng[source])
+        meters += haversine_m(end_lat, end_lng, self.node_lat[target], self.node_lng[target])
+        return {"waypoints": waypoints, "distance": meters}
+
+def load_graph(path: str) -> PedestrianGraph:
+    """Load a graph from an OSM extract, reusing a `<path>.csr` cache when it is fresh"""
+    cache = path + ".csr"
+    if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(path):
+        return PedestrianGraph.load(cache)
+    graph = PedestrianGraph.from_osm(path)
+    try:
+        graph.save(cache)
+    except OSError:
+        pass
+    return graph
@@ -0,0 +1,188 @@
+"""Accessibility scoring, one item at a time or in NumPy batches.
+
+The single-item functions are what the API uses per request. The batch
+versions turn a list of documents into feature columns and score them in a
+few array operations. Both use the same weight tables, and every weight is a
+multiple of 0.5, so both give exactly the same floats.
+
+rescore_locations walks the whole locations collection in _id order,
+scores each batch vectorized and writes only changed scores with
+bulk_write. Its progress is checkpointed in the `jobs` collection, so an
+interrupted run picks up after the last stored batch. Run from backend/:
+    python -m scoring [--restart] [--batch-size N]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import sys
+from datetime import datetime
+from typing import TYPE_CHECKING, Callable, List, Optional, Sequence
+
+from pymongo import ASCENDING, UpdateOne
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SCORE_BASE = 5.0
+SCORE_MIN = 1.0
+SCORE_MAX = 10.0
+
+# (feature, test on a location document, points added when the test passes)
+LOCATION_WEIGHTS = (
+    ("has_ramp", lambda loc: bool(loc.get("has_ramp")), 2.0),
+    ("has_elevator", lambda loc: bool(loc.get("has_elevator")), 1.5),
+    ("no_stairs", lambda loc: not loc.get("has_stairs"), 1.0),
+    ("smooth_surface", lambda loc: loc.get("surface_type") == "smooth", 1.5),
+    ("low_incline", lambda loc: loc.get("incline_level") == "low", 1.0),
+)
+
+ROUTE_BASE = 8.0
+SEVERITY_PENALTIES = {"low": 0.5, "medium": 1.0, "high": 2.0}
+DEFAULT_SEVERITY_PENALTY = 1.0
+
+# Changes whenever the weights do, so a checkpoint from older weights is not resumed
+SCORING_VERSION = hashlib.blake2b(
+    repr((SCORE_BASE, [(name, weight) for name, _, weight in LOCATION_WEIGHTS])).encode(),
+    digest_size=8
+).hexdigest()
+
+# Fields the location weights read
+SCORE_PROJECTION = {
+    "_id": 1, "sanchara_score": 1, "has_ramp": 1, "has_elevator": 1,
+    "has_stairs": 1, "surface_type": 1, "incline_level": 1,
+}
+
+RESCORE_JOB_ID = "rescore_locations"
+RESCORE_BATCH_SIZE = 2000
+
+def sanchara_score(location: dict) -> float:
+    score = SCORE_BASE
+    for _, test, weight in LOCATION_WEIGHTS:
+        if test(location):
+            score += weight
+    return min(SCORE_MAX, max(SCORE_MIN, score))
+
+# NumPy is imported inside the batch functions: the API only needs it for bulk jobs
+
+def feature_matrix(locations: Sequence[dict]) -> "np.ndarray":
+    """Boolean (len(locations), len(LOCATION_WEIGHTS)) matrix of passed tests"""
+    import numpy as np
+
+    matrix = np.zeros((len(locations), len(LOCATION_WEIGHTS)), dtype=bool)
+    for column, (_, test, _) in enumerate(LOCATION_WEIGHTS):
+        matrix[:, column] = np.fromiter((test(loc) for loc in locations), dtype=bool, count=len(locations))
+    return matrix
+
+def sanchara_scores(locations: Sequence[dict]) -> "np.ndarray":
+    """sanchara_score for every location at once"""
+    import numpy as np
+
+    weights = np.array([weight for _, _, weight in LOCATION_WEIGHTS])
+    scores = SCORE_BASE + feature_matrix(locations) @ weights
+    return np.clip(scores, SCORE_MIN, SCORE_MAX)
+
+def route_accessibility(mode: str, barriers: List[dict]) -> float:
+    score = ROUTE_BASE
+    for barrier in barriers:
+        score -= SEVERITY_PENALTIES.get(barrier.get("severity", "medium"), DEFAULT_SEVERITY_PENALTY)
+    return max(SCORE_MIN, min(SCORE_MAX, score))
+
+def route_accessibilities(mode: str, barrier_lists: Sequence[List[dict]]) -> "np.ndarray":
+    """route_accessibility for many routes, one barrier list each"""
+    import numpy as np
+
+    counts = np.fromiter((len(barriers) for barriers in barrier_lists), dtype=np.intp, count=len(barrier_lists))
+    penalties = np.fromiter(
+        (SEVERITY_PENALTIES.get(b.get("severity", "medium"), DEFAULT_SEVERITY_PENALTY)
+         for barriers in barrier_lists for b in barriers),
+        dtype=float, count=int(counts.sum())
+    )
+    totals = np.bincount(np.repeat(np.arange(len(barrier_lists)), counts), weights=penalties, minlength=len(barrier_lists))
+    return np.clip(ROUTE_BASE - totals, SCORE_MIN, SCORE_MAX)
+
+# ============ Rescoring job ============
+
+async def rescore_locations(db, batch_size: int = RESCORE_BATCH_SIZE, restart: bool = False,
+                            progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """Rescore every location, resuming an unfinished run with the same weights unless `restart`"""
+    state = None if restart else await db.jobs.find_one({"_id": RESCORE_JOB_ID})
+    if state is None or state.get("version") != SCORING_VERSION or state.get("finished_at") is not None:
+        state = {
+            "_id": RESCORE_JOB_ID,
+            "version": SCORING_VERSION,
+            "last_id": None,
+            "processed": 0,
+            "updated": 0,
+            "total": await db.locations.estimated_document_count(),
+            "started_at": datetime.utcnow(),
+            "finished_at": None,
+        }
+        await db.jobs.replace_one({"_id": RESCORE_JOB_ID}, state, upsert=True)
+    else:
+        logger.info("Resuming location rescoring after %d documents", state["processed"])
+
+    while True:
+        query = {} if state["last_id"] is None else {"_id": {"$gt": state["last_id"]}}
+        batch = await db.locations.find(query, SCORE_PROJECTION).sort("_id", ASCENDING).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        scores = sanchara_scores(batch)
+        updates = [
+            UpdateOne({"_id": doc["_id"]}, {"$set": {"sanchara_score": float(score)}})
+            for doc, score in zip(batch, scores)
+            if doc.get("sanchara_score") != score
+        ]
+        if updates:
+            await db.locations.bulk_write(updates, ordered=False)
+        state["last_id"] = batch[-1]["_id"]
+        state["processed"] += len(batch)
+        state["updated"] += len(updates)
+        await db.jobs.update_one({"_id": RESCORE_JOB_ID}, {"$set": {
+            "last_id": state["last_id"], "processed": state["processed"], "updated": state["updated"]
+        }})
+        if progress is not None:
+            progress(state)
+
+    state["finished_at"] = datetime.utcnow()
+    await db.jobs.update_one({"_id": RESCORE_JOB_ID}, {"$set": {"finished_at": state["finished_at"]}})
+    logger.info("Rescored %d locations, %d changed", state["processed"], state["updated"])
+    return state
+
+def job_status(state: Optional[dict]) -> dict:
+    """JSON-safe view of a rescoring checkpoint"""
+    if state is None:
+        return {"status": "never_run"}
+    return {
+        "status": "finished" if state.get("finished_at") else "incomplete",
+        "version": state.get("version"),
+        "current_version": SCORING_VERSION,
+        "processed": state.get("processed", 0),
+        "updated": state.get("updated", 0),
+        "total": state.get("total"),
+        "started_at": state.get("started_at"),
+        "finished_at": state.get("finished_at"),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Rescore every stored location with the current weights")
+    parser.add_argument("--restart", action="store_true", help="ignore an unfinished run and start over")
+    parser.add_argument("--batch-size", type=int, default=RESCORE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    # The server module owns the database settings
+    import server
+
+    def report(state: dict):
+        total = state["total"] or 1
+        print(f"{state['processed']}/{state['total']} ({100.0 * state['processed'] / total:.1f}%), "
+              f"{state['updated']} changed", file=sys.stderr, flush=True)
+
+    state = asyncio.run(rescore_locations(server.db, args.batch_size, args.restart, report))
+    print(json.dumps(job_status(state), default=str))
+
+if __name__ == "__main__":
+    main()
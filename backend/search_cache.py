@@ -0,0 +1,100 @@
+"""Response cache with request coalescing for /api/ai/search.
+
+Answers are cached by (normalized query, mode, ~1 km geo cell, radius
+bucket) with LRU eviction and a TTL. Identical requests that arrive while an
+answer is being generated wait on the same in-flight task instead of calling
+the LLM again; the task is shielded, so a caller disconnecting does not
+cancel it for the others.
+
+A streamed answer is produced by the request itself, so a streaming miss
+registers a future in the same in-flight map with begin() and resolves it
+with the full answer; identical requests meanwhile (streamed or not) wait
+for that. If the leading stream is abandoned its future is cancelled and
+the next waiter takes over.
+"""
+import asyncio
+import math
+import re
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from cachetools import TTLCache
+
+CACHE_SIZE = 4096
+CACHE_TTL = 600.0  # seconds
+GEO_CELL = 0.01  # degrees, ~1.1 km
+RADIUS_BUCKET = 1000.0  # meters
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+def normalize_query(text: str) -> str:
+    return _SPACES.sub(" ", _PUNCTUATION.sub(" ", text.lower())).strip()
+
+def search_cache_key(query: str, user_mode: str, latitude: float, longitude: float, radius: float) -> Tuple:
+    return (
+        normalize_query(query),
+        user_mode.strip().lower(),
+        math.floor(latitude / GEO_CELL),
+        math.floor(longitude / GEO_CELL),
+        int(math.ceil(radius / RADIUS_BUCKET)),
+    )
+
+class SearchCache:
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        self.entries: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.inflight: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            value, pending = self.lookup(key)
+            if pending is None:
+                if value is not None:
+                    return value
+                pending = self.begin(key, asyncio.ensure_future(compute()))
+            # Waiting does not cancel the computation when this caller goes away
+            await asyncio.wait([pending])
+            if not pending.cancelled():
+                return pending.result()
+
+    def lookup(self, key: Hashable) -> Tuple[Any, Optional[asyncio.Future]]:
+        """(cached value, None) on a hit, (None, in-flight future) while another request computes it, else (None, None)"""
+        value = self.entries.get(key)
+        if value is not None:
+            self.hits += 1
+            return value, None
+        pending = self.inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+        return None, pending
+
+    def begin(self, key: Hashable, pending: Optional[asyncio.Future] = None) -> asyncio.Future:
+        """Register the computation of a missed `key`; a caller computing it itself resolves the returned future"""
+        if pending is None:
+            pending = asyncio.get_running_loop().create_future()
+        self.misses += 1
+        self.inflight[key] = pending
+        pending.add_done_callback(lambda done: self._finish(key, done))
+        return pending
+
+    def _finish(self, key: Hashable, task: asyncio.Future):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+        if not task.cancelled() and task.exception() is None:
+            self.entries[key] = task.result()
+
+    def invalidate(self):
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.coalesced) / requests, 4) if requests else 0.0,
+            "size": len(self.entries),
+            "inflight": len(self.inflight),
+        }
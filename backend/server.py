@@ -1,53 +1,126 @@
-from fastapi import FastAPI, APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import DuplicateKeyError
+from cachetools import TTLCache
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 import uuid
 from datetime import datetime
 from bson import ObjectId
-from emergentintegrations.llm.chat import LlmChat, UserMessage
 import asyncio
 import json
+import time
+from geo import corridor_polygons, distance_to_polyline_m, haversine_m, radius_to_degrees, simplify_polyline
+from routing import PedestrianGraph, load_graph
+from realtime import DEFAULT_SUBSCRIPTION_RADIUS, ConnectionManager
+from broker import create_broker
+from search_cache import SearchCache, search_cache_key
+from route_cache import RouteCache, route_cache_key, with_endpoints
+from retrieval import CANDIDATE_LIMIT, CANDIDATE_PROJECTION, SnippetCache, build_context, rank_locations
+import llm
+from heatmap import MAX_ZOOM as MAX_HEATMAP_ZOOM, MIN_ZOOM as MIN_HEATMAP_ZOOM, HeatmapTiles, LiveHeatmap
+from ingest import BATCH_SIZE as INGEST_BATCH_SIZE, BulkIngest, ndjson_lines
+from scoring import RESCORE_JOB_ID, job_status, rescore_locations, route_accessibility, sanchara_score, sanchara_scores
+from serialization import RowEncoder
+from pagination import MAX_PAGE_SIZE, InvalidCursor, geo_page, geo_stream, page_ranked, query_fingerprint
+import auth
+from database import ensure_indexes, mongo_client_options, warm_pool
+from write_behind import WriteBehind
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY as METRICS, MetricsMiddleware, MongoCommandMetrics
+from barriers import BroadcastThrottle, CellLocks, merge_report
+from alerts import AlertIndex, default_expiry
+from photos import (
+    CACHE_CONTROL as PHOTO_CACHE_CONTROL, DIGEST_PATTERN, PhotoError, PhotoStore, RangeNotSatisfiable,
+    decode_photo, parse_range, photo_url, thumbnail_url
+)
+import hashlib
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# Command timings per collection go to /metrics
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandMetrics()], **mongo_client_options())
 db = client[os.environ['DB_NAME']]
 
+# Pedestrian routing graph, loaded at startup when OSM_EXTRACT_PATH is set
+route_graph: Optional[PedestrianGraph] = None
+ROUTE_SEARCH_PADDING = 1000.0  # meters around the start/end box to look for barriers
+ROUTE_CORRIDOR_WIDTH = 30.0  # meters either side of the path that count as "on the route"
+
+# Route history is written in batches after the response (see write_behind.py)
+route_history = WriteBehind(db.routes)
+
+# Computed routes by snapped endpoints and mode, dropped when a barrier or alert changes along them
+route_cache = RouteCache(corridor=ROUTE_CORRIDOR_WIDTH)
+
+# Heatmap aggregates, built in the background after startup; new locations reach every worker's copy through the broker
+heatmap = LiveHeatmap()
+HEATMAP_POINTS_PER_MESSAGE = 500  # keeps one broker message well under a datagram
+HEATMAP_CACHE_CONTROL = "public, max-age=30"
+HEATMAP_RETRY_AFTER = "5"  # seconds, for requests that arrive before the first build is done
+
+# AI search answers, cached per query/mode/area with in-flight coalescing
+search_cache = SearchCache()
+location_snippets = SnippetCache()
+
+# Barrier photos, stored once per content hash outside the barrier documents
+photo_store = PhotoStore(os.environ.get('PHOTO_STORE_PATH', str(ROOT_DIR / 'photo_store')))
+photo_jobs: set = set()
+
+# Background full-collection rescoring, see scoring.py
+rescore_task: Optional[asyncio.Task] = None
+
+# User profiles by id (no _id, no password); dropped on profile changes in any worker
+user_profiles = TTLCache(maxsize=auth.USER_CACHE_SIZE, ttl=auth.USER_CACHE_TTL)
+USER_PROFILE_PROJECTION = {"_id": 0, "password": 0}
+
+# Set by the last startup hook; see /api/health/ready
+app_ready = False
+index_failures: List[str] = []
+READINESS_PING_TIMEOUT = 1.0  # seconds
+
 # Create the main app without a prefix
 app = FastAPI()
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
-# WebSocket connections manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+# WebSocket connections manager (per-socket send queues, see realtime.py)
+manager = ConnectionManager()
+BARRIER_ALERT_RADIUS = 100.0  # meters around a new high-severity barrier that get notified
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
+# Reports of the same barrier are merged, and its broadcasts throttled (see barriers.py)
+barrier_locks = CellLocks()
+barrier_reports = METRICS.counter("barrier_reports_total", "Barrier reports by outcome (new or merged)", ("outcome",))
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+# Route cache figures for tuning ROUTE_CACHE_CELL, read at scrape time
+METRICS.counter("route_cache_hits_total", "Routes served from the route cache", function=lambda: route_cache.hits)
+METRICS.counter("route_cache_misses_total", "Routes computed on a cache miss", function=lambda: route_cache.misses)
+METRICS.counter("route_cache_coalesced_total", "Route requests that waited on an identical computation",
+                function=lambda: route_cache.coalesced)
+METRICS.counter("route_cache_invalidations_total", "Barrier and alert changes that dropped cached routes",
+                function=lambda: route_cache.invalidations)
+METRICS.counter("route_cache_invalidated_total", "Cached routes dropped by barrier and alert changes",
+                function=lambda: route_cache.invalidated)
+METRICS.gauge("route_cache_size", "Routes in the route cache", function=lambda: len(route_cache))
 
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except:
-                pass
+# WebSocket figures for /metrics, read at scrape time
+METRICS.gauge("websocket_connections", "Open alert WebSockets", function=lambda: len(manager.connections))
+METRICS.gauge("websocket_subscribers", "Alert WebSockets with a subscribed area", function=lambda: len(manager.subscribers))
+METRICS.gauge("websocket_send_queue_depth", "Messages waiting in per-socket send queues", function=manager.queued)
+METRICS.gauge("websocket_fanout_backlog", "Broadcasts waiting for the fan-out task", function=lambda: len(manager.outbox))
+METRICS.counter("websocket_dropped_messages_total", "Messages dropped from full send queues", function=manager.dropped)
 
-manager = ConnectionManager()
+# Unexpired alerts, loaded at startup and kept in step across workers through the broker
+active_alerts = AlertIndex()
 
 # ============ Models ============
 
@@ -106,10 +179,13 @@ class Barrier(BaseModel):
     barrier_type: str  # pothole, missing_ramp, stairs, construction, curb
     severity: str  # low, medium, high
     description: str
-    photo_base64: Optional[str] = None
+    photo_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
     ai_classification: Optional[str] = None  # Mocked AI analysis
     verified: bool = False
+    report_count: int = 1  # reports merged into this barrier
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    last_reported_at: Optional[datetime] = None  # with the severity of that latest report
 
 class BarrierCreate(BaseModel):
     user_id: str
@@ -138,6 +214,7 @@ class AlertCreate(BaseModel):
     message: str
     severity: str
     radius: Optional[float] = 100.0
+    expires_in: Optional[float] = None  # seconds; defaults to the lifetime for alert_type
 
 class AISearchQuery(BaseModel):
     query: str
@@ -169,8 +246,22 @@ class RouteRequest(BaseModel):
     end_lng: float
     mode: str
 
+# List endpoints encode projected documents directly (see serialization.py)
+location_rows = RowEncoder(Location)
+barrier_rows = RowEncoder(Barrier)
+alert_rows = RowEncoder(Alert)
+
 # ============ Helper Functions ============
 
+def geo_point(latitude: float, longitude: float) -> dict:
+    """GeoJSON point for the 2dsphere indexes (coordinates are lng, lat)"""
+    return {"type": "Point", "coordinates": [longitude, latitude]}
+
+def with_geo(document: dict) -> dict:
+    """Attach the indexed GeoJSON `location` field to a document before insert"""
+    document["location"] = geo_point(document["latitude"], document["longitude"])
+    return document
+
 def mock_image_analysis(photo_base64: Optional[str] = None) -> str:
     """Mock AI image analysis for barriers"""
     import random
@@ -185,64 +276,122 @@ def mock_image_analysis(photo_base64: Optional[str] = None) -> str:
     ]
     return random.choice(classifications)
 
+def queue_thumbnail(digest: str):
+    job = asyncio.create_task(asyncio.to_thread(photo_store.make_thumbnail, digest))
+    photo_jobs.add(job)
+    job.add_done_callback(photo_jobs.discard)
+
+async def store_photo(data: bytes) -> dict:
+    """Save a decoded photo and queue its thumbnail; returns the barrier URL fields"""
+    digest = await asyncio.to_thread(photo_store.put, data)
+    queue_thumbnail(digest)
+    return {"photo_url": photo_url(digest), "thumbnail_url": thumbnail_url(digest)}
+
+def bbox_polygon(min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> dict:
+    """GeoJSON polygon for a lat/lng box, usable with $geoWithin on a 2dsphere index"""
+    return {
+        "type": "Polygon",
+        "coordinates": [[
+            [min_lng, min_lat], [max_lng, min_lat], [max_lng, max_lat],
+            [min_lng, max_lat], [min_lng, min_lat]
+        ]]
+    }
+
+async def nearby_response(collection, rows: RowEncoder, latitude: float, longitude: float, radius: float,
+                          query: dict, limit: int, cursor: Optional[str], format: str) -> Response:
+    """Nearest-first list: one keyset page (next token in X-Next-Cursor) or, with format=ndjson, a stream of every match"""
+    fingerprint = query_fingerprint(collection.name, latitude, longitude, radius, query)
+    point = geo_point(latitude, longitude)
+    try:
+        if format == "ndjson":
+            batches = geo_stream(collection, point, radius, query, rows.projection, fingerprint, cursor)
+            return StreamingResponse((rows.ndjson(batch) async for batch in batches), media_type="application/x-ndjson")
+        documents, next_cursor = await geo_page(collection, point, radius, query, rows.projection, limit, fingerprint, cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response = rows.response(documents)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+async def find_corridor_barriers(waypoints: List[Dict[str, float]], buffer: float = ROUTE_CORRIDOR_WIDTH) -> List[dict]:
+    """Barriers within `buffer` meters of the route polyline.
+
+    The 2dsphere index is probed with one rectangle per segment of a
+    simplified path, then candidates are checked exactly against the full path.
+    """
+    path = [(point["latitude"], point["longitude"]) for point in waypoints]
+    tolerance = buffer / 2
+    polygons = corridor_polygons(simplify_polyline(path, tolerance), buffer + tolerance)
+    candidates = await db.barriers.find(
+        {"$or": [{"location": {"$geoWithin": {"$geometry": polygon}}} for polygon in polygons]},
+        {"_id": 0, "id": 1, "latitude": 1, "longitude": 1, "severity": 1}
+    ).to_list(None)
+    return [
+        barrier for barrier in candidates
+        if distance_to_polyline_m(barrier["latitude"], barrier["longitude"], path) <= buffer
+    ]
+
 def calculate_sanchara_score(location_data: dict) -> float:
-    """Calculate accessibility score based on features"""
-    score = 5.0
-    if location_data.get("has_ramp"):
-        score += 2.0
-    if location_data.get("has_elevator"):
-        score += 1.5
-    if not location_data.get("has_stairs"):
-        score += 1.0
-    if location_data.get("surface_type") == "smooth":
-        score += 1.5
-    if location_data.get("incline_level") == "low":
-        score += 1.0
-    
-    return min(10.0, max(1.0, score))
+    """Calculate accessibility score based on features (weights in scoring.py)"""
+    return sanchara_score(location_data)
 
 def calculate_route_accessibility(mode: str, barriers: List[dict]) -> float:
     """Calculate route accessibility based on mode and barriers"""
-    base_score = 8.0
-    
-    for barrier in barriers:
-        severity_impact = {
-            "low": 0.5,
-            "medium": 1.0,
-            "high": 2.0
-        }
-        base_score -= severity_impact.get(barrier.get("severity", "medium"), 1.0)
-    
-    return max(1.0, min(10.0, base_score))
+    return route_accessibility(mode, barriers)
 
 # ============ Routes ============
 
-@api_router.post("/auth/register", response_model=User)
+@api_router.post("/auth/register", response_model=User, response_model_exclude={"password"})
 async def register_user(user: UserCreate):
     """Register a new user"""
-    existing = await db.users.find_one({"username": user.username})
+    existing = await db.users.find_one({"username": user.username}, {"_id": 1})
     if existing:
         raise HTTPException(status_code=400, detail="Username already exists")
     
     user_obj = User(**user.dict())
-    await db.users.insert_one(user_obj.dict())
+    user_obj.password = await auth.hash_password(user.password)
+    try:
+        await db.users.insert_one(user_obj.dict())
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration of the same name
+        raise HTTPException(status_code=400, detail="Username already exists")
     return user_obj
 
 @api_router.post("/auth/login")
 async def login_user(credentials: UserLogin):
     """Login user"""
-    user = await db.users.find_one({"username": credentials.username, "password": credentials.password})
+    user = await db.users.find_one({"username": credentials.username}, {"_id": 0})
     if not user:
+        await auth.burn_verification(credentials.password)
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    matches, rehash = await auth.verify_password(credentials.password, user["password"])
+    if not matches:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    if rehash:
+        # Plaintext from before hashing (or an outdated cost): store a fresh hash
+        await db.users.update_one(
+            {"id": user["id"], "password": user["password"]},
+            {"$set": {"password": await auth.hash_password(credentials.password)}}
+        )
     
     return {"user_id": user["id"], "username": user["username"], "mode": user["mode"], "is_premium": user.get("is_premium", False)}
 
+def drop_cached_profile(message: dict):
+    """Topic handler: forget a changed profile in every worker"""
+    user_profiles.pop(message["id"], None)
+
+manager.on_topic("user", drop_cached_profile)
+
 @api_router.get("/users/{user_id}")
 async def get_user(user_id: str):
     """Get user profile"""
-    user = await db.users.find_one({"id": user_id})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    user = user_profiles.get(user_id)
+    if user is None:
+        user = await db.users.find_one({"id": user_id}, USER_PROFILE_PROJECTION)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        user_profiles[user_id] = user
     return user
 
 @api_router.put("/users/{user_id}/mode")
@@ -252,8 +401,9 @@ async def update_user_mode(user_id: str, mode: dict):
         {"id": user_id},
         {"$set": {"mode": mode["mode"]}}
     )
-    if result.modified_count == 0:
+    if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    manager.notify("user", {"id": user_id})
     return {"success": True, "mode": mode["mode"]}
 
 @api_router.post("/users/{user_id}/premium")
@@ -263,8 +413,9 @@ async def upgrade_to_premium(user_id: str):
         {"id": user_id},
         {"$set": {"is_premium": True}}
     )
-    if result.modified_count == 0:
+    if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    manager.notify("user", {"id": user_id})
     return {"success": True, "is_premium": True}
 
 @api_router.post("/locations", response_model=Location)
@@ -273,129 +424,390 @@ async def create_location(location: LocationCreate):
     loc_dict = location.dict()
     loc_dict["sanchara_score"] = calculate_sanchara_score(loc_dict)
     location_obj = Location(**loc_dict)
-    await db.locations.insert_one(location_obj.dict())
+    await db.locations.insert_one(with_geo(location_obj.dict()))
+    announce_heatmap_points([location_obj.dict()])
     return location_obj
 
+def announce_heatmap_points(locations: List[dict]):
+    """Send new locations to every worker's heatmap tiles, this one included"""
+    points = [
+        [loc["latitude"], loc["longitude"], loc["sanchara_score"], loc["created_at"].isoformat()]
+        for loc in locations
+    ]
+    for start in range(0, len(points), HEATMAP_POINTS_PER_MESSAGE):
+        manager.notify("heatmap", {"points": points[start:start + HEATMAP_POINTS_PER_MESSAGE]})
+
+def add_heatmap_points(message: dict):
+    """Topic handler: fold locations created by any worker into the heatmap tiles"""
+    for latitude, longitude, score, created_at in message["points"]:
+        heatmap.add(latitude, longitude, score, datetime.fromisoformat(created_at))
+
+manager.on_topic("heatmap", add_heatmap_points)
+
 @api_router.get("/locations", response_model=List[Location])
 async def get_locations(
     latitude: float,
     longitude: float,
     radius: float = 5000.0,
-    min_score: Optional[float] = None
+    min_score: Optional[float] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    format: str = "json"
 ):
-    """Get locations within radius with optional score filter"""
-    # Simple radius search (in production, use geospatial queries)
+    """Get locations within radius with optional score filter, nearest first.
+
+    Pass the X-Next-Cursor header of a page as `cursor` to get the next one;
+    `format=ndjson` streams every match instead.
+    """
     query = {}
-    if min_score:
+    if min_score is not None:
         query["sanchara_score"] = {"$gte": min_score}
-    
-    locations = await db.locations.find(query).limit(100).to_list(100)
-    return [Location(**loc) for loc in locations]
+    return await nearby_response(db.locations, location_rows, latitude, longitude, radius, query, limit, cursor, format)
+
+def built_heatmap() -> HeatmapTiles:
+    """The heatmap tiles, or a 503 while the first build after startup is still running"""
+    tiles = heatmap.tiles
+    if tiles is None:
+        raise HTTPException(status_code=503, detail="Heatmap is still being built",
+                            headers={"Retry-After": HEATMAP_RETRY_AFTER})
+    return tiles
 
 @api_router.get("/locations/heatmap")
 async def get_heatmap_data(
+    request: Request,
     latitude: float,
     longitude: float,
     radius: float = 10000.0
 ):
-    """Get heatmap data for accessibility scores"""
-    locations = await db.locations.find().limit(200).to_list(200)
+    """Get heatmap data for accessibility scores from the pre-aggregated tiles"""
+    built = built_heatmap()
+    tiles = [built.tile(*key) for key in built.tiles_for_viewport(latitude, longitude, radius)]
+    etag = '"%s"' % hashlib.blake2b("".join(t[0] for t in tiles).encode(), digest_size=8).hexdigest()
+    headers = {"ETag": etag, "Cache-Control": HEATMAP_CACHE_CONTROL}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    heatmap_data = [point for _, _, points in tiles for point in points]
+    return Response(content=json.dumps({"heatmap": heatmap_data}), media_type="application/json", headers=headers)
+
+@api_router.get("/locations/heatmap/tiles/{z}/{x}/{y}")
+async def get_heatmap_tile(request: Request, z: int, x: int, y: int):
+    """Get one z/x/y heatmap tile of per-cell count, mean and min score"""
+    if not MIN_HEATMAP_ZOOM <= z <= MAX_HEATMAP_ZOOM or not (0 <= x < 1 << z and 0 <= y < 1 << z):
+        raise HTTPException(status_code=404, detail="Tile out of range")
+    etag, body, _ = built_heatmap().tile(z, x, y)
+    headers = {"ETag": etag, "Cache-Control": HEATMAP_CACHE_CONTROL}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+async def build_barrier(barrier: BarrierCreate) -> Tuple[Barrier, Optional[str]]:
+    """Barrier with its photo written to the photo store, and the photo's digest if that created a new file.
+
+    Raises PhotoError for a bad photo and OSError when it cannot be written.
+    The thumbnail is left to the caller (queue_thumbnail).
+    """
+    barrier_dict = barrier.dict()
+    photo = barrier_dict.pop("photo_base64", None)
+    new_photo = None
     
-    heatmap_data = [
-        {
-            "latitude": loc["latitude"],
-            "longitude": loc["longitude"],
-            "score": loc["sanchara_score"],
-            "intensity": loc["sanchara_score"] / 10.0
-        }
-        for loc in locations
-    ]
+    if photo:
+        data = decode_photo(photo)
+        # Mock AI image analysis
+        barrier_dict["ai_classification"] = mock_image_analysis(photo)
+        digest, created = await asyncio.to_thread(photo_store.add, data)
+        barrier_dict.update(photo_url=photo_url(digest), thumbnail_url=thumbnail_url(digest))
+        new_photo = digest if created else None
     
-    return {"heatmap": heatmap_data}
+    return Barrier(**barrier_dict), new_photo
+
+async def broadcast_barrier(key: str, barrier: dict):
+    await manager.broadcast(
+        {
+            "type": "new_barrier",
+            "id": barrier["id"],
+            "barrier_type": barrier["barrier_type"],
+            "latitude": barrier["latitude"],
+            "longitude": barrier["longitude"],
+            "severity": barrier["severity"],
+            "report_count": barrier.get("report_count", 1)
+        },
+        key=key, latitude=barrier["latitude"], longitude=barrier["longitude"], radius=BARRIER_ALERT_RADIUS
+    )
+
+barrier_broadcasts = BroadcastThrottle(broadcast_barrier)
+
+def announce_barrier_change(barrier: dict):
+    """Tell every worker that a barrier was added or changed, so routes through it are recomputed"""
+    manager.notify("barrier", {"latitude": barrier["latitude"], "longitude": barrier["longitude"]})
+
+def announce_barrier_batch(barriers: List[dict]):
+    """One announcement for a batch of imported barriers: the box around all of them"""
+    manager.notify("barrier", {"box": [
+        min(b["latitude"] for b in barriers), min(b["longitude"] for b in barriers),
+        max(b["latitude"] for b in barriers), max(b["longitude"] for b in barriers)
+    ]})
+
+def invalidate_barrier_routes(message: dict):
+    """Topic handler: drop cached routes near a barrier (or a box of them) changed by any worker"""
+    if "box" in message:
+        route_cache.invalidate_box(*message["box"])
+    else:
+        route_cache.invalidate_near(message["latitude"], message["longitude"])
+
+manager.on_topic("barrier", invalidate_barrier_routes)
+METRICS.counter(
+    "barrier_broadcasts_suppressed_total", "Barrier broadcasts collapsed by the per-barrier throttle",
+    function=lambda: barrier_broadcasts.suppressed
+)
 
 @api_router.post("/barriers", response_model=Barrier)
 async def report_barrier(barrier: BarrierCreate):
-    """Report a new accessibility barrier"""
-    barrier_dict = barrier.dict()
-    
-    # Mock AI image analysis
-    if barrier_dict.get("photo_base64"):
-        barrier_dict["ai_classification"] = mock_image_analysis(barrier_dict["photo_base64"])
-    
-    barrier_obj = Barrier(**barrier_dict)
-    await db.barriers.insert_one(barrier_obj.dict())
+    """Report an accessibility barrier; a report next to a barrier of the same type is merged into it"""
+    try:
+        # The photo file is written first, so a stored barrier never points at a missing photo
+        barrier_obj, new_photo = await build_barrier(barrier)
+    except PhotoError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OSError:
+        logger.exception("Could not write a barrier photo")
+        raise HTTPException(status_code=503, detail="Photo storage is unavailable")
+    stored, merged = await merge_report(db.barriers, with_geo(barrier_obj.dict()), barrier_locks)
+    if new_photo is not None:
+        if stored.get("photo_url") == barrier_obj.photo_url:
+            queue_thumbnail(new_photo)
+        else:
+            # Folded into a barrier that already has a photo. The file is new, so no earlier barrier
+            # uses it; only an identical photo reported at this very moment could share it.
+            await asyncio.to_thread(photo_store.delete, new_photo)
+    barrier_reports.labels("merged" if merged else "new").inc()
+    announce_barrier_change(stored)
     
-    # Broadcast alert to premium users if high severity
-    if barrier.severity == "high":
-        alert_msg = {
-            "type": "new_barrier",
-            "barrier_type": barrier.barrier_type,
-            "latitude": barrier.latitude,
-            "longitude": barrier.longitude,
-            "severity": barrier.severity
-        }
-        await manager.broadcast(alert_msg)
+    # Broadcast alert to premium users while the latest severity is high, at most once per window
+    key = f"barrier:{stored['id']}"
+    if stored["severity"] == "high":
+        await barrier_broadcasts.submit(key, stored)
+    else:
+        barrier_broadcasts.cancel(key)
     
-    return barrier_obj
+    return Barrier(**stored)
 
 @api_router.get("/barriers", response_model=List[Barrier])
 async def get_barriers(
     latitude: float,
     longitude: float,
-    radius: float = 5000.0
+    radius: float = 5000.0,
+    limit: int = Query(200, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    format: str = "json"
 ):
-    """Get barriers within radius"""
-    barriers = await db.barriers.find().limit(200).to_list(200)
-    return [Barrier(**b) for b in barriers]
+    """Get barriers within radius, nearest first (paged like /locations)"""
+    # The projection also leaves out legacy inline photos
+    return await nearby_response(db.barriers, barrier_rows, latitude, longitude, radius, {}, limit, cursor, format)
+
+async def serve_photo(request: Request, digest: str, thumbnail: bool) -> Response:
+    if not DIGEST_PATTERN.match(digest):
+        raise HTTPException(status_code=404, detail="Photo not found")
+    info = await asyncio.to_thread(photo_store.stat, digest, thumbnail)
+    if info is None and thumbnail and await asyncio.to_thread(photo_store.make_thumbnail, digest):
+        info = await asyncio.to_thread(photo_store.stat, digest, thumbnail)
+    if info is None and thumbnail:
+        # Not decodable as an image (or the job failed); the original is still useful
+        thumbnail = False
+        info = await asyncio.to_thread(photo_store.stat, digest)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Photo not found")
+    size, content_type = info
+    etag = f'"{digest}.thumb"' if thumbnail else f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": PHOTO_CACHE_CONTROL, "Accept-Ranges": "bytes"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range != etag:
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    start, end = byte_range or (0, size - 1)
+    body = await asyncio.to_thread(photo_store.read, digest, start, end, thumbnail) if size else b""
+    if byte_range is None:
+        return Response(content=body, media_type=content_type, headers=headers)
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(content=body, status_code=206, media_type=content_type, headers=headers)
+
+@api_router.get("/photos/{digest}")
+async def get_photo(request: Request, digest: str):
+    """Barrier photo by content hash; supports Range and If-None-Match"""
+    return await serve_photo(request, digest, thumbnail=False)
+
+@api_router.get("/photos/{digest}/thumbnail")
+async def get_photo_thumbnail(request: Request, digest: str):
+    """JPEG thumbnail of a barrier photo, built on demand if the background job has not run"""
+    return await serve_photo(request, digest, thumbnail=True)
+
+async def prepare_location_row(row: dict) -> dict:
+    return with_geo(Location(**LocationCreate(**row).dict()).dict())
+
+def score_locations(documents: List[dict]):
+    for doc, score in zip(documents, sanchara_scores(documents)):
+        doc["sanchara_score"] = float(score)
+
+async def prepare_barrier_row(row: dict) -> dict:
+    try:
+        barrier_obj, new_photo = await build_barrier(BarrierCreate(**row))
+    except OSError as e:
+        # Reported against the row like any other bad row, before anything points at the photo
+        raise ValueError(f"Could not write the photo: {e}")
+    if new_photo is not None:
+        queue_thumbnail(new_photo)
+    return with_geo(barrier_obj.dict())
+
+def bulk_ingest(kind: str, batch_size: int = INGEST_BATCH_SIZE) -> BulkIngest:
+    """Ingest job for `locations` or `barriers` rows; bulk barriers are not broadcast"""
+    if kind == "locations":
+        return BulkIngest(
+            db.locations, prepare_location_row, batch_size,
+            before_insert=score_locations,
+            after_batch=announce_heatmap_points
+        )
+    if kind == "barriers":
+        return BulkIngest(db.barriers, prepare_barrier_row, batch_size, after_batch=announce_barrier_batch)
+    raise ValueError(f"Unknown ingest kind: {kind}")
+
+@api_router.post("/locations/bulk")
+async def bulk_create_locations(request: Request):
+    """Create locations from an NDJSON body (one LocationCreate per line)"""
+    return await bulk_ingest("locations").report(ndjson_lines(request.stream()))
+
+@api_router.post("/barriers/bulk")
+async def bulk_report_barriers(request: Request):
+    """Create barriers from an NDJSON body (one BarrierCreate per line)"""
+    return await bulk_ingest("barriers").report(ndjson_lines(request.stream()))
 
 @api_router.post("/alerts", response_model=Alert)
 async def create_alert(alert: AlertCreate):
     """Create a real-time alert (premium feature)"""
-    alert_obj = Alert(**alert.dict())
-    await db.alerts.insert_one(alert_obj.dict())
+    alert_dict = alert.dict()
+    expires_in = alert_dict.pop("expires_in")
+    alert_obj = Alert(**alert_dict)
+    alert_obj.expires_at = default_expiry(alert_obj.alert_type, alert_obj.created_at, expires_in)
+    await db.alerts.insert_one(with_geo(alert_obj.dict()))
+    active_alerts.add(alert_obj.dict())
     
-    # Broadcast to connected premium users
+    # Broadcast to connected premium users; the "alert" topic also indexes it in every worker
     await manager.broadcast({
         "type": "alert",
+        "id": alert_obj.id,
         "alert_type": alert.alert_type,
         "message": alert.message,
         "latitude": alert.latitude,
         "longitude": alert.longitude,
-        "severity": alert.severity
-    })
+        "severity": alert.severity,
+        "radius": alert_obj.radius,
+        "created_at": alert_obj.created_at.isoformat(),
+        "expires_at": alert_obj.expires_at.isoformat()
+    }, key=f"alert:{alert_obj.id}", latitude=alert_obj.latitude, longitude=alert_obj.longitude,
+        radius=alert_obj.radius, topic="alert")
     
     return alert_obj
 
+def index_broadcast_alert(message: dict):
+    """Topic handler: index alerts created by any worker and drop cached routes they reach"""
+    alert = Alert(**message)
+    active_alerts.add(alert.dict())
+    route_cache.invalidate_near(alert.latitude, alert.longitude, alert.radius)
+
+manager.on_topic("alert", index_broadcast_alert)
+
+def announce_expired_alert(alert: dict):
+    """Tell this worker's subscribers to drop an expired alert; every worker expires its own copy"""
+    route_cache.invalidate_near(alert["latitude"], alert["longitude"], alert["radius"])
+    manager.broadcast_local({
+        "type": "alert_expired",
+        "id": alert["id"],
+        "alert_type": alert["alert_type"],
+        "latitude": alert["latitude"],
+        "longitude": alert["longitude"]
+    }, key=f"alert:{alert['id']}", latitude=alert["latitude"], longitude=alert["longitude"], radius=alert["radius"])
+
 @api_router.get("/alerts", response_model=List[Alert])
 async def get_active_alerts(
     latitude: float,
     longitude: float,
-    radius: float = 1000.0
+    radius: float = 1000.0,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    format: str = "json"
 ):
-    """Get active alerts within radius"""
-    alerts = await db.alerts.find().limit(50).to_list(50)
-    return [Alert(**a) for a in alerts]
+    """Get unexpired alerts within radius, nearest first (paged like /locations), from memory"""
+    ranked = active_alerts.nearby(latitude, longitude, radius)
+    fingerprint = query_fingerprint("alerts", latitude, longitude, radius)
+    try:
+        alerts, next_cursor = page_ranked(ranked, len(ranked) if format == "ndjson" else limit, fingerprint, cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if format == "ndjson":
+        return Response(content=alert_rows.ndjson(alerts), media_type="application/x-ndjson")
+    response = alert_rows.response(alerts)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+async def compute_route(route_req: RouteRequest) -> dict:
+    """Path, distance, accessibility score and barrier ids of a route; raises 404 when there is none"""
+    if route_graph is not None:
+        # Barriers in the box spanned by both ends, padded so detours are covered
+        pad_lat, pad_lng = radius_to_degrees(max(abs(route_req.start_lat), abs(route_req.end_lat)), ROUTE_SEARCH_PADDING)
+        box = bbox_polygon(
+            min(route_req.start_lat, route_req.end_lat) - pad_lat,
+            min(route_req.start_lng, route_req.end_lng) - pad_lng,
+            max(route_req.start_lat, route_req.end_lat) + pad_lat,
+            max(route_req.start_lng, route_req.end_lng) + pad_lng
+        )
+        nearby = await db.barriers.find(
+            {"location": {"$geoWithin": {"$geometry": box}}},
+            {"_id": 0, "id": 1, "latitude": 1, "longitude": 1, "severity": 1}
+        ).to_list(None)
+        computed = await asyncio.to_thread(
+            route_graph.route,
+            route_req.start_lat, route_req.start_lng,
+            route_req.end_lat, route_req.end_lng,
+            route_req.mode, nearby
+        )
+        if computed is None:
+            raise HTTPException(status_code=404, detail="No accessible route found")
+        distance = computed["distance"]
+        waypoints = computed["waypoints"]
+    else:
+        # No routing graph configured: straight line between the two points
+        distance = haversine_m(route_req.start_lat, route_req.start_lng, route_req.end_lat, route_req.end_lng)
+        waypoints = [
+            {"latitude": route_req.start_lat, "longitude": route_req.start_lng},
+            {"latitude": (route_req.start_lat + route_req.end_lat) / 2,
+             "longitude": (route_req.start_lng + route_req.end_lng) / 2},
+            {"latitude": route_req.end_lat, "longitude": route_req.end_lng}
+        ]
+
+    # Only barriers actually along the chosen path count towards the score
+    barriers = await find_corridor_barriers(waypoints)
+    return {
+        "distance": distance,
+        "waypoints": waypoints,
+        "accessibility_score": calculate_route_accessibility(route_req.mode, barriers),
+        "barriers": [b["id"] for b in barriers]
+    }
 
 @api_router.post("/routes", response_model=Route)
 async def calculate_route(route_req: RouteRequest):
     """Calculate accessible route based on mode"""
-    # Find barriers along potential route
-    barriers = await db.barriers.find().limit(50).to_list(50)
-    
-    # Simple route calculation (in production, use proper routing algorithm)
-    distance = ((route_req.end_lat - route_req.start_lat)**2 + 
-                (route_req.end_lng - route_req.start_lng)**2) ** 0.5 * 111000  # rough meters
-    
-    # Generate waypoints
-    waypoints = [
-        {"latitude": route_req.start_lat, "longitude": route_req.start_lng},
-        {"latitude": (route_req.start_lat + route_req.end_lat) / 2, 
-         "longitude": (route_req.start_lng + route_req.end_lng) / 2},
-        {"latitude": route_req.end_lat, "longitude": route_req.end_lng}
-    ]
-    
-    accessibility_score = calculate_route_accessibility(route_req.mode, barriers)
-    
+    key = route_cache_key(route_req.mode, route_req.start_lat, route_req.start_lng, route_req.end_lat, route_req.end_lng)
+    computed = await route_cache.get_or_compute(key, lambda: compute_route(route_req))
+    # Requests snapped to the same cells share a path; it still starts and ends where asked
+    waypoints, distance = with_endpoints(
+        computed, route_req.start_lat, route_req.start_lng, route_req.end_lat, route_req.end_lng
+    )
+
     route = Route(
         user_id=route_req.user_id,
         start_lat=route_req.start_lat,
@@ -405,69 +817,231 @@ async def calculate_route(route_req: RouteRequest):
         mode=route_req.mode,
         distance=distance,
         duration=distance / 1.4,  # rough walking speed
-        accessibility_score=accessibility_score,
+        accessibility_score=computed["accessibility_score"],
         waypoints=waypoints,
-        barriers=[b["id"] for b in barriers[:5]]
+        barriers=computed["barriers"]
     )
     
-    await db.routes.insert_one(route.dict())
+    # History only: queued, so the insert is off the response path
+    await route_history.put(route.dict())
     return route
 
+@api_router.get("/routes/stats")
+async def route_cache_stats():
+    """Hit rate, invalidations and size of the route cache"""
+    return route_cache.stats()
+
+async def nearby_candidates(latitude: float, longitude: float, radius: float) -> List[dict]:
+    """Nearest locations within radius with their distance, projected for ranking"""
+    return await db.locations.aggregate([
+        {"$geoNear": {
+            "near": geo_point(latitude, longitude),
+            "distanceField": "distance",
+            "maxDistance": radius,
+            "spherical": True
+        }},
+        {"$limit": CANDIDATE_LIMIT},
+        {"$project": {**CANDIDATE_PROJECTION, "distance": 1}}
+    ]).to_list(CANDIDATE_LIMIT)
+
+async def prepare_search(query: AISearchQuery):
+    """Rank the best nearby locations for the mode and build the prompt around them"""
+    candidates = await nearby_candidates(query.latitude, query.longitude, query.radius)
+    ranked = rank_locations(candidates, query.user_mode, query.radius)
+    listing, _ = build_context(location_snippets, ranked)
+    
+    prompt = "\n".join([
+        f"User is searching for accessible locations. Their accessibility mode is: {query.user_mode}",
+        f"Current location: ({query.latitude}, {query.longitude})",
+        f"Search radius: {query.radius} meters",
+        "",
+        "Most relevant nearby locations:",
+        listing or "(none found within the radius)",
+        "",
+        f"User query: {query.query}"
+    ])
+    return ranked, prompt
+
+async def answer_search(query: AISearchQuery) -> dict:
+    """Ask Gemini about the ranked nearby locations"""
+    ranked, prompt = await prepare_search(query)
+    response = await llm.complete(prompt)
+    return {"response": response, "locations_found": len(ranked)}
+
+def search_hit(loc: dict) -> dict:
+    """Location summary sent ahead of the streamed answer"""
+    return {
+        "id": loc["id"],
+        "name": loc["name"],
+        "latitude": loc["latitude"],
+        "longitude": loc["longitude"],
+        "sanchara_score": loc.get("sanchara_score"),
+        "distance": round(loc.get("distance", 0.0), 1)
+    }
+
+def stream_event(event: str, data: dict, ndjson: bool) -> str:
+    if ndjson:
+        return json.dumps({"type": event, **data}) + "\n"
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @api_router.post("/ai/search")
 async def ai_search(query: AISearchQuery):
     """AI-powered conversational search using Gemini"""
+    key = search_cache_key(query.query, query.user_mode, query.latitude, query.longitude, query.radius)
     try:
-        # Get nearby locations for context
-        locations = await db.locations.find().limit(20).to_list(20)
-        
-        # Prepare context for AI
-        context = f"""User is searching for accessible locations. Their accessibility mode is: {query.user_mode}
-Current location: ({query.latitude}, {query.longitude})
-Search radius: {query.radius} meters
-
-Available locations:
-"""
-        for loc in locations:
-            context += f"- {loc['name']} at ({loc['latitude']}, {loc['longitude']}) - Score: {loc['sanchara_score']}/10, "
-            context += f"Ramp: {loc.get('has_ramp', False)}, Elevator: {loc.get('has_elevator', False)}, "
-            context += f"Surface: {loc.get('surface_type', 'unknown')}\n"
-        
-        # Initialize Gemini chat
-        chat = LlmChat(
-            api_key=os.environ['EMERGENT_LLM_KEY'],
-            session_id=f"search_{uuid.uuid4()}",
-            system_message="""You are an accessibility assistant for Sanchara app. 
-Help users find accessible locations based on their needs. Consider:
-- Blind users: Need clear audio landmarks, minimal obstacles
-- Deaf users: Need visual information, good lighting
-- Wheelchair users: Need ramps, elevators, smooth surfaces, low incline
-
-Provide specific location recommendations with accessibility scores."""
-        ).with_model("gemini", "gemini-2.0-flash")
-        
-        user_message = UserMessage(text=f"{context}\n\nUser query: {query.query}")
-        response = await chat.send_message(user_message)
-        
-        return {
-            "query": query.query,
-            "response": response,
-            "locations_found": len(locations)
-        }
+        answer = await search_cache.get_or_compute(key, lambda: answer_search(query))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI search failed: {str(e)}")
+    
+    return {
+        "query": query.query,
+        "response": answer["response"],
+        "locations_found": answer["locations_found"]
+    }
+
+@api_router.post("/ai/search/stream")
+async def ai_search_stream(query: AISearchQuery, format: str = "sse"):
+    """Streaming AI search: location hits first, then answer tokens as they arrive.
+
+    Server-Sent Events by default (events `locations`, `token`, `done`,
+    `error`), or NDJSON with `?format=ndjson`.
+    """
+    ndjson = format == "ndjson"
+    key = search_cache_key(query.query, query.user_mode, query.latitude, query.longitude, query.radius)
+
+    async def events():
+        try:
+            ranked, prompt = await prepare_search(query)
+            yield stream_event("locations", {"locations": [search_hit(loc) for loc in ranked]}, ndjson)
+            while True:
+                cached, pending = search_cache.lookup(key)
+                if pending is not None:
+                    # The same question is being answered for another request: send its answer in one chunk
+                    await asyncio.wait([pending])
+                    if pending.cancelled():
+                        continue
+                    cached = pending.result()
+                if cached is not None:
+                    response = cached["response"]
+                    yield stream_event("token", {"text": response}, ndjson)
+                    break
+                leader = search_cache.begin(key)
+                try:
+                    chunks = []
+                    async for chunk in llm.stream(prompt):
+                        chunks.append(chunk)
+                        yield stream_event("token", {"text": chunk}, ndjson)
+                    response = "".join(chunks)
+                    leader.set_result({"response": response, "locations_found": len(ranked)})
+                except Exception as e:
+                    leader.set_exception(e)
+                    raise
+                finally:
+                    # Client gone mid-stream: the next waiter answers instead
+                    leader.cancel()
+                break
+            yield stream_event("done", {"query": query.query, "locations_found": len(ranked), "length": len(response)}, ndjson)
+        except Exception as e:
+            yield stream_event("error", {"detail": f"AI search failed: {str(e)}"}, ndjson)
+
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson" if ndjson else "text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.get("/ai/search/stats")
+async def ai_search_stats():
+    """Hit rate and size of the AI search response cache"""
+    return search_cache.stats()
+
+async def run_rescore(restart: bool):
+    try:
+        await rescore_locations(db, restart=restart)
+    except Exception:
+        logger.exception("Location rescoring stopped; POST /api/admin/rescore again to resume")
+        return
+    # Scores feed every worker's heatmap and cached search answers
+    manager.notify("rescored", {})
+
+def refresh_rescored(message: dict):
+    """Topic handler: rebuild the heatmap (swapped in once built) and drop cached answers with old scores"""
+    heatmap.rebuild(db.locations)
+    search_cache.invalidate()
+
+manager.on_topic("rescored", refresh_rescored)
+
+@api_router.post("/admin/rescore", status_code=202)
+async def start_rescore(restart: bool = False):
+    """Rescore every location with the current weights in the background, resuming an interrupted run"""
+    global rescore_task
+    if rescore_task is not None and not rescore_task.done():
+        raise HTTPException(status_code=409, detail="Rescoring already running")
+    rescore_task = asyncio.create_task(run_rescore(restart))
+    return {"started": True, "restart": restart}
+
+@api_router.get("/admin/rescore")
+async def rescore_status():
+    """Progress of the current or last rescoring run"""
+    status = job_status(await db.jobs.find_one({"_id": RESCORE_JOB_ID}))
+    status["running"] = rescore_task is not None and not rescore_task.done()
+    return status
+
+@api_router.get("/health/ready")
+async def readiness():
+    """200 once startup has finished and MongoDB answers, 503 otherwise (for load balancer checks)"""
+    if not app_ready:
+        return JSONResponse(status_code=503, content={"ready": False, "reason": "starting"})
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(db.command("ping"), timeout=READINESS_PING_TIMEOUT)
+    except Exception as e:
+        return JSONResponse(status_code=503, content={"ready": False, "reason": f"mongo: {e.__class__.__name__}"})
+    return {
+        "ready": True,
+        "mongo_ping_ms": round((time.perf_counter() - started) * 1000, 1),
+        "index_failures": index_failures,
+        "active_alerts": len(active_alerts),
+        "route_graph": route_graph is not None,
+        "heatmap": heatmap.ready
+    }
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint for this worker"""
+    return Response(content=METRICS.render(), media_type=METRICS_CONTENT_TYPE)
 
 @api_router.get("/")
 async def root():
     return {"message": "Sanchara API - Inclusive Mobility Navigation"}
 
 # WebSocket for real-time alerts (Premium feature)
+# Clients send {"type": "subscribe", "latitude", "longitude", "radius"} to
+# receive alerts and barriers near them, or {"type": "unsubscribe"}.
 @app.websocket("/ws/alerts")
 async def websocket_alerts(websocket: WebSocket):
     await manager.connect(websocket)
     try:
         while True:
             data = await websocket.receive_text()
-            # Keep connection alive
+            try:
+                message = json.loads(data)
+            except ValueError:
+                message = None
+            if isinstance(message, dict) and message.get("type") == "subscribe":
+                try:
+                    radius = manager.subscribe(
+                        websocket,
+                        float(message["latitude"]),
+                        float(message["longitude"]),
+                        float(message.get("radius", DEFAULT_SUBSCRIPTION_RADIUS))
+                    )
+                    manager.send(websocket, {"type": "subscribed", "radius": radius})
+                except (KeyError, TypeError, ValueError):
+                    manager.send(websocket, {"type": "error", "detail": "subscribe needs latitude and longitude"})
+            elif isinstance(message, dict) and message.get("type") == "unsubscribe":
+                manager.unsubscribe(websocket)
+            # Throttle subscription updates
             await asyncio.sleep(1)
     except WebSocketDisconnect:
         manager.disconnect(websocket)
@@ -481,8 +1055,12 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Outermost, so the latency covers every other middleware too
+app.add_middleware(MetricsMiddleware)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -490,6 +1068,99 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def provision_database():
+    """Ensure every index (see database.py) and warm the pool; legacy documents are backfilled by `python -m database`"""
+    global index_failures
+    await warm_pool(db, client.options.pool_options.min_pool_size)
+    index_failures = await ensure_indexes(db)
+
+def configured_broker():
+    """The broker named by ALERT_BROKER=memory|unix|redis (with ALERT_BROKER_PATH / ALERT_BROKER_URL)"""
+    return create_broker(
+        os.environ.get('ALERT_BROKER', 'memory'),
+        path=os.environ.get('ALERT_BROKER_PATH'),
+        url=os.environ.get('ALERT_BROKER_URL')
+    )
+
+@app.on_event("startup")
+async def start_alert_broker():
+    """Share alert broadcasts across workers"""
+    await manager.use_broker(configured_broker())
+
+@app.on_event("startup")
+async def start_alert_expiry():
+    """Load the active alerts and start expiring them"""
+    active_alerts.clear()
+    async for alert in db.alerts.find({"expires_at": {"$gt": datetime.utcnow()}}, alert_rows.projection):
+        active_alerts.add(alert)
+    active_alerts.start(announce_expired_alert)
+    logger.info("Loaded %d active alerts", len(active_alerts))
+
+@app.on_event("startup")
+async def load_route_graph():
+    """Build (or load the cached CSR of) the pedestrian graph off the event loop"""
+    global route_graph
+    osm_path = os.environ.get('OSM_EXTRACT_PATH')
+    if not osm_path:
+        logger.info("OSM_EXTRACT_PATH not set; routes fall back to straight lines")
+        return
+    route_graph = await asyncio.to_thread(load_graph, osm_path)
+    logger.info("Routing graph loaded: %d nodes, %d edges", route_graph.node_count, route_graph.edge_count)
+
+@app.on_event("startup")
+async def migrate_inline_photos():
+    """Move photos still stored inside barrier documents into the photo store, in the background"""
+    async def migrate():
+        moved = 0
+        cursor = db.barriers.find({"photo_base64": {"$type": "string"}}, {"_id": 0, "id": 1, "photo_base64": 1})
+        try:
+            async for barrier in cursor.batch_size(50):
+                update: Dict[str, Any] = {"$unset": {"photo_base64": ""}}
+                try:
+                    update["$set"] = await store_photo(decode_photo(barrier["photo_base64"]))
+                except PhotoError:
+                    logger.warning("Dropping undecodable photo on barrier %s", barrier["id"])
+                await db.barriers.update_one({"id": barrier["id"]}, update)
+                moved += 1
+        except Exception:
+            logger.exception("Inline photo migration stopped after %d barriers", moved)
+        if moved:
+            logger.info("Moved %d inline barrier photos to the photo store", moved)
+
+    job = asyncio.create_task(migrate())
+    photo_jobs.add(job)
+    job.add_done_callback(photo_jobs.discard)
+
+@app.on_event("startup")
+async def preload_llm():
+    """LLM_PRELOAD=1: load the LLM integration now, for workers dedicated to AI search"""
+    if os.environ.get('LLM_PRELOAD', '') in ('1', 'true', 'yes'):
+        await llm.preload()
+        logger.info("LLM backend preloaded")
+
+@app.on_event("startup")
+async def mark_ready():
+    """Runs last: everything above has finished, so /api/health/ready may report ready"""
+    global app_ready
+    app_ready = True
+    logger.info("Startup complete")
+    # Scanning every location takes seconds on a large database; heatmap requests get a 503 until it is done
+    heatmap.rebuild(db.locations)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    global app_ready
+    app_ready = False
+    if rescore_task is not None:
+        rescore_task.cancel()
+    heatmap.stop()
+    active_alerts.stop()
+    barrier_broadcasts.close()
+    auth.shutdown()
+    for job in list(photo_jobs):
+        job.cancel()
+    await manager.close()
+    # Queued route history goes out before the connection pool closes
+    await route_history.close()
     client.close()
@@ -5,6 +5,7 @@ from typing import List, Optional
 import uuid
 from datetime import datetime
 import json
+from geo import GridIndex
 
 app = FastAPI(title="Sanchara API", version="1.0.0")
 
@@ -58,6 +59,18 @@ users_db = {}
 locations_db = {}
 barriers_db = {}
 
+# Spatial indexes over locations_db / barriers_db (~1.1 km cells)
+locations_index = GridIndex(cell_size=0.01)
+barriers_index = GridIndex(cell_size=0.01)
+
+def store_location(location: dict):
+    locations_db[location["id"]] = location
+    locations_index.insert(location["id"], location["latitude"], location["longitude"], location)
+
+def store_barrier(barrier: dict):
+    barriers_db[barrier["id"]] = barrier
+    barriers_index.insert(barrier["id"], barrier["latitude"], barrier["longitude"], barrier)
+
 # Sample data
 sample_locations = [
     {
@@ -99,10 +112,10 @@ sample_barriers = [
 
 # Initialize sample data
 for loc in sample_locations:
-    locations_db[loc["id"]] = loc
+    store_location(loc)
 
 for bar in sample_barriers:
-    barriers_db[bar["id"]] = bar
+    store_barrier(bar)
 
 @app.get("/")
 async def root():
@@ -148,8 +161,12 @@ async def get_user(user_id: str):
 # Location endpoints
 @app.get("/api/locations")
 async def get_locations(latitude: float, longitude: float, radius: int = 5000):
-    # Simple distance calculation - return all sample locations for demo
-    return list(locations_db.values())
+    # Nearest first, only visiting grid cells that overlap the radius
+    return [loc for _, _, loc in locations_index.within_radius(latitude, longitude, radius)]
+
+@app.get("/api/locations/bbox")
+async def get_locations_in_bbox(min_lat: float, min_lng: float, max_lat: float, max_lng: float):
+    return [loc for _, loc in locations_index.within_bbox(min_lat, min_lng, max_lat, max_lng)]
 
 @app.get("/api/locations/heatmap")
 async def get_heatmap(latitude: float, longitude: float):
@@ -165,7 +182,7 @@ async def get_heatmap(latitude: float, longitude: float):
 @app.post("/api/barriers")
 async def create_barrier(barrier: BarrierCreate):
     barrier_id = str(uuid.uuid4())
-    barriers_db[barrier_id] = {
+    store_barrier({
         "id": barrier_id,
         "user_id": barrier.user_id,
         "latitude": barrier.latitude,
@@ -176,13 +193,16 @@ async def create_barrier(barrier: BarrierCreate):
         "photo_base64": barrier.photo_base64,
         "created_at": datetime.now().isoformat(),
         "ai_classification": "Mock AI analysis: " + barrier.barrier_type
-    }
+    })
     return barriers_db[barrier_id]
 
 @app.get("/api/barriers")
 async def get_barriers(latitude: float, longitude: float, radius: int = 500):
-    # Return sample barriers for demo
-    return list(barriers_db.values())
+    return [bar for _, _, bar in barriers_index.within_radius(latitude, longitude, radius)]
+
+@app.get("/api/barriers/bbox")
+async def get_barriers_in_bbox(min_lat: float, min_lng: float, max_lat: float, max_lng: float):
+    return [bar for _, bar in barriers_index.within_bbox(min_lat, min_lng, max_lat, max_lng)]
 
 # AI Search endpoint
 @app.post("/api/ai/search")
@@ -0,0 +1,159 @@
+"""Write-behind queue for inserts nobody reads back right away.
+
+Route history does not need to be stored before the response goes out.
+WriteBehind.put() only queues the document. A flusher task writes the
+queue with unordered insert_many once BATCH_SIZE documents are waiting or
+FLUSH_INTERVAL seconds after the first one arrived, whichever comes first.
+If the queue holds MAX_PENDING documents (the database is slow or down),
+put() waits for the next flush to make room, so callers slow down instead
+of memory growing without bound. A failed batch is retried with backoff;
+after MAX_ATTEMPTS it is dropped and logged. close() writes whatever is
+still queued, for the shutdown hook.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, List, Optional
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from metrics import MONGO_BUCKETS, REGISTRY, Registry
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 0.25  # seconds a queued document may wait for more to batch with
+MAX_PENDING = 10000
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 0.5  # seconds, doubled after each failed attempt
+
+class WriteBehind:
+    """Batches inserts into one collection"""
+
+    # Every queue, for the depth gauge
+    queues: List["WriteBehind"] = []
+
+    def __init__(self, collection, batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL,
+                 max_pending: int = MAX_PENDING, registry: Registry = REGISTRY):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending: Deque[dict] = deque()
+        self.wakeup = asyncio.Event()
+        self.drained = asyncio.Event()
+        self.flusher: Optional[asyncio.Task] = None
+        self.closing = False
+        self.written = 0
+        self.dropped = 0
+        self.waits = 0  # put() calls that had to wait for room
+
+        name = collection.name
+        registry.gauge(
+            "write_behind_queue_depth", "Documents waiting in write-behind queues", ("collection",),
+            function=lambda: {(queue.collection.name,): len(queue.pending) for queue in WriteBehind.queues}
+        )
+        self.flush_duration = registry.histogram(
+            "write_behind_flush_duration_seconds", "Time to write one write-behind batch", ("collection",),
+            MONGO_BUCKETS
+        ).labels(name)
+        self.documents = registry.counter(
+            "write_behind_documents_total", "Documents leaving write-behind queues by outcome",
+            ("collection", "outcome")
+        )
+        self.backpressure = registry.counter(
+            "write_behind_waits_total", "Writes that waited for room in a full write-behind queue", ("collection",)
+        ).labels(name)
+        WriteBehind.queues.append(self)
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    async def put(self, document: dict):
+        """Queue a document; only waits when the queue is full"""
+        if len(self.pending) >= self.max_pending:
+            self.waits += 1
+            self.backpressure.inc()
+        while len(self.pending) >= self.max_pending:
+            self.drained.clear()
+            self.start()
+            self.wakeup.set()
+            await self.drained.wait()
+        self.pending.append(document)
+        if len(self.pending) >= self.batch_size:
+            self.wakeup.set()
+        self.start()
+
+    def start(self):
+        if self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.get_running_loop().create_task(self.run())
+
+    async def run(self):
+        """Wait for a full batch or the flush interval, then write; ends once the queue is empty"""
+        while self.pending:
+            if len(self.pending) < self.batch_size and not self.closing:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            await self.flush_batch()
+
+    async def flush_batch(self):
+        batch = [self.pending.popleft() for _ in range(min(self.batch_size, len(self.pending)))]
+        self.drained.set()
+        if not batch:
+            return
+        delay = RETRY_DELAY
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            started = time.perf_counter()
+            try:
+                await self.collection.insert_many(batch, ordered=False)
+                self.flush_duration.observe(time.perf_counter() - started)
+                self.record(len(batch), "written")
+                return
+            except BulkWriteError as e:
+                # Unordered: everything but the rejected documents was written; retrying would not help
+                self.flush_duration.observe(time.perf_counter() - started)
+                rejected = len(e.details.get("writeErrors", []))
+                self.record(len(batch) - rejected, "written")
+                self.record(rejected, "rejected")
+                logger.warning("%d of %d queued %s documents were rejected: %s", rejected, len(batch),
+                               self.collection.name, e.details["writeErrors"][0]["errmsg"] if rejected else e)
+                return
+            except PyMongoError as e:
+                self.flush_duration.observe(time.perf_counter() - started)
+                if attempt == MAX_ATTEMPTS:
+                    self.record(len(batch), "dropped")
+                    logger.error("Dropped %d queued %s documents after %d attempts: %s",
+                                 len(batch), self.collection.name, attempt, e)
+                    return
+                logger.warning("Writing %d queued %s documents failed, retrying: %s", len(batch), self.collection.name, e)
+                await asyncio.sleep(delay)
+                delay *= 2
+
+    def record(self, count: int, outcome: str):
+        if outcome == "written":
+            self.written += count
+        else:
+            self.dropped += count
+        if count:
+            self.documents.labels(self.collection.name, outcome).inc(count)
+
+    async def close(self):
+        """Write everything still queued without waiting for the flush interval"""
+        self.closing = True
+        self.wakeup.set()
+        if self.flusher is not None and not self.flusher.done():
+            await self.flusher
+        while self.pending:
+            await self.flush_batch()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self.pending),
+            "written": self.written,
+            "dropped": self.dropped,
+            "waits": self.waits,
+        }
@@ -0,0 +1,16 @@
+"""Shared setup: the backend modules are imported from backend/, as the server runs them.
+
+server.py reads its database settings at import time; the tests never
+connect, they swap in the in-memory stand-in from benchmarks.memory_mongo.
+"""
+import os
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "sanchara_test")
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("ALERT_BROKER", "memory")
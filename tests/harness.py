@@ -0,0 +1,38 @@
+"""The API in-process on the in-memory Mongo stand-in, for tests that go through HTTP"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import httpx
+
+from benchmarks.memory_mongo import MemoryClient
+from benchmarks.synthetic_city import City, insert_city
+
+@asynccontextmanager
+async def running_server(city: City = None):
+    """Yields (server module, httpx client) with startup run; shutdown runs on exit"""
+    import server
+
+    server.client = MemoryClient()
+    server.db = server.client["sanchara_test"]
+    server.route_history.collection = server.db.routes
+    server.route_cache.clear()
+    # Every test runs its own event loop; module-level events bind to the first loop that waits on them
+    server.manager.outbox_ready = asyncio.Event()
+    server.active_alerts.changed = asyncio.Event()
+    server.route_history.wakeup = asyncio.Event()
+    server.route_history.drained = asyncio.Event()
+    server.search_cache.invalidate()
+    # Shut down with the previous test's server
+    server.auth.hash_pool = ThreadPoolExecutor(max_workers=server.auth.HASH_WORKERS, thread_name_prefix="bcrypt")
+    if city is not None:
+        await insert_city(server.db, city)
+    await server.app.router.startup()
+    # Tests read the heatmap right away; in production it is built after the worker reports ready
+    await server.heatmap.task
+    try:
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            yield server, client
+    finally:
+        await server.app.router.shutdown()
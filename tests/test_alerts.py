@@ -0,0 +1,70 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from alerts import AlertIndex
+
+from .harness import running_server
+
+POINT = {"latitude": 40.7580, "longitude": -73.9855}
+
+def alert(alert_id: str, seconds: float) -> dict:
+    return dict(POINT, id=alert_id, expires_at=datetime.utcnow() + timedelta(seconds=seconds))
+
+def test_heap_expires_in_deadline_order_and_skips_stale_entries():
+    async def scenario():
+        index = AlertIndex()
+        now = time.time()
+        index.add(alert("a", 10))
+        index.add(alert("b", 20))
+        index.add(alert("c", 25))
+        index.add(alert("a", 30))  # extended: its first heap entry is stale
+        index.remove("c")
+        due = [[expired["id"] for expired in index.expire_due(now + offset)] for offset in (15, 28, 35)]
+        return due, len(index), index.expired
+
+    due, remaining, expired = asyncio.run(scenario())
+    assert due == [[], ["b"], ["a"]]
+    assert remaining == 0
+    assert expired == 2
+
+def test_alert_already_expired_is_not_indexed():
+    async def scenario():
+        index = AlertIndex()
+        index.add(alert("a", 60))
+        return index.add(alert("a", -1)), len(index), index.nearby(POINT["latitude"], POINT["longitude"], 100)
+
+    assert asyncio.run(scenario()) == (False, 0, [])
+
+def test_timer_wakes_for_an_earlier_deadline():
+    async def scenario():
+        index = AlertIndex()
+        expired = []
+        index.add(alert("later", 3600))
+        index.start(expired.append)
+        await asyncio.sleep(0.01)
+        # The timer is asleep until "later"; a sooner alert must wake it
+        index.add(alert("soon", 0.05))
+        await asyncio.sleep(0.2)
+        index.stop()
+        return [item["id"] for item in expired], len(index)
+
+    assert asyncio.run(scenario()) == (["soon"], 1)
+
+def test_expired_alert_leaves_the_api():
+    async def scenario():
+        async with running_server() as (server, client):
+            expired_before = server.active_alerts.expired
+            created = await client.post("/api/alerts", json=dict(
+                POINT, alert_type="hazard", message="Wet floor", severity="high", expires_in=0.1
+            ))
+            assert created.status_code == 200
+            listed = [item["id"] for item in (await client.get("/api/alerts", params=POINT)).json()]
+            await asyncio.sleep(0.3)
+            after = (await client.get("/api/alerts", params=POINT)).json()
+            return created.json()["id"], listed, after, server.active_alerts.expired - expired_before
+
+    alert_id, listed, after, expired = asyncio.run(scenario())
+    assert listed == [alert_id]
+    assert after == []
+    assert expired == 1
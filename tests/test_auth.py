@@ -0,0 +1,91 @@
+import asyncio
+import threading
+
+import bcrypt
+
+import auth
+
+from .harness import running_server
+
+# The cost the tests run at; bcrypt at the production cost takes a quarter second per check
+ROUNDS = 4
+
+def new_user(username: str) -> dict:
+    return {"username": username, "email": f"{username}@example.com", "password": "s3cret", "mode": "wheelchair"}
+
+def login(client, username: str, password: str = "s3cret"):
+    return client.post("/api/auth/login", json={"username": username, "password": password})
+
+def test_legacy_plaintext_password_is_hashed_on_login(monkeypatch):
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", ROUNDS)
+
+    async def scenario():
+        async with running_server() as (server, client):
+            await server.db.users.insert_one(dict(new_user("legacy"), id="u-legacy", password="s3cret"))
+            wrong = await login(client, "legacy", "guess")
+            unchanged = (await server.db.users.find_one({"id": "u-legacy"}))["password"]
+            first = await login(client, "legacy")
+            stored = (await server.db.users.find_one({"id": "u-legacy"}))["password"]
+            again = await login(client, "legacy")
+            return wrong, unchanged, first, stored, again
+
+    wrong, unchanged, first, stored, again = asyncio.run(scenario())
+    assert wrong.status_code == 401 and unchanged == "s3cret"
+    assert first.status_code == 200 and first.json()["user_id"] == "u-legacy"
+    assert auth.is_hashed(stored) and bcrypt.checkpw(b"s3cret", stored.encode())
+    assert again.status_code == 200
+
+def test_hash_at_an_outdated_cost_is_replaced(monkeypatch):
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", ROUNDS)
+    old = bcrypt.hashpw(b"s3cret", bcrypt.gensalt(ROUNDS + 1)).decode()
+
+    async def scenario():
+        async with running_server() as (server, client):
+            await server.db.users.insert_one(dict(new_user("old"), id="u-old", password=old))
+            response = await login(client, "old")
+            return response, (await server.db.users.find_one({"id": "u-old"}))["password"]
+
+    response, stored = asyncio.run(scenario())
+    assert response.status_code == 200
+    assert stored != old and auth._rounds(stored) == ROUNDS
+
+def test_unknown_user_spends_a_check_off_the_event_loop(monkeypatch):
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", ROUNDS)
+    monkeypatch.setattr(auth, "_dummy_hash", None)
+    checks = []
+    real_checkpw = bcrypt.checkpw
+
+    def checkpw(password: bytes, hashed: bytes) -> bool:
+        checks.append(threading.current_thread().name)
+        return real_checkpw(password, hashed)
+    monkeypatch.setattr(auth.bcrypt, "checkpw", checkpw)
+
+    async def scenario():
+        async with running_server() as (server, client):
+            registered = await client.post("/api/auth/register", json=new_user("known"))
+            unknown = await login(client, "nobody")
+            known = await login(client, "known", "wrong")
+            return registered, unknown, known
+
+    registered, unknown, known = asyncio.run(scenario())
+    assert registered.status_code == 200 and "password" not in registered.json()
+    assert unknown.status_code == known.status_code == 401
+    assert unknown.json() == known.json()
+    # One bcrypt check each, the one for the unknown name against the dummy hash
+    assert len(checks) == 2 and all(name.startswith("bcrypt") for name in checks)
+
+def test_profile_cache_is_dropped_when_the_profile_changes(monkeypatch):
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", ROUNDS)
+
+    async def scenario():
+        async with running_server() as (server, client):
+            user_id = (await client.post("/api/auth/register", json=new_user("cached"))).json()["id"]
+            before = (await client.get(f"/api/users/{user_id}")).json()
+            await client.put(f"/api/users/{user_id}/mode", json={"mode": "blind"})
+            await client.post(f"/api/users/{user_id}/premium")
+            after = (await client.get(f"/api/users/{user_id}")).json()
+            return before, after
+
+    before, after = asyncio.run(scenario())
+    assert (before["mode"], before.get("is_premium")) == ("wheelchair", False)
+    assert (after["mode"], after["is_premium"]) == ("blind", True)
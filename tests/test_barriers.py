@@ -0,0 +1,117 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+from barriers import BroadcastThrottle, CellLocks, cell_key, merge_existing, merge_report
+from benchmarks.memory_mongo import MemoryClient
+from benchmarks.synthetic_city import offset
+from database import INDEXES
+
+ORIGIN = (40.758896, -73.985130)
+
+def barrier(latitude: float, longitude: float, barrier_type: str = "pothole", severity: str = "low",
+            created_at: datetime = None, **fields) -> dict:
+    document = {
+        "id": str(uuid.uuid4()), "user_id": "u", "latitude": latitude, "longitude": longitude,
+        "barrier_type": barrier_type, "severity": severity, "description": "reported",
+        "photo_url": None, "thumbnail_url": None, "ai_classification": None, "verified": False,
+        "created_at": created_at or datetime.utcnow(),
+        "location": {"type": "Point", "coordinates": [longitude, latitude]},
+    }
+    document.update(fields)
+    return document
+
+async def barriers_collection(latency: float = 0.0):
+    collection = MemoryClient(latency=latency)["test"]["barriers"]
+    await collection.create_indexes(INDEXES["barriers"])
+    return collection
+
+def test_nearby_reports_of_one_type_merge():
+    async def scenario():
+        collection = await barriers_collection()
+        locks = CellLocks()
+        reports = [barrier(*offset(*ORIGIN, 1.0 * i, 0.5 * i), severity=severity)
+                   for i, severity in enumerate(["low", "medium", "high"])]
+        results = [await merge_report(collection, report, locks) for report in reports]
+        other_type, merged = await merge_report(collection, barrier(*ORIGIN, barrier_type="stairs"), locks)
+        far, far_merged = await merge_report(collection, barrier(*offset(*ORIGIN, 50.0, 0.0)), locks)
+        return collection, results, merged, far_merged, locks
+
+    collection, results, other_merged, far_merged, locks = asyncio.run(scenario())
+    assert [merged for _, merged in results] == [False, True, True]
+    final = results[-1][0]
+    assert final["id"] == results[0][0]["id"]
+    assert final["report_count"] == 3
+    assert final["severity"] == "high"
+    assert not other_merged and not far_merged
+    assert len(collection) == 3
+    assert len(locks) == 0
+
+def test_concurrent_reports_in_one_process_merge():
+    async def scenario():
+        collection = await barriers_collection(latency=0.001)
+        locks = CellLocks()
+        reports = [barrier(*offset(*ORIGIN, (i % 3) * 1.5, (i % 2) * 1.5)) for i in range(10)]
+        return collection, await asyncio.gather(*[merge_report(collection, report, locks) for report in reports])
+
+    collection, results = asyncio.run(scenario())
+    assert len(collection) == 1
+    assert sum(not merged for _, merged in results) == 1
+    assert max(stored["report_count"] for stored, _ in results) == 10
+
+def test_workers_racing_for_one_cell_merge_through_the_unique_index():
+    async def scenario():
+        collection = await barriers_collection(latency=0.001)
+        # Separate lock tables, as in two worker processes
+        first, second = barrier(*ORIGIN), barrier(*ORIGIN, severity="high")
+        return collection, await asyncio.gather(
+            merge_report(collection, first, CellLocks()), merge_report(collection, second, CellLocks())
+        )
+
+    collection, results = asyncio.run(scenario())
+    assert sorted(merged for _, merged in results) == [False, True]
+    assert len(collection) == 1
+    stored = next(iter(collection.documents.values()))
+    assert stored["report_count"] == 2
+    assert stored["cell"] == cell_key(*ORIGIN)
+
+def test_compaction_deletes_duplicates_before_survivors_take_their_cell():
+    async def scenario():
+        collection = await barriers_collection()
+        now = datetime.utcnow()
+        # Bulk-imported, so no cell, and older than the reported barrier that holds the cell
+        imported = barrier(*ORIGIN, created_at=now - timedelta(days=2))
+        reported = barrier(*ORIGIN, severity="high", created_at=now - timedelta(days=1),
+                           cell=cell_key(*ORIGIN), report_count=3, last_reported_at=now)
+        await collection.insert_many([imported, reported])
+        return collection, imported, await merge_existing(collection), await merge_existing(collection)
+
+    collection, imported, first, second = asyncio.run(scenario())
+    assert first == {"scanned": 2, "kept": 1, "merged": 1}
+    assert second == {"scanned": 1, "kept": 1, "merged": 0}
+    survivor = next(iter(collection.documents.values()))
+    assert survivor["id"] == imported["id"]
+    assert survivor["cell"] == cell_key(*ORIGIN)
+    assert survivor["report_count"] == 4
+    assert survivor["severity"] == "high"
+
+def test_throttle_sends_first_at_once_and_collapses_the_rest():
+    async def scenario():
+        sent = []
+
+        async def send(key, payload):
+            sent.append((key, payload["n"]))
+
+        throttle = BroadcastThrottle(send, window=0.05)
+        for n in range(5):
+            await throttle.submit("a", {"n": n})
+        await throttle.submit("b", {"n": 0})
+        immediate = list(sent)
+        await asyncio.sleep(0.1)
+        throttle.close()
+        return immediate, sent, throttle.suppressed
+
+    immediate, sent, suppressed = asyncio.run(scenario())
+    assert immediate == [("a", 0), ("b", 0)]
+    assert sent == [("a", 0), ("b", 0), ("a", 4)]
+    assert suppressed == 3
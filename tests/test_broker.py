@@ -0,0 +1,96 @@
+import asyncio
+import os
+import socket
+
+from benchmarks.resp_standin import RespStandin
+from broker import RedisBroker, UnixSocketBroker, decode_batch, encode_batch
+
+async def settle(condition, timeout: float = 1.0):
+    """Poll until condition() holds; transports deliver on later loop turns"""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition() and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.005)
+
+def test_batch_round_trip_and_own_batches_are_ignored():
+    messages = [b"", b"one", b"\n" * 70000, bytes(range(256))]
+    batch = encode_batch(b"o" * 16, messages)
+    assert decode_batch(batch) == (b"o" * 16, messages)
+
+    async def scenario():
+        received = []
+        broker = UnixSocketBroker("/nonexistent")
+        broker.handler = received.append
+        broker.receive_batch(encode_batch(broker.origin, [b"mine"]))
+        broker.receive_batch(encode_batch(b"p" * 16, [b"a", b"b"]))
+        broker.receive_batch(b"p" * 16 + b"\x00\x00")  # truncated frame header
+        return received, broker.received
+
+    assert asyncio.run(scenario()) == ([b"a", b"b"], 2)
+
+def test_unix_socket_workers_exchange_a_batch(tmp_path):
+    async def scenario():
+        first, second = [], []
+        a, b = UnixSocketBroker(str(tmp_path)), UnixSocketBroker(str(tmp_path))
+        await a.start(first.append)
+        await b.start(second.append)
+        try:
+            for n in range(3):
+                a.publish(b"alert %d" % n)
+            b.publish(b"reply")
+            await settle(lambda: len(second) == 4 and len(first) == 4)
+            return first, second, a.batches_sent, b.received
+        finally:
+            await a.close()
+            await b.close()
+
+    first, second, batches, received = asyncio.run(scenario())
+    # Local delivery first, then the peer's messages; nobody sees its own twice
+    assert first == [b"alert 0", b"alert 1", b"alert 2", b"reply"]
+    assert second == [b"reply", b"alert 0", b"alert 1", b"alert 2"]
+    assert batches == 1 and received == 3
+    assert os.listdir(tmp_path) == []
+
+def test_socket_of_a_dead_worker_is_removed(tmp_path):
+    async def scenario():
+        # Bound by a process that exited without unlinking it: nothing receives on it
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        stale.bind(str(tmp_path / "1-deadbeef.sock"))
+        stale.close()
+        received = []
+        live, peer = UnixSocketBroker(str(tmp_path)), UnixSocketBroker(str(tmp_path))
+        await live.start(lambda message: None)
+        await peer.start(received.append)
+        try:
+            live.publish(b"alert")
+            await settle(lambda: received and not os.path.exists(tmp_path / "1-deadbeef.sock"))
+            return received, sorted(os.listdir(tmp_path)), sorted(os.path.basename(p) for p in (live.path, peer.path))
+        finally:
+            await live.close()
+            await peer.close()
+
+    received, left, live = asyncio.run(scenario())
+    assert received == [b"alert"]
+    assert left == live
+
+def test_redis_brokers_exchange_through_a_resp_server():
+    async def scenario():
+        standin = RespStandin()
+        port = await standin.start()
+        first, second = [], []
+        a = RedisBroker(f"redis://127.0.0.1:{port}")
+        b = RedisBroker(f"redis://:secret@127.0.0.1:{port}")
+        await a.start(first.append)
+        await b.start(second.append)
+        try:
+            a.publish(b"alert")
+            b.publish(b"reply")
+            await settle(lambda: len(first) == 2 and len(second) == 2)
+            return first, second
+        finally:
+            await a.close()
+            await b.close()
+            await standin.close()
+
+    first, second = asyncio.run(scenario())
+    assert first == [b"alert", b"reply"]
+    assert second == [b"reply", b"alert"]
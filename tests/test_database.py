@@ -0,0 +1,46 @@
+import asyncio
+from datetime import datetime
+
+from benchmarks.memory_mongo import MemoryClient
+from database import backfill_legacy_fields, ensure_indexes, migrate
+
+def place(doc_id: str) -> dict:
+    return {"id": doc_id, "latitude": 40.7580, "longitude": -73.9855,
+            "location": {"type": "Point", "coordinates": [-73.9855, 40.7580]}}
+
+def test_duplicate_under_a_unique_index_fails_only_that_index():
+    async def scenario():
+        db = MemoryClient()["sanchara_test"]
+        # Legacy data: the same id stored twice
+        await db.locations.insert_many([place("dup"), place("dup")])
+        failed = await ensure_indexes(db)
+        nearest = await db.locations.aggregate([{"$geoNear": {
+            "near": {"type": "Point", "coordinates": [-73.9855, 40.7580]}, "distanceField": "distance",
+            "maxDistance": 100, "spherical": True,
+        }}]).to_list(None)
+        return failed, await db.locations.index_information(), await db.alerts.index_information(), nearest
+
+    failed, location_indexes, alert_indexes, nearest = asyncio.run(scenario())
+    assert failed == ["locations.id_1"]
+    assert "location_2dsphere_sanchara_score_1" in location_indexes
+    assert "expires_at_1" in alert_indexes
+    assert len(nearest) == 2
+
+def test_migration_backfills_legacy_documents():
+    async def scenario():
+        db = MemoryClient()["sanchara_test"]
+        created = datetime(2024, 1, 1)
+        await db.locations.insert_one({"id": "l1", "latitude": 40.0, "longitude": -73.0})
+        await db.alerts.insert_one({"id": "a1", "latitude": 40.0, "longitude": -73.0, "alert_type": "hazard", "created_at": created})
+        await db.barriers.insert_one({"id": "b1", "latitude": 40.0, "longitude": -73.0, "created_at": created})
+        report = await migrate(db)
+        again = await backfill_legacy_fields(db)
+        return (report, again, await db.locations.find_one({"id": "l1"}),
+                await db.alerts.find_one({"id": "a1"}), await db.barriers.find_one({"id": "b1"}))
+
+    report, again, location, alert, barrier = asyncio.run(scenario())
+    assert report == {"backfilled": {"locations": 1, "barriers": 2, "alerts": 2}, "index_failures": []}
+    assert again == {"locations": 0, "barriers": 0, "alerts": 0}
+    assert location["location"] == {"type": "Point", "coordinates": [-73.0, 40.0]}
+    assert alert["expires_at"] == datetime(2024, 1, 1, 6)
+    assert (barrier["report_count"], barrier["last_reported_at"]) == (1, datetime(2024, 1, 1))
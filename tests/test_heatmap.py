@@ -0,0 +1,120 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from broker import UnixSocketBroker
+from heatmap import MAX_ZOOM, HeatmapTiles, LiveHeatmap, lat_lng_to_tile_xy
+from realtime import ConnectionManager
+
+from .harness import running_server
+
+LOCATION = {"name": "Library", "latitude": 40.7580, "longitude": -73.9855, "address": "1 Main St", "has_ramp": True}
+VIEWPORT = {"latitude": 40.7580, "longitude": -73.9855, "radius": 2000}
+
+def test_locations_created_in_one_worker_reach_the_heatmap_of_another(tmp_path, monkeypatch):
+    monkeypatch.setenv("ALERT_BROKER", "unix")
+    monkeypatch.setenv("ALERT_BROKER_PATH", str(tmp_path))
+
+    async def scenario():
+        # A second worker: its own sockets manager and heatmap, on the same broker directory
+        other_tiles = HeatmapTiles()
+        other = ConnectionManager()
+        other.on_topic("heatmap", lambda message: [other_tiles.add(*point[:3]) for point in message["points"]])
+        await other.use_broker(UnixSocketBroker(str(tmp_path)))
+        try:
+            async with running_server() as (server, client):
+                for _ in range(3):
+                    assert (await client.post("/api/locations", json=LOCATION)).status_code == 200
+                await asyncio.sleep(0.1)
+                served = await client.get("/api/locations/heatmap", params=VIEWPORT)
+                keys = server.heatmap.tiles.tiles_for_viewport(**VIEWPORT)
+                return served, [other_tiles.tile(*key)[0] for key in keys], [server.heatmap.tiles.tile(*key)[0] for key in keys]
+        finally:
+            await other.close()
+
+    served, other_etags, local_etags = asyncio.run(scenario())
+    assert [point["count"] for point in served.json()["heatmap"]] == [3]
+    assert other_etags == local_etags
+
+class PausedCursor:
+    """Yields stored locations, waiting for `resume` after the first"""
+
+    def __init__(self, rows, resume):
+        self.rows = rows
+        self.resume = resume
+
+    def batch_size(self, size):
+        return self
+
+    async def __aiter__(self):
+        for index, row in enumerate(self.rows):
+            if index == 1:
+                await self.resume.wait()
+            yield row
+
+def test_heatmap_build_swaps_in_whole_and_counts_concurrent_locations_once():
+    async def scenario():
+        stored = [{"latitude": 40.7580, "longitude": -73.9855, "sanchara_score": 8.0}] * 2
+        resume = asyncio.Event()
+        collection = type("Locations", (), {"find": lambda self, query, projection: PausedCursor(stored, resume)})()
+        heatmap = LiveHeatmap()
+        build = heatmap.rebuild(collection)
+        await asyncio.sleep(0.01)
+        assert not heatmap.ready
+        # Published mid-scan: one stored before the scan started (it is in `stored`), one after
+        heatmap.add(40.7580, -73.9855, 8.0, datetime.utcnow() - timedelta(minutes=1))
+        heatmap.add(40.7580, -73.9855, 2.0, datetime.utcnow())
+        resume.set()
+        await build
+        x, y = lat_lng_to_tile_xy(40.7580, -73.9855, MAX_ZOOM)
+        [point] = heatmap.tiles.cells(MAX_ZOOM, int(x), int(y))
+        return point
+
+    point = asyncio.run(scenario())
+    assert point["count"] == 3
+    assert point["min_score"] == 2.0
+
+def test_heatmap_answers_503_until_built():
+    async def scenario():
+        async with running_server() as (server, client):
+            tiles, server.heatmap.tiles = server.heatmap.tiles, None
+            try:
+                return await client.get("/api/locations/heatmap", params=VIEWPORT)
+            finally:
+                server.heatmap.tiles = tiles
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "5"
+
+def test_rescore_refreshes_the_heatmap_of_every_worker(tmp_path, monkeypatch):
+    monkeypatch.setenv("ALERT_BROKER", "unix")
+    monkeypatch.setenv("ALERT_BROKER_PATH", str(tmp_path))
+
+    async def scenario():
+        rescored = []
+        other = ConnectionManager()
+        other.on_topic("rescored", rescored.append)
+        await other.use_broker(UnixSocketBroker(str(tmp_path)))
+        try:
+            async with running_server() as (server, client):
+                # Stored with a score the current weights disagree with (a ramp is worth more)
+                await server.db.locations.insert_one(dict(LOCATION, id="stale", sanchara_score=1.0, created_at=datetime.utcnow()))
+                server.heatmap.rebuild(server.db.locations)
+                await server.heatmap.task
+                before = (await client.get("/api/locations/heatmap", params=VIEWPORT)).json()["heatmap"]
+                server.search_cache.entries["query"] = {"response": "old scores"}
+
+                assert (await client.post("/api/admin/rescore")).status_code == 202
+                await server.rescore_task
+                await asyncio.sleep(0.1)
+                await server.heatmap.task
+                after = (await client.get("/api/locations/heatmap", params=VIEWPORT)).json()["heatmap"]
+                return before, after, len(server.search_cache.entries), rescored
+        finally:
+            await other.close()
+
+    before, after, cached, rescored = asyncio.run(scenario())
+    assert [point["score"] for point in before] == [1.0]
+    assert [point["score"] for point in after] == [8.0]
+    assert cached == 0
+    assert rescored == [{}]
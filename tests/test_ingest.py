@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+from benchmarks.memory_mongo import MemoryClient
+from broker import UnixSocketBroker
+from ingest import BulkIngest, ingest_file, ndjson_lines
+
+from .harness import running_server
+
+ROUTE = {"user_id": "u1", "start_lat": 40.7500, "start_lng": -73.9900, "end_lat": 40.7600, "end_lng": -73.9900, "mode": "wheelchair"}
+ON_ROUTE = {"latitude": 40.7550, "longitude": -73.9900}
+FAR_AWAY = {"latitude": 40.8000, "longitude": -73.9000}
+
+def barrier(point: dict) -> dict:
+    return dict(point, user_id="u2", barrier_type="curb", severity="high", description="High curb")
+
+async def chunks(rows):
+    yield b"".join(json.dumps(row).encode() + b"\n" for row in rows)
+
+async def prepare(row: dict) -> dict:
+    if "latitude" not in row:
+        raise ValueError("latitude is required")
+    return dict(row)
+
+def test_after_batch_runs_once_per_batch_with_the_stored_rows():
+    rows = [{"id": str(i), "latitude": 40.0 + i * 0.001, "longitude": -73.0} for i in range(25)]
+    rows.insert(3, {"id": "bad"})
+    batches = []
+
+    async def scenario():
+        collection = MemoryClient()["test"]["barriers"]
+        ingest = BulkIngest(collection, prepare, batch_size=10, after_batch=batches.append)
+        return await ingest.report(ndjson_lines(chunks(rows)))
+
+    report = asyncio.run(scenario())
+    assert report["inserted"] == 25 and report["failed"] == 1
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+
+def test_bulk_barrier_batch_drops_cached_routes_through_it():
+    async def scenario():
+        async with running_server() as (server, client):
+            start = (await client.get("/api/routes/stats")).json()
+            before = (await client.post("/api/routes", json=ROUTE)).json()
+            body = "\n".join(json.dumps(barrier(point)) for point in (ON_ROUTE, FAR_AWAY))
+            report = (await client.post("/api/barriers/bulk", content=body)).json()
+            after = (await client.post("/api/routes", json=ROUTE)).json()
+            end = (await client.get("/api/routes/stats")).json()
+            return before, report, after, end["misses"] - start["misses"], end["invalidations"] - start["invalidations"]
+
+    before, report, after, misses, invalidations = asyncio.run(scenario())
+    assert report["inserted"] == 2
+    assert (misses, invalidations) == (2, 1)
+    assert before["barriers"] == [] and len(after["barriers"]) == 1
+
+def test_cli_ingest_tells_other_workers_over_the_broker(tmp_path, monkeypatch):
+    rows = tmp_path / "barriers.ndjson"
+    rows.write_text("".join(json.dumps(barrier(point)) + "\n" for point in (ON_ROUTE, FAR_AWAY)))
+    sockets = str(tmp_path / "sockets")
+    received = []
+
+    async def scenario():
+        async with running_server() as (server, client):
+            # A running worker on the same host; the CLI joins its broker from the environment
+            worker = UnixSocketBroker(sockets)
+            await worker.start(received.append)
+            monkeypatch.setenv("ALERT_BROKER", "unix")
+            monkeypatch.setenv("ALERT_BROKER_PATH", sockets)
+            try:
+                summary = await ingest_file("barriers", str(rows), 100)
+                await asyncio.sleep(0.05)
+            finally:
+                await worker.close()
+            return summary
+
+    summary = asyncio.run(scenario())
+    assert summary == {"lines": 2, "inserted": 2, "failed": 0}
+    topics = [json.loads(message.partition(b"\n")[0])["topic"] for message in received]
+    assert topics == ["barrier"]
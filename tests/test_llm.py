@@ -0,0 +1,46 @@
+import asyncio
+import sys
+import types
+
+import llm
+
+class RecordingChat:
+    """LlmChat look-alike that keeps its history, as the real session chat does"""
+    created = []
+
+    def __init__(self, api_key, session_id, system_message):
+        self.session_id = session_id
+        self.history = []
+        RecordingChat.created.append(self)
+
+    def with_model(self, provider, model):
+        return self
+
+    async def send_message(self, message):
+        self.history.append(message.text)
+        return f"answer to {len(self.history)} message(s)"
+
+class UserMessage:
+    def __init__(self, text):
+        self.text = text
+
+def test_every_gemini_call_gets_its_own_session(monkeypatch):
+    package = types.ModuleType("emergentintegrations")
+    chat_module = types.ModuleType("emergentintegrations.llm.chat")
+    chat_module.LlmChat, chat_module.UserMessage = RecordingChat, UserMessage
+    monkeypatch.setitem(sys.modules, "emergentintegrations", package)
+    monkeypatch.setitem(sys.modules, "emergentintegrations.llm", types.ModuleType("emergentintegrations.llm"))
+    monkeypatch.setitem(sys.modules, "emergentintegrations.llm.chat", chat_module)
+    monkeypatch.setenv("EMERGENT_LLM_KEY", "test-key")
+    RecordingChat.created = []
+
+    async def scenario():
+        backend = llm.GeminiBackend()
+        answers = await asyncio.gather(*[backend.complete(f"prompt {i}") for i in range(3)])
+        answers.append(await backend.complete("prompt 3"))
+        return answers
+
+    answers = asyncio.run(scenario())
+    assert answers == ["answer to 1 message(s)"] * 4
+    assert len({chat.session_id for chat in RecordingChat.created}) == 4
+    assert [len(chat.history) for chat in RecordingChat.created] == [1, 1, 1, 1]
@@ -0,0 +1,60 @@
+import asyncio
+
+from pagination import decode_cursor, page_ranked, query_fingerprint
+
+from .harness import running_server
+
+ORIGIN = {"latitude": 40.7580, "longitude": -73.9855}
+# Five locations at one spot (equal distance from the query point), two further out
+SPOTS = [(40.7590, -73.9855)] * 5 + [(40.7600, -73.9855), (40.7610, -73.9855)]
+
+def location(index: int, latitude: float, longitude: float) -> dict:
+    return {"name": f"Place {index}", "latitude": latitude, "longitude": longitude, "address": f"{index} Main St"}
+
+def test_pages_through_ties_at_equal_distance_without_gaps_or_repeats():
+    async def scenario():
+        async with running_server() as (server, client):
+            created = []
+            for index, (latitude, longitude) in enumerate(SPOTS):
+                created.append((await client.post("/api/locations", json=location(index, latitude, longitude))).json()["id"])
+            params = dict(ORIGIN, radius=1000, limit=2)
+            pages, cursors = [], []
+            while True:
+                response = await client.get("/api/locations", params=params)
+                assert response.status_code == 200
+                pages.append([loc["id"] for loc in response.json()])
+                cursor = response.headers.get("x-next-cursor")
+                if cursor is None:
+                    return created, pages, cursors
+                cursors.append(cursor)
+                params["cursor"] = cursor
+
+    created, pages, cursors = asyncio.run(scenario())
+    returned = [doc_id for page in pages for doc_id in page]
+    assert sorted(returned) == sorted(created)
+    assert returned[-2:] == created[-2:]
+    fingerprint = query_fingerprint("locations", ORIGIN["latitude"], ORIGIN["longitude"], 1000.0, {})
+    # Within the tie, each cursor excludes every id already returned at that distance
+    tied = [decode_cursor(cursor, fingerprint) for cursor in cursors[:2]]
+    assert tied[0][0] == tied[1][0]
+    assert tied[0][1] == pages[0]
+    assert tied[1][1] == pages[0] + pages[1]
+
+def test_page_ranked_resumes_inside_a_tie():
+    ranked = [(10.0, "a", "A"), (10.0, "b", "B"), (10.0, "c", "C"), (20.0, "d", "D")]
+    first, cursor = page_ranked(ranked, 2, "q")
+    second, last = page_ranked(ranked, 2, "q", cursor)
+    assert (first, second, last) == (["A", "B"], ["C", "D"], None)
+    assert decode_cursor(cursor, "q") == (10.0, ["a", "b"])
+
+def test_cursor_from_another_query_is_rejected():
+    async def scenario():
+        async with running_server() as (server, client):
+            for index, (latitude, longitude) in enumerate(SPOTS):
+                await client.post("/api/locations", json=location(index, latitude, longitude))
+            first = await client.get("/api/locations", params=dict(ORIGIN, radius=1000, limit=2))
+            cursor = first.headers["x-next-cursor"]
+            return await client.get("/api/locations", params=dict(ORIGIN, radius=500, limit=2, cursor=cursor))
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 400
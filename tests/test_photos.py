@@ -0,0 +1,58 @@
+import asyncio
+import base64
+import json
+import os
+
+from photos import decode_photo, photo_digest
+
+from .harness import running_server
+
+FIRST = b"\x89PNG\r\n\x1a\n" + b"first" * 40
+SECOND = b"\x89PNG\r\n\x1a\n" + b"second" * 40
+
+def wrapped(data: bytes) -> str:
+    """base64 folded at 76 columns, as MIME encoders and some clients send it"""
+    return base64.encodebytes(data).decode()
+
+def report(photo: bytes) -> dict:
+    return {
+        "user_id": "u1", "latitude": 40.7580, "longitude": -73.9855, "barrier_type": "stairs",
+        "severity": "high", "description": "Steps", "photo_base64": wrapped(photo),
+    }
+
+def test_line_wrapped_base64_decodes():
+    assert "\n" in wrapped(FIRST).strip()
+    assert decode_photo(wrapped(FIRST)) == FIRST
+    assert decode_photo("data:image/png;base64," + wrapped(FIRST).replace("\n", "\r\n")) == FIRST
+
+def test_photo_of_a_report_merged_into_a_barrier_with_a_photo_is_not_stored(tmp_path, monkeypatch):
+    async def scenario():
+        async with running_server() as (server, client):
+            monkeypatch.setattr(server.photo_store, "root", str(tmp_path))
+            first = (await client.post("/api/barriers", json=report(FIRST))).json()
+            second = (await client.post("/api/barriers", json=report(SECOND))).json()
+            await asyncio.gather(*server.photo_jobs, return_exceptions=True)
+            served = await client.get(first["photo_url"])
+            return first, second, served
+
+    first, second, served = asyncio.run(scenario())
+    assert second["id"] == first["id"] and second["report_count"] == 2
+    assert second["photo_url"] == first["photo_url"]
+    assert served.status_code == 200 and served.content == FIRST
+    stored = {name for _, _, names in os.walk(tmp_path) for name in names if not name.endswith(".thumb")}
+    assert stored == {photo_digest(FIRST)}
+
+def test_photo_that_cannot_be_written_saves_no_barrier(monkeypatch):
+    async def scenario():
+        async with running_server() as (server, client):
+            def full_disk(path, data):
+                raise OSError(28, "No space left on device")
+            monkeypatch.setattr(server.photo_store, "_write", full_disk)
+            single = await client.post("/api/barriers", json=report(FIRST))
+            bulk = (await client.post("/api/barriers/bulk", content=json.dumps(report(SECOND)))).json()
+            return single, bulk, await server.db.barriers.count_documents({})
+
+    single, bulk, saved = asyncio.run(scenario())
+    assert single.status_code == 503
+    assert bulk["inserted"] == 0 and len(bulk["errors"]) == 1
+    assert saved == 0
@@ -0,0 +1,53 @@
+import asyncio
+
+from realtime import ConnectionManager
+
+class FakeSocket:
+    """Records close codes; sends succeed, fail, or never finish"""
+
+    def __init__(self, send: str = "ok"):
+        self.behaviour = send
+        self.sent = []
+        self.closed = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        if self.behaviour == "fail":
+            raise ConnectionResetError("peer went away")
+        if self.behaviour == "hang":
+            await asyncio.Event().wait()
+        self.sent.append(text)
+
+    async def close(self, code: int = 1000):
+        self.closed.append(code)
+
+def test_sockets_given_up_on_are_closed():
+    async def scenario():
+        manager = ConnectionManager(send_timeout=0.05)
+        healthy, failing, stuck = FakeSocket(), FakeSocket("fail"), FakeSocket("hang")
+        for websocket in (healthy, failing, stuck):
+            await manager.connect(websocket)
+        await manager.broadcast({"type": "alert"})
+        await asyncio.sleep(0.2)
+        remaining = list(manager.connections)
+        await manager.close()
+        return healthy, failing, stuck, remaining
+
+    healthy, failing, stuck, remaining = asyncio.run(scenario())
+    assert remaining == [healthy]
+    assert failing.closed == [1011]
+    assert stuck.closed == [1013]
+    assert healthy.sent and healthy.closed == [1001]
+
+def test_client_disconnect_is_not_closed_again():
+    async def scenario():
+        manager = ConnectionManager()
+        websocket = FakeSocket()
+        await manager.connect(websocket)
+        manager.disconnect(websocket)
+        await manager.close()
+        return websocket
+
+    assert asyncio.run(scenario()).closed == []
@@ -0,0 +1,73 @@
+import asyncio
+
+from route_cache import RouteCache
+
+from .harness import running_server
+
+# Without a routing graph a route is the straight line between its ends
+ROUTE = {"user_id": "u1", "start_lat": 40.7500, "start_lng": -73.9900, "end_lat": 40.7600, "end_lng": -73.9900, "mode": "wheelchair"}
+ON_ROUTE = {"latitude": 40.7550, "longitude": -73.9900}
+FAR_AWAY = {"latitude": 40.8000, "longitude": -73.9000}
+
+def barrier(point: dict, barrier_type: str = "stairs") -> dict:
+    return dict(point, user_id="u2", barrier_type=barrier_type, severity="high", description="Steps")
+
+def alert(point: dict) -> dict:
+    return dict(point, alert_type="hazard", message="Flooded", severity="high", radius=50)
+
+async def route(client) -> dict:
+    response = await client.post("/api/routes", json=ROUTE)
+    assert response.status_code == 200
+    return response.json()
+
+async def stats(client) -> dict:
+    return (await client.get("/api/routes/stats")).json()
+
+def test_barrier_on_the_route_drops_it_and_one_far_away_does_not():
+    async def scenario():
+        async with running_server() as (server, client):
+            start = (await stats(client))["misses"]
+            await route(client)
+            await route(client)
+            cached = (await stats(client))["misses"] - start
+            await client.post("/api/barriers", json=barrier(FAR_AWAY))
+            await route(client)
+            after_far = (await stats(client))["misses"] - start
+            created = (await client.post("/api/barriers", json=barrier(ON_ROUTE))).json()
+            rerouted = await route(client)
+            after_near = (await stats(client))["misses"] - start
+            return cached, after_far, after_near, created["id"], rerouted["barriers"]
+
+    cached, after_far, after_near, barrier_id, barriers = asyncio.run(scenario())
+    assert (cached, after_far, after_near) == (1, 1, 2)
+    assert barriers == [barrier_id]
+
+def test_alert_near_the_route_drops_it():
+    async def scenario():
+        async with running_server() as (server, client):
+            start = await stats(client)
+            await route(client)
+            await client.post("/api/alerts", json=alert(FAR_AWAY))
+            await route(client)
+            before = (await stats(client))["misses"] - start["misses"]
+            await client.post("/api/alerts", json=alert(ON_ROUTE))
+            await asyncio.sleep(0.05)
+            await route(client)
+            end = await stats(client)
+            return before, end["misses"] - start["misses"], end["invalidations"] - start["invalidations"]
+
+    before, after, invalidations = asyncio.run(scenario())
+    assert (before, after) == (1, 2)
+    assert invalidations == 1
+
+def test_box_invalidation_drops_only_routes_through_the_box():
+    cache = RouteCache(corridor=30.0)
+    inside = {"waypoints": [{"latitude": 40.70, "longitude": -74.00}, {"latitude": 40.72, "longitude": -74.00}]}
+    outside = {"waypoints": [{"latitude": 40.80, "longitude": -73.90}, {"latitude": 40.82, "longitude": -73.90}]}
+    cache.put("inside", inside)
+    cache.put("outside", outside)
+    assert cache.invalidate_box(40.705, -74.01, 40.71, -73.99) == 1
+    assert "inside" not in cache.entries and "outside" in cache.entries
+    # Wider than the occupied index cells: scanned through the cells instead of the box
+    assert cache.invalidate_box(-80.0, -170.0, 80.0, 170.0) == 1
+    assert len(cache) == 0 and not cache.cells
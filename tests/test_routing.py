@@ -0,0 +1,56 @@
+from benchmarks.bench_routing import grid_graph
+from routing import PedestrianGraph
+
+# A square A-B-C-D with a short stepped side A-C and a long ramp A-B-D-C around it
+OSM = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="40.7500" lon="-73.9900"/>
+  <node id="2" lat="40.7500" lon="-73.9880"/>
+  <node id="3" lat="40.7510" lon="-73.9900"/>
+  <node id="4" lat="40.7510" lon="-73.9880"/>
+  <way id="10"><nd ref="1"/><nd ref="3"/><tag k="highway" v="steps"/></way>
+  <way id="11"><nd ref="1"/><nd ref="2"/><nd ref="4"/><nd ref="3"/><tag k="highway" v="footway"/></way>
+  <way id="12"><nd ref="2"/><nd ref="4"/><tag k="highway" v="footway"/><tag k="access" v="private"/></way>
+</osm>
+"""
+
+def test_wheelchair_route_avoids_steps_that_others_take(tmp_path):
+    path = tmp_path / "square.osm"
+    path.write_text(OSM)
+    graph = PedestrianGraph.from_osm(str(path))
+    wheelchair = graph.route(40.7500, -73.9900, 40.7510, -73.9900, "wheelchair")
+    deaf = graph.route(40.7500, -73.9900, 40.7510, -73.9900, "deaf")
+    assert len(wheelchair["waypoints"]) == 6 and len(deaf["waypoints"]) == 4
+    assert deaf["distance"] < 120 < wheelchair["distance"]
+
+def test_snapping_cells_do_not_collide_across_rows():
+    # Column 106020 at -73.98 once spilled into the next row's column 6020 (-173.98)
+    assert PedestrianGraph._cell_id(40.0, -73.98) != PedestrianGraph._cell_id(40.001, -173.98)
+    graph = grid_graph(side=20, spacing=50.0)
+    for node in range(0, graph.node_count, 7):
+        assert graph.nearest_node(graph.node_lat[node] + 0.00005, graph.node_lng[node]) == node
+
+def test_high_barrier_pushes_the_route_to_a_parallel_street():
+    graph = grid_graph(side=20, spacing=50.0)
+    start, end = 5 * 20 + 2, 5 * 20 + 17  # both on row 5
+    args = (graph.node_lat[start], graph.node_lng[start], graph.node_lat[end], graph.node_lng[end], "wheelchair")
+    straight = graph.route(*args)
+    middle = 5 * 20 + 10
+    detour = graph.route(*args, barriers=[{"latitude": graph.node_lat[middle], "longitude": graph.node_lng[middle], "severity": "high"}])
+    on_row = {(point["latitude"], point["longitude"]) for point in detour["waypoints"]}
+    assert (graph.node_lat[middle], graph.node_lng[middle]) not in on_row
+    assert abs(straight["distance"] - 750) < 5
+    assert 750 < detour["distance"] < 900
+
+def test_city_scale_route_crosses_the_grid_along_a_shortest_path():
+    # A 14 km crossing of a 40k-node grid; its timing is measured by bench_routing
+    graph = grid_graph(side=200, spacing=50.0)
+    corner, opposite = 0, graph.node_count - 1
+    found = graph.route(graph.node_lat[corner], graph.node_lng[corner],
+                        graph.node_lat[opposite], graph.node_lng[opposite], "wheelchair")
+    assert found is not None and 19000 < found["distance"] < 20000
+    waypoints = found["waypoints"]
+    assert waypoints[1] == {"latitude": graph.node_lat[corner], "longitude": graph.node_lng[corner]}
+    assert waypoints[-2] == {"latitude": graph.node_lat[opposite], "longitude": graph.node_lng[opposite]}
+    # Every grid path between opposite corners takes 2 * 199 blocks; a shortest one has no detour
+    assert len(waypoints) == 2 * 199 + 1 + 2
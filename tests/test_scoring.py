@@ -0,0 +1,26 @@
+import random
+
+from scoring import SEVERITY_PENALTIES, route_accessibilities, route_accessibility, sanchara_score, sanchara_scores
+
+def test_batch_route_scores_equal_the_single_route_scores():
+    rng = random.Random(5)
+    severities = list(SEVERITY_PENALTIES) + ["unknown"]
+    routes = [[{"severity": rng.choice(severities)} for _ in range(rng.randrange(0, 12))] for _ in range(200)]
+    routes += [[], [{}], [{"severity": "high"}] * 10]
+    batch = route_accessibilities("wheelchair", routes)
+    assert len(batch) == len(routes)
+    assert [float(score) for score in batch] == [route_accessibility("wheelchair", barriers) for barriers in routes]
+
+def test_batch_route_scores_of_no_routes():
+    assert len(route_accessibilities("wheelchair", [])) == 0
+
+def test_batch_location_scores_equal_the_single_location_scores():
+    rng = random.Random(9)
+    locations = [
+        {
+            "has_ramp": rng.random() < 0.5, "has_elevator": rng.random() < 0.3, "has_stairs": rng.random() < 0.6,
+            "surface_type": rng.choice(["smooth", "rough", None]), "incline_level": rng.choice(["low", "high"]),
+        }
+        for _ in range(200)
+    ]
+    assert [float(score) for score in sanchara_scores(locations)] == [sanchara_score(loc) for loc in locations]
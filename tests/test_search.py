@@ -0,0 +1,43 @@
+import asyncio
+import json
+
+import llm
+
+from .harness import running_server
+
+QUERY = {"query": "Step-free cafe?", "user_mode": "wheelchair", "latitude": 40.7580, "longitude": -73.9855, "radius": 2000}
+
+class CountingBackend(llm.FakeBackend):
+    def __init__(self):
+        super().__init__(first_token_ms=50, token_ms=1)
+        self.streams = 0
+
+    async def stream(self, prompt: str):
+        self.streams += 1
+        async for chunk in super().stream(prompt):
+            yield chunk
+
+def tokens(response) -> list:
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert events[-1]["type"] == "done"
+    return [event["text"] for event in events if event["type"] == "token"]
+
+def test_identical_streamed_searches_share_one_llm_call(monkeypatch):
+    backend = CountingBackend()
+    monkeypatch.setattr(llm, "_backend", backend)
+
+    async def scenario():
+        async with running_server() as (server, client):
+            streams = [
+                client.post("/api/ai/search/stream", params={"format": "ndjson"}, json=QUERY) for _ in range(3)
+            ]
+            responses = await asyncio.gather(*streams, client.post("/api/ai/search", json=QUERY))
+            return responses, server.search_cache.stats()
+
+    responses, stats = asyncio.run(scenario())
+    *streamed, plain = responses
+    assert backend.streams == 1
+    assert stats["misses"] == 1 and stats["coalesced"] == 3
+    answer = plain.json()["response"]
+    assert sorted(len(tokens(response)) for response in streamed)[:2] == [1, 1]
+    assert all("".join(tokens(response)) == answer for response in streamed)
@@ -0,0 +1,84 @@
+import asyncio
+import json
+from datetime import datetime
+from typing import List, Optional
+
+import httpx
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+from serialization import RowEncoder
+
+CREATED = datetime(2024, 5, 1, 12, 30)
+
+class Reading(BaseModel):
+    id: str
+    level: Optional[float] = None
+    limit: float = 10.0
+    tags: List[str] = []
+
+def stored_location(**fields) -> dict:
+    """A document as Mongo holds it: _id and the GeoJSON point come back unless projected away"""
+    document = {"_id": "oid", "id": "l1", "name": "Library", "latitude": 40, "longitude": -73.5, "address": "1 Main St",
+                "created_at": CREATED, "location": {"type": "Point", "coordinates": [-73.5, 40]}}
+    document.update(fields)
+    return document
+
+def project(document: dict, projection: dict) -> dict:
+    return {name: value for name, value in document.items() if projection.get(name)}
+
+def canonical(rows: list) -> str:
+    """Parsed JSON back to text: 3 and 3.0 compare equal in Python but not here"""
+    return json.dumps(rows, sort_keys=True)
+
+def through_both(model, documents: List[dict]):
+    """(response_model JSON, RowEncoder JSON) for the same stored documents, parsed"""
+    rows = RowEncoder(model)
+    app = FastAPI()
+
+    @app.get("/model", response_model=List[model])
+    async def validated():
+        return [dict(document) for document in documents]
+
+    @app.get("/rows", response_model=List[model])
+    async def encoded():
+        return rows.response([project(document, rows.projection) for document in documents])
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return (await client.get("/model")).json(), (await client.get("/rows")).json()
+
+    return asyncio.run(scenario())
+
+def test_location_rows_match_the_response_model():
+    import server
+
+    documents = [
+        stored_location(),  # defaults for every unset field, integer latitude
+        stored_location(id="l2", sanchara_score=7, has_ramp=True, description="Side door", surface_type="smooth"),
+        stored_location(id="l3", description=None, legacy_rating=4),  # a field the model no longer has
+    ]
+    validated, encoded = through_both(server.Location, documents)
+    assert canonical(encoded) == canonical(validated)
+    assert [type(row["latitude"]) for row in encoded] == [float] * 3
+    assert encoded[0]["sanchara_score"] == 5.0 and encoded[1]["sanchara_score"] == 7.0
+    assert "location" not in encoded[0] and "legacy_rating" not in encoded[2]
+
+def test_barrier_and_alert_rows_match_the_response_model():
+    import server
+
+    barrier = {"id": "b1", "user_id": "u1", "latitude": 40.1, "longitude": -73, "barrier_type": "curb",
+               "severity": "high", "description": "High curb", "created_at": CREATED}
+    alert = {"id": "a1", "latitude": 40.1, "longitude": -73.2, "alert_type": "hazard", "message": "Flooded",
+             "severity": "low", "radius": 50, "created_at": CREATED, "expires_at": CREATED}
+    for model, document in ((server.Barrier, barrier), (server.Alert, alert)):
+        validated, encoded = through_both(model, [document])
+        assert canonical(encoded) == canonical(validated)
+
+def test_optional_float_and_mutable_defaults():
+    validated, encoded = through_both(Reading, [{"id": "r1", "level": 3}, {"id": "r2", "limit": 2}])
+    assert canonical(encoded) == canonical(validated) == canonical([
+        {"id": "r1", "level": 3.0, "limit": 10.0, "tags": []},
+        {"id": "r2", "level": None, "limit": 2.0, "tags": []},
+    ])
@@ -0,0 +1,33 @@
+import asyncio
+from datetime import datetime
+
+from benchmarks.bench_startup import measure_import
+from benchmarks.synthetic_city import generate_city
+from database import INDEXES
+
+from .harness import running_server
+
+# Import time and time to first request are budgeted by benchmarks/bench_startup.py, not here
+
+def test_server_import_loads_no_heavy_modules():
+    report = measure_import(runs=1)
+    assert report["heavy_modules_loaded"] == []
+
+def test_startup_ensures_indexes_warms_up_and_reports_ready():
+    city = generate_city(locations=200, barriers=20, alerts=20, districts=3, users=10)
+
+    async def scenario():
+        async with running_server(city) as (server, client):
+            ready = await client.get("/api/health/ready")
+            indexes = {name: await server.db[name].index_information() for name in INDEXES}
+            return ready, indexes, server.heatmap.builds, server.app_ready
+
+    ready, indexes, builds, app_ready = asyncio.run(scenario())
+    assert ready.status_code == 200 and app_ready
+    body = ready.json()
+    assert body["ready"] and body["heatmap"] and body["index_failures"] == []
+    for collection, models in INDEXES.items():
+        assert {model.document["name"] for model in models} <= set(indexes[collection])
+    now = datetime.utcnow()
+    assert body["active_alerts"] == sum(alert["expires_at"] > now for alert in city.alerts)
+    assert builds >= 1
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+import write_behind
+from metrics import Registry
+from write_behind import WriteBehind
+
+class Collection:
+    """insert_many that records batches, can be held shut, and fails its first `failures` calls"""
+
+    def __init__(self, failures: int = 0):
+        self.name = "routes"
+        self.batches = []
+        self.calls = 0
+        self.failures = failures
+        self.open = asyncio.Event()
+        self.open.set()
+
+    async def insert_many(self, documents, ordered=True):
+        self.calls += 1
+        await self.open.wait()
+        if self.calls <= self.failures:
+            raise AutoReconnect("primary stepped down")
+        self.batches.append([document["n"] for document in documents])
+
+@pytest.fixture(autouse=True)
+def own_queue_list(monkeypatch):
+    # Keeps these queues out of the server's write_behind_queue_depth gauge
+    monkeypatch.setattr(WriteBehind, "queues", [])
+
+def queue(collection: Collection, **kwargs) -> WriteBehind:
+    return WriteBehind(collection, registry=Registry(), **kwargs)
+
+def test_close_writes_what_is_still_queued():
+    async def scenario():
+        collection = Collection()
+        routes = queue(collection, batch_size=100, flush_interval=60.0)
+        for n in range(5):
+            await routes.put({"n": n})
+        queued = len(routes)
+        await routes.close()
+        return queued, collection.batches, routes.stats()
+
+    queued, batches, stats = asyncio.run(scenario())
+    # Nowhere near a full batch or the flush interval: only close() writes them
+    assert queued == 5
+    assert batches == [[0, 1, 2, 3, 4]]
+    assert stats == {"pending": 0, "written": 5, "dropped": 0, "waits": 0}
+
+def test_full_queue_makes_put_wait_for_a_flush():
+    async def scenario():
+        collection = Collection()
+        collection.open.clear()
+        routes = queue(collection, batch_size=2, flush_interval=60.0, max_pending=3)
+        for n in range(2):
+            await routes.put({"n": n})
+        await asyncio.sleep(0.01)  # the flusher takes that batch and is stuck writing it
+        for n in range(2, 5):
+            await routes.put({"n": n})
+        blocked = asyncio.create_task(routes.put({"n": 5}))
+        await asyncio.sleep(0.05)
+        waiting = not blocked.done()
+        collection.open.set()
+        await asyncio.wait_for(blocked, 1.0)
+        await routes.close()
+        return waiting, collection.batches, routes.stats()
+
+    waiting, batches, stats = asyncio.run(scenario())
+    assert waiting
+    assert [n for batch in batches for n in batch] == list(range(6))
+    assert stats["waits"] == 1 and stats["written"] == 6
+
+def test_failed_batch_is_retried_then_dropped_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(write_behind, "RETRY_DELAY", 0.001)
+
+    async def scenario():
+        recovering = Collection(failures=write_behind.MAX_ATTEMPTS - 1)
+        retried = queue(recovering, batch_size=2)
+        await retried.put({"n": 0})
+        await retried.put({"n": 1})
+        await retried.close()
+        down = Collection(failures=write_behind.MAX_ATTEMPTS)
+        lost = queue(down, batch_size=2)
+        await lost.put({"n": 0})
+        await lost.close()
+        return (recovering.calls, recovering.batches, retried.stats()), (down.calls, down.batches, lost.stats())
+
+    (calls, batches, stats), (down_calls, down_batches, down_stats) = asyncio.run(scenario())
+    assert calls == write_behind.MAX_ATTEMPTS and batches == [[0, 1]]
+    assert stats["written"] == 2 and stats["dropped"] == 0
+    assert down_calls == write_behind.MAX_ATTEMPTS and down_batches == []
+    assert down_stats["written"] == 0 and down_stats["dropped"] == 1